@@ -5,10 +5,11 @@ A lightweight MCP server that provides tools to query Elasticsearch for eCommerc
 """
 
 import asyncio
+import importlib.util
 import json
 import os
 import sys
-from typing import Any, Dict, List, Optional, Sequence
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from urllib.parse import urlparse
 
 import httpx
@@ -28,10 +29,19 @@ from mcp.types import (
 from dotenv import load_dotenv
 load_dotenv()
 
+# Per-stage latency metrics are shared with the search apps at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from metrics import RequestTimer, start_metrics_server
+from product_cards import ProductCardStore
+from result_mapper import dumps
+from search_cache import SearchResultCache
+
 # Elasticsearch configuration from environment variables
 ES_URL = os.getenv("ES_URL")
 ES_API_KEY = os.getenv("ES_API_KEY")
 RERANK_INFERENCE_ID = os.getenv("RERANK_INFERENCE_ID", ".rerank-v1-elasticsearch")
+# Serve Prometheus-style /metrics on this port when set (stdout is reserved for the MCP protocol)
+MCP_METRICS_PORT = os.getenv("MCP_METRICS_PORT")
 
 if not ES_URL or not ES_API_KEY:
     print("Error: ES_URL and ES_API_KEY environment variables must be set", file=sys.stderr)
@@ -40,7 +50,68 @@ if not ES_URL or not ES_API_KEY:
 # Parse Elasticsearch URL
 parsed_url = urlparse(ES_URL)
 ES_HOST = f"{parsed_url.scheme}://{parsed_url.netloc}"
-ES_INDEX = "ecommerce_shein_products"
+# Index or alias to query (reindex.py serves the names in index.names as aliases)
+ES_INDEX = os.getenv("INDEX_NAME", "ecommerce_shein_products")
+
+# Columns returned for each product
+PRODUCT_FIELDS = ["product_id", "product_name", "description", "in_stock", "initial_price", "final_price",
+                  "related_products", "main_image"]
+
+# Top matches the reranker scores per query (more: better ranking, but more inference work), and the
+# rows returned unless the tool call asks for fewer or more (limit), up to the rerank window
+RERANK_WINDOW_SIZE = int(os.getenv("RERANK_WINDOW_SIZE", "20"))
+DEFAULT_LIMIT = int(os.getenv("MCP_RESULT_LIMIT", "10"))
+
+if DEFAULT_LIMIT > RERANK_WINDOW_SIZE:
+    print(f"Warning: MCP_RESULT_LIMIT {DEFAULT_LIMIT} is above RERANK_WINDOW_SIZE; using {RERANK_WINDOW_SIZE}",
+          file=sys.stderr)
+    DEFAULT_LIMIT = RERANK_WINDOW_SIZE
+
+# Tool output: json (every column, indented), columnar (ES|QL's columns/values layout, compact) or
+# truncated (one compact object per product with long strings and lists cut short)
+OUTPUT_FORMATS = ["json", "columnar", "truncated"]
+MCP_OUTPUT_FORMAT = os.getenv("MCP_OUTPUT_FORMAT", "truncated")
+MCP_MAX_FIELD_CHARS = int(os.getenv("MCP_MAX_FIELD_CHARS", "200"))
+MCP_MAX_LIST_ITEMS = int(os.getenv("MCP_MAX_LIST_ITEMS", "3"))
+
+if MCP_OUTPUT_FORMAT not in OUTPUT_FORMATS:
+    print(f"Warning: unknown MCP_OUTPUT_FORMAT {MCP_OUTPUT_FORMAT!r}; using truncated", file=sys.stderr)
+    MCP_OUTPUT_FORMAT = "truncated"
+
+# ES|QL results by query text, in memory for MCP_CACHE_TTL seconds (MCP_CACHE_SIZE=0 disables it)
+result_cache = SearchResultCache(
+    max_entries=int(os.getenv("MCP_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("MCP_CACHE_TTL", "300"))
+)
+
+# Shared product-card store (see ../product_cards.py): with PRODUCT_CARD_STORE=true the ES|QL query only
+# keeps _score and product_id and the other columns are hydrated from the store
+card_store = None
+if os.getenv("PRODUCT_CARD_STORE", "false").lower() == "true":
+    card_store = ProductCardStore(
+        ES_INDEX,
+        fields=PRODUCT_FIELDS,
+        max_entries=int(os.getenv("PRODUCT_CARD_STORE_SIZE", "50000")),
+        ttl=float(os.getenv("PRODUCT_CARD_STORE_TTL", "3600")),
+        cache_dir=os.getenv("PRODUCT_CARD_STORE_DIR") or None,
+        watermark_field=os.getenv("PRODUCT_CARD_WATERMARK_FIELD", "timestamp")
+    )
+PRODUCT_CARD_POLL_INTERVAL = float(os.getenv("PRODUCT_CARD_POLL_INTERVAL", "30"))
+
+# Pooled HTTP client shared by every tool call (see get_http_client)
+ES_HTTP2 = os.getenv("ES_HTTP2", "false").lower() == "true"
+ES_MAX_CONNECTIONS = int(os.getenv("ES_MAX_CONNECTIONS", "20"))
+ES_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("ES_MAX_KEEPALIVE_CONNECTIONS", "10"))
+ES_KEEPALIVE_EXPIRY = float(os.getenv("ES_KEEPALIVE_EXPIRY", "30"))
+ES_REQUEST_TIMEOUT = float(os.getenv("ES_REQUEST_TIMEOUT", "30"))
+
+# query_elasticsearch_products_batch: queries per call, and how many of them run at once
+MCP_BATCH_MAX_QUERIES = int(os.getenv("MCP_BATCH_MAX_QUERIES", "10"))
+MCP_BATCH_CONCURRENCY = int(os.getenv("MCP_BATCH_CONCURRENCY", "4"))
+
+if ES_HTTP2 and importlib.util.find_spec("h2") is None:
+    print("Warning: ES_HTTP2 needs the h2 package (pip install 'httpx[http2]'); using HTTP/1.1", file=sys.stderr)
+    ES_HTTP2 = False
 
 # Create MCP server instance
 server = Server("elasticsearch-ecommerce-server")
@@ -52,17 +123,72 @@ async def handle_list_tools() -> ListToolsResult:
         tools=[
             Tool(
                 name="query_elasticsearch_products",
-                description="Query Elasticsearch ecommerce_shein_products index to fetch products based on search terms",
+                description=f"Query Elasticsearch {ES_INDEX} index to fetch products based on search terms",
                 inputSchema={
                     "type": "object",
                     "properties": {
                         "query": {
                             "type": "string",
                             "description": "The search query to find products (e.g., 'dog bed', 'wireless headphones')"
+                        },
+                        "fields": {
+                            "type": "array",
+                            "items": {"type": "string", "enum": PRODUCT_FIELDS},
+                            "description": "Product fields to return (default: all); _score is always included"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "minimum": 1,
+                            "maximum": RERANK_WINDOW_SIZE,
+                            "description": f"Products to return per query (default {DEFAULT_LIMIT})"
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": OUTPUT_FORMATS,
+                            "description": "json: full values; columnar: column names once, then one array per "
+                                           "product; truncated: long values cut short "
+                                           f"(default {MCP_OUTPUT_FORMAT})"
                         }
                     },
                     "required": ["query"]
                 }
+            ),
+            Tool(
+                name="query_elasticsearch_products_batch",
+                description="Run several product searches in one call (e.g. to compare products) and get "
+                            "the results of each as compact JSON",
+                inputSchema={
+                    "type": "object",
+                    "properties": {
+                        "queries": {
+                            "type": "array",
+                            "items": {"type": "string"},
+                            "minItems": 1,
+                            "maxItems": MCP_BATCH_MAX_QUERIES,
+                            "description": "The search queries, one per product to find "
+                                           "(e.g., ['dog bed', 'cat tree'])"
+                        },
+                        "fields": {
+                            "type": "array",
+                            "items": {"type": "string", "enum": PRODUCT_FIELDS},
+                            "description": "Product fields to return (default: all); _score is always included"
+                        },
+                        "limit": {
+                            "type": "integer",
+                            "minimum": 1,
+                            "maximum": RERANK_WINDOW_SIZE,
+                            "description": f"Products to return per query (default {DEFAULT_LIMIT})"
+                        },
+                        "format": {
+                            "type": "string",
+                            "enum": OUTPUT_FORMATS,
+                            "description": "json: full values; columnar: column names once, then one array per "
+                                           "product; truncated: long values cut short "
+                                           f"(default {MCP_OUTPUT_FORMAT})"
+                        }
+                    },
+                    "required": ["queries"]
+                }
             )
         ]
     )
@@ -71,126 +197,346 @@ async def handle_list_tools() -> ListToolsResult:
 async def handle_call_tool(name: str, arguments: Dict[str, Any]) -> CallToolResult:
     """Handle tool calls."""
     if name == "query_elasticsearch_products":
-        return await query_elasticsearch_products(arguments.get("query", ""))
+        return await query_elasticsearch_products(arguments.get("query", ""), arguments.get("fields"),
+                                                  arguments.get("limit"), arguments.get("format"))
+    elif name == "query_elasticsearch_products_batch":
+        return await query_elasticsearch_products_batch(arguments.get("queries", []), arguments.get("fields"),
+                                                        arguments.get("limit"), arguments.get("format"))
     else:
         raise ValueError(f"Unknown tool: {name}")
 
-async def query_elasticsearch_products(query: str) -> CallToolResult:
+_http_client: Optional[httpx.AsyncClient] = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """
+    Return the server's pooled Elasticsearch client, creating it on first use.
+    
+    Connections are kept alive between tool calls, so only the first call (and the first after
+    ES_KEEPALIVE_EXPIRY seconds idle) pays for TCP and TLS setup. With ES_HTTP2=true concurrent
+    calls are multiplexed over one connection.
+    """
+    global _http_client
+    if _http_client is None or _http_client.is_closed:
+        _http_client = httpx.AsyncClient(
+            base_url=ES_HOST,
+            headers={"Authorization": f"ApiKey {ES_API_KEY}", "Content-Type": "application/json"},
+            timeout=ES_REQUEST_TIMEOUT,
+            http2=ES_HTTP2,
+            limits=httpx.Limits(
+                max_connections=ES_MAX_CONNECTIONS,
+                max_keepalive_connections=ES_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=ES_KEEPALIVE_EXPIRY
+            )
+        )
+    return _http_client
+
+async def close_http_client():
+    """Close the pooled client and its connections"""
+    global _http_client
+    if _http_client is not None:
+        await _http_client.aclose()
+        _http_client = None
+
+async def search_index(client: httpx.AsyncClient, body: Dict[str, Any]) -> Dict[str, Any]:
+    """Run a _search request against ES_INDEX"""
+    response = await client.post(f"/{ES_INDEX}/_search", json=body)
+    response.raise_for_status()
+    return response.json()
+
+async def hydrate_products(client: httpx.AsyncClient, columns: List[str], values: List[List[Any]],
+                           fields: List[str]) -> List[List[Any]]:
+    """Fill in fields for (_score, product_id) rows from the card store, fetching missing cards"""
+    score_index, id_index = columns.index("_score"), columns.index("product_id")
+    product_ids = [row[id_index] for row in values]
+    found, missing = card_store.get_many(product_ids)
+    if missing:
+        result = await search_index(client, card_store.cards_query(missing))
+        found.update(card_store.put_hits(result["hits"]["hits"]))
+    
+    rows = []
+    for row in values:
+        entry = found.get(row[id_index])
+        source = entry[1] if entry is not None else {"product_id": row[id_index]}
+        rows.append([row[score_index], *(source.get(field) for field in fields)])
+    return rows
+
+async def poll_product_changes():
+    """Invalidate the cards of changed products every PRODUCT_CARD_POLL_INTERVAL seconds"""
+    while True:
+        try:
+            card_store.apply_poll(await search_index(get_http_client(), card_store.poll_body()))
+        except Exception as e:
+            print(f"Warning: could not poll product card changes: {e}", file=sys.stderr)
+        await asyncio.sleep(PRODUCT_CARD_POLL_INTERVAL)
+
+class ProductQueryError(Exception):
+    """Elasticsearch answered a product query with an error status or an unexpected body"""
+
+def build_product_query(query: str, fields: List[str] = PRODUCT_FIELDS, limit: Optional[int] = None,
+                        window: Optional[int] = None) -> Dict[str, Any]:
+    """
+    ES|QL request for the top `limit` products matching query, keeping only `fields`.
+    
+    The query text is passed as the ?query parameter, both to MATCH and to RERANK, so quotes in
+    it need no escaping and the ES|QL text is the same for every query. The top `window` matches
+    (default RERANK_WINDOW_SIZE) by MATCH score are reranked; RERANK writes its score to _score, so the
+    products come back in reranked order with the rerank score.
+    """
+    keep_columns = ", ".join(["_score", "product_id"] if card_store is not None
+                             else ["_score", *fields])
+    esql_query = f"""
+    FROM {ES_INDEX} METADATA _score
+    | WHERE MATCH(description_semantic_google, ?query) OR MATCH(description, ?query)
+    | SORT _score DESC
+    | LIMIT {window or RERANK_WINDOW_SIZE}
+    | RERANK _score = ?query ON description WITH {{ "inference_id" : "{RERANK_INFERENCE_ID}" }}
+    | SORT _score DESC
+    | LIMIT {limit or DEFAULT_LIMIT}
+    | KEEP {keep_columns}
+    """
+    return {"query": esql_query.strip(), "params": [{"query": query}]}
+
+def parse_output_options(fields: Any, limit: Any, output_format: Any) -> Tuple[List[str], int, str]:
+    """
+    Validate the fields, limit and format tool arguments, filling in the defaults.
+    
+    Raises:
+        ValueError: An argument is not one the tool accepts
+    """
+    if fields is None:
+        fields = PRODUCT_FIELDS
+    elif not isinstance(fields, list) or not fields or not all(field in PRODUCT_FIELDS for field in fields):
+        raise ValueError(f"fields must be a non-empty list of {', '.join(PRODUCT_FIELDS)}")
+    else:
+        fields = list(dict.fromkeys(fields))
+    
+    if limit is None:
+        limit = DEFAULT_LIMIT
+    elif isinstance(limit, bool) or not isinstance(limit, int) or not 1 <= limit <= RERANK_WINDOW_SIZE:
+        raise ValueError(f"limit must be an integer from 1 to {RERANK_WINDOW_SIZE}")
+    
+    if output_format is None:
+        output_format = MCP_OUTPUT_FORMAT
+    elif output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"format must be one of {', '.join(OUTPUT_FORMATS)}")
+    return fields, limit, output_format
+
+async def search_products(client: httpx.AsyncClient, request_body: Dict[str, Any], fields: List[str],
+                          timer: RequestTimer) -> Tuple[List[str], List[List[Any]]]:
+    """
+    Run a product ES|QL request, or take its result from result_cache.
+    
+    Returns:
+        The column names (_score and fields) and one list of values per product
+    
+    Raises:
+        ProductQueryError: Elasticsearch answered with an error status or without values
+    """
+    cache_key = json.dumps(request_body, sort_keys=True)
+    cached = result_cache.get(cache_key)
+    if cached is not None:
+        columns, values = cached["columns"], cached["values"]
+    else:
+        with timer.stage("es"):
+            response = await client.post("/_query", json=request_body)
+        if response.status_code != 200:
+            raise ProductQueryError(f"Elasticsearch request failed with status {response.status_code}: {response.text}")
+        
+        with timer.stage("es"):
+            result = response.json()
+        timer.took(result)
+        if "values" not in result:
+            raise ProductQueryError(f"Unexpected response format: {json.dumps(result, indent=2)}")
+        columns = [column["name"] for column in result.get("columns", [])]
+        values = result["values"]
+        result_cache.set(cache_key, {"columns": columns, "values": values})
+    
+    if card_store is not None and values:
+        with timer.stage("map"):
+            values = await hydrate_products(client, columns, values, fields)
+        columns = ["_score", *fields]
+    return columns, values
+
+def truncate_value(value: Any) -> Any:
+    """Cut strings to MCP_MAX_FIELD_CHARS and lists to MCP_MAX_LIST_ITEMS items"""
+    if isinstance(value, str) and len(value) > MCP_MAX_FIELD_CHARS:
+        return value[:MCP_MAX_FIELD_CHARS] + "..."
+    if isinstance(value, list):
+        items = [truncate_value(item) for item in value[:MCP_MAX_LIST_ITEMS]]
+        if len(value) > MCP_MAX_LIST_ITEMS:
+            items.append(f"... {len(value) - MCP_MAX_LIST_ITEMS} more")
+        return items
+    return value
+
+def format_products(columns: List[str], values: List[List[Any]], output_format: str) -> Any:
+    """Lay out product rows for the tool output; columnar passes the rows through without building dicts"""
+    if output_format == "columnar":
+        return {"columns": columns, "values": values}
+    if output_format == "truncated":
+        return [{column: truncate_value(value) for column, value in zip(columns, row)} for row in values]
+    return [dict(zip(columns, row)) for row in values]
+
+async def query_elasticsearch_products(query: str, fields: Optional[List[str]] = None, limit: Optional[int] = None,
+                                       output_format: Optional[str] = None) -> CallToolResult:
     """
     Query Elasticsearch for products using the specified query structure.
     
     Args:
         query: The search term to find products
+        fields: Product fields to return (default PRODUCT_FIELDS)
+        limit: Products to return (default DEFAULT_LIMIT)
+        output_format: One of OUTPUT_FORMATS (default MCP_OUTPUT_FORMAT)
         
     Returns:
         CallToolResult with the search results
     """
+    timer = RequestTimer("query_elasticsearch_products", "esql", rerank=True)
     if not query:
         return CallToolResult(
             content=[TextContent(type="text", text="Error: Query parameter is required")]
         )
+    try:
+        fields, limit, output_format = parse_output_options(fields, limit, output_format)
+    except ValueError as e:
+        return CallToolResult(
+            content=[TextContent(type="text", text=f"Error: {e}")]
+        )
     
     try:
-        # Construct the Elasticsearch query using ES|QL
-        esql_query = f"""
-        FROM {ES_INDEX} METADATA _score
-        | WHERE MATCH(description_semantic_google, "{query}") OR MATCH(description, "{query}")
-        | LIMIT 20
-        | RERANK rerank_score = "hobbit" ON description WITH {{ "inference_id" : "{RERANK_INFERENCE_ID}" }}
-        | LIMIT 10
-        | KEEP _score, product_id, product_name, description, in_stock, initial_price, final_price, related_products, main_image
-        """
-        
-        # Prepare the request
-        headers = {
-            "Authorization": f"ApiKey {ES_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        with timer.stage("build"):
+            # Construct the Elasticsearch query using ES|QL
+            request_body = build_product_query(query, fields, limit)
         
-        payload = {
-            "query": esql_query.strip()
-        }
+        # Make the request to Elasticsearch over the pooled client
+        columns, values = await search_products(get_http_client(), request_body, fields, timer)
         
-        # Make the request to Elasticsearch
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(
-                f"{ES_HOST}/_query",
-                headers=headers,
-                json=payload
+        # Format the response
+        if values:
+            with timer.stage("serialize"):
+                products = format_products(columns, values, output_format)
+                formatted_results = json.dumps(products, indent=2) if output_format == "json" else dumps(products)
+            timer.finish(request_body)
+            return CallToolResult(
+                content=[
+                    TextContent(
+                        type="text", 
+                        text=f"Found {len(values)} products for query '{query}':\n\n{formatted_results}"
+                    )
+                ]
             )
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Format the results
-                if "values" in result:
-                    products = []
-                    columns = result.get("columns", [])
-                    
-                    for row in result["values"]:
-                        product = {}
-                        for i, column in enumerate(columns):
-                            if i < len(row):
-                                product[column["name"]] = row[i]
-                        products.append(product)
-                    
-                    # Format the response
-                    if products:
-                        formatted_results = json.dumps(products, indent=2)
-                        return CallToolResult(
-                            content=[
-                                TextContent(
-                                    type="text", 
-                                    text=f"Found {len(products)} products for query '{query}':\n\n{formatted_results}"
-                                )
-                            ]
-                        )
-                    else:
-                        return CallToolResult(
-                            content=[
-                                TextContent(
-                                    type="text", 
-                                    text=f"No products found for query '{query}'"
-                                )
-                            ]
-                        )
-                else:
-                    return CallToolResult(
-                        content=[
-                            TextContent(
-                                type="text", 
-                                text=f"Unexpected response format: {json.dumps(result, indent=2)}"
-                            )
-                        ]
+        else:
+            timer.finish(request_body)
+            return CallToolResult(
+                content=[
+                    TextContent(
+                        type="text", 
+                        text=f"No products found for query '{query}'"
                     )
-            else:
-                error_text = f"Elasticsearch request failed with status {response.status_code}: {response.text}"
-                return CallToolResult(
-                    content=[TextContent(type="text", text=error_text)]
-                )
-                
+                ]
+            )
+    
+    except ProductQueryError as e:
+        return CallToolResult(
+            content=[TextContent(type="text", text=str(e))]
+        )
     except Exception as e:
         error_text = f"Error querying Elasticsearch: {str(e)}"
         return CallToolResult(
             content=[TextContent(type="text", text=error_text)]
         )
 
+async def query_elasticsearch_products_batch(queries: List[str], fields: Optional[List[str]] = None,
+                                             limit: Optional[int] = None,
+                                             output_format: Optional[str] = None) -> CallToolResult:
+    """
+    Run several product queries concurrently and return all their results at once.
+    
+    At most MCP_BATCH_CONCURRENCY queries are sent at a time over the pooled client;
+    a repeated query is only run once. A failing query is reported in its own result
+    and does not fail the others.
+    
+    Args:
+        queries: The search terms, at most MCP_BATCH_MAX_QUERIES
+        fields: Product fields to return (default PRODUCT_FIELDS)
+        limit: Products to return per query (default DEFAULT_LIMIT)
+        output_format: One of OUTPUT_FORMATS (default MCP_OUTPUT_FORMAT)
+        
+    Returns:
+        CallToolResult with one compact JSON object per query, in the given order
+    """
+    if not isinstance(queries, list) or not queries or not all(isinstance(query, str) and query for query in queries):
+        return CallToolResult(
+            content=[TextContent(type="text", text="Error: queries must be a non-empty list of search terms")]
+        )
+    if len(queries) > MCP_BATCH_MAX_QUERIES:
+        return CallToolResult(
+            content=[TextContent(type="text",
+                                 text=f"Error: at most {MCP_BATCH_MAX_QUERIES} queries per call, got {len(queries)}")]
+        )
+    try:
+        fields, limit, output_format = parse_output_options(fields, limit, output_format)
+    except ValueError as e:
+        return CallToolResult(
+            content=[TextContent(type="text", text=f"Error: {e}")]
+        )
+    
+    client = get_http_client()
+    semaphore = asyncio.BoundedSemaphore(MCP_BATCH_CONCURRENCY)
+    
+    async def run(query: str) -> Dict[str, Any]:
+        async with semaphore:
+            timer = RequestTimer("query_elasticsearch_products_batch", "esql", rerank=True)
+            try:
+                with timer.stage("build"):
+                    request_body = build_product_query(query, fields, limit)
+                columns, values = await search_products(client, request_body, fields, timer)
+            except ProductQueryError as e:
+                return {"query": query, "error": str(e)}
+            except Exception as e:
+                return {"query": query, "error": f"Error querying Elasticsearch: {str(e)}"}
+            with timer.stage("serialize"):
+                products = format_products(columns, values, output_format)
+            timer.finish(request_body)
+            return {"query": query, "count": len(values), "products": products}
+    
+    unique_queries = list(dict.fromkeys(queries))
+    results = dict(zip(unique_queries, await asyncio.gather(*(run(query) for query in unique_queries))))
+    formatted_results = dumps([results[query] for query in queries])
+    return CallToolResult(
+        content=[
+            TextContent(
+                type="text",
+                text=f"Results for {len(queries)} queries:\n\n{formatted_results}"
+            )
+        ]
+    )
+
 async def main():
     """Main entry point for the MCP server."""
-    # Run the server using stdio transport
-    async with stdio_server() as (read_stream, write_stream):
-        await server.run(
-            read_stream,
-            write_stream,
-            InitializationOptions(
-                server_name="elasticsearch-ecommerce-server",
-                server_version="1.0.0",
-                capabilities=server.get_capabilities(
-                    notification_options=None,
-                    experimental_capabilities={}
+    if MCP_METRICS_PORT:
+        start_metrics_server(int(MCP_METRICS_PORT))
+    # Keep a reference so the poller is not garbage-collected while the server runs
+    poll_task = asyncio.create_task(poll_product_changes()) if card_store is not None else None
+    
+    try:
+        # Run the server using stdio transport
+        async with stdio_server() as (read_stream, write_stream):
+            await server.run(
+                read_stream,
+                write_stream,
+                InitializationOptions(
+                    server_name="elasticsearch-ecommerce-server",
+                    server_version="1.0.0",
+                    capabilities=server.get_capabilities(
+                        notification_options=None,
+                        experimental_capabilities={}
+                    )
                 )
             )
-        )
+    finally:
+        if poll_task is not None:
+            poll_task.cancel()
+        await close_http_client()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -1,9 +1,21 @@
 import os
 import json
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
-import time
+from metrics import PROMETHEUS_MIMETYPE, RequestTimer, render_metrics
+from hybrid_query import (generate_hybrid_query, generate_standard_query, plan_weights, query_plan, render_hybrid_query,
+                          query_template_cache_info)
+from query_embeddings import QueryEmbeddingCache, semantic_field_inference_ids
+from fusion import FUSION_METHODS, FusionEngine
+from suggest import SuggestionIndex, suggest_query, suggestions_from_hits
+from search_cache import SearchResultCache, make_cache_key
+from recommendations import RecommendationEngine
+from product_cards import ProductCardStore, hit_product_id
+from pagination import close_pit, decode_cursor, encode_cursor, iter_pages, page_body
+from result_mapper import PRODUCT_CARD_FIELDS, FastJSONMixin, map_hit, map_hits
+from streaming import NDJSON_MIMETYPE, ndjson_stream, wants_ndjson, wants_query_echo
 
 # Load environment variables from variables.env
 # Handle both export format and key=value format
@@ -44,7 +56,11 @@ def load_env_variables():
 # Load environment variables
 load_env_variables()
 
+class JSONProvider(FastJSONMixin, DefaultJSONProvider):
+    pass
+
 app = Flask(__name__)
+app.json = JSONProvider(app)
 
 # Elasticsearch configuration
 ES_URL = os.getenv('ES_URL')
@@ -56,13 +72,47 @@ RERANK_INFERENCE_ID = os.getenv('RERANK_INFERENCE_ID', '.rerank-v1-elasticsearch
 INDEX_NAME = os.getenv('INDEX_NAME', 'ecommerce_shein_products')
 RECOMMENDATION_ENGINE_INDEX_NAME = os.getenv('RECOMMENDATION_ENGINE_INDEX_NAME', 'ecommerce_shein_recommendations')
 
+def create_es_client():
+    """Elasticsearch client for this process (serve.py creates one per worker after fork)"""
+    return Elasticsearch(
+        ES_URL,
+        api_key=ES_API_KEY,
+        verify_certs=False
+    )
+
 # Initialize Elasticsearch client
-es = Elasticsearch(
-    ES_URL,
-    api_key=ES_API_KEY,
-    verify_certs=False
+es = create_es_client()
+
+def get_index_version():
+    """Return a marker that changes whenever documents in INDEX_NAME are indexed, deleted or refreshed"""
+    stats = es.indices.stats(index=INDEX_NAME, metric='indexing,refresh')
+    primaries = stats['_all']['primaries']
+    return '{}:{}:{}'.format(
+        primaries['indexing']['index_total'],
+        primaries['indexing']['delete_total'],
+        primaries['refresh']['external_total']
+    )
+
+# Result cache for /search (set SEARCH_CACHE_SIZE=0 to disable)
+search_cache = SearchResultCache(
+    max_entries=int(os.getenv('SEARCH_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('SEARCH_CACHE_TTL', '300')),
+    cache_dir=os.getenv('SEARCH_CACHE_DIR') or None,
+    version_fn=get_index_version,
+    version_check_interval=float(os.getenv('SEARCH_CACHE_VERSION_CHECK_INTERVAL', '5'))
 )
 
+# /search/batch limits: items per request, items per _msearch call and
+# searches ES runs concurrently for one _msearch call
+SEARCH_BATCH_MAX_ITEMS = int(os.getenv('SEARCH_BATCH_MAX_ITEMS', '100'))
+SEARCH_BATCH_CHUNK_SIZE = int(os.getenv('SEARCH_BATCH_CHUNK_SIZE', str(SEARCH_BATCH_MAX_ITEMS)))
+SEARCH_BATCH_MAX_CONCURRENT = int(os.getenv('SEARCH_BATCH_MAX_CONCURRENT', '8'))
+
+# Cursor pagination and export (point in time + search_after)
+SEARCH_PAGE_MAX_SIZE = int(os.getenv('SEARCH_PAGE_MAX_SIZE', '100'))
+SEARCH_PIT_KEEP_ALIVE = os.getenv('SEARCH_PIT_KEEP_ALIVE', '2m')
+EXPORT_PAGE_SIZE = int(os.getenv('EXPORT_PAGE_SIZE', '1000'))
+
 # Default weights for the hybrid query
 DEFAULT_WEIGHTS = {
     'description_semantic_elser': 2,
@@ -85,6 +135,265 @@ TEXT_FIELDS = [
     'top_reviews'
 ]
 
+# Precompute query vectors in the app instead of on every semantic match (set QUERY_EMBEDDINGS=true)
+query_embeddings = None
+if os.getenv('QUERY_EMBEDDINGS', 'false').lower() == 'true':
+    query_embeddings = QueryEmbeddingCache(
+        semantic_field_inference_ids({
+            'ELSER_INFERENCE_ID': ELSER_INFERENCE_ID,
+            'EMBEDDING_INFERENCE_ID': EMBEDDING_INFERENCE_ID,
+            'E5_INFERENCE_ID': E5_INFERENCE_ID
+        }),
+        max_entries=int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '4096')),
+        ttl=float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', '86400'))
+    )
+
+def query_vectors_for(query_text, weights):
+    """Return {semantic field: cached query vector}, or None when QUERY_EMBEDDINGS is off
+
+    Identifier-shaped queries run no semantic clauses, so they are not embedded.
+    """
+    if query_embeddings is None:
+        return None
+    return query_embeddings.vectors_for(es, query_text, plan_weights(weights, query_plan(query_text)))
+
+# Shared product-card store: searches return only IDs and scores and cards are hydrated locally
+# (set PRODUCT_CARD_STORE=true; needs a keyword product_id field)
+card_store = None
+if os.getenv('PRODUCT_CARD_STORE', 'false').lower() == 'true':
+    card_store = ProductCardStore(
+        INDEX_NAME,
+        max_entries=int(os.getenv('PRODUCT_CARD_STORE_SIZE', '50000')),
+        ttl=float(os.getenv('PRODUCT_CARD_STORE_TTL', '3600')),
+        cache_dir=os.getenv('PRODUCT_CARD_STORE_DIR') or None,
+        watermark_field=os.getenv('PRODUCT_CARD_WATERMARK_FIELD', 'timestamp')
+    )
+
+def map_search_hits(hits):
+    """Product cards for the hits of a build_search_query() search"""
+    if card_store is None:
+        return map_hits(hits)
+    return card_store.hydrate(es, hits)
+
+def build_search_query(query_text, weights, multi_match_fields, enable_reranking, rerank_field, query_vectors=None):
+    """Return the hybrid query as a JSON string; precomputed query vectors replace the semantic match clauses"""
+    id_only = card_store is not None
+    if not query_vectors:
+        # Render the compiled hybrid query template
+        return render_hybrid_query(query_text, weights, multi_match_fields, enable_reranking, rerank_field,
+                                   id_only=id_only)
+    return json.dumps(
+        generate_hybrid_query(query_text, weights, multi_match_fields, enable_reranking, rerank_field,
+                              query_vectors=query_vectors, id_only=id_only),
+        ensure_ascii=False,
+        separators=(',', ':')
+    )
+
+def search_params(data):
+    """Read the hybrid search parameters from a request body, applying the UI defaults"""
+    return (
+        data.get('query', ''),
+        data.get('weights', DEFAULT_WEIGHTS),
+        data.get('multi_match_fields', ['description', 'product_name']),
+        data.get('enable_reranking', False),
+        data.get('rerank_field', 'description')
+    )
+
+def lookup_search_batch(items, cache):
+    """Split batch items into results found in cache and (index, cache_key, params) searches still to run"""
+    cached = []
+    misses = []
+    for index, item in enumerate(items):
+        params = search_params(item)
+        cache_key = make_cache_key(*params)
+        result = cache.get(cache_key)
+        if result is not None:
+            cached.append({'index': index, **split_cached_query(result)[0]})
+        else:
+            misses.append((index, cache_key, params))
+    return cached, misses
+
+def build_search_batch(misses, miss_vectors=None):
+    """Turn lookup_search_batch misses into (index, cache_key, query_json) searches
+
+    miss_vectors optionally holds each miss's precomputed query vectors (the async app fetches them itself).
+    """
+    pending = []
+    for position, (index, cache_key, params) in enumerate(misses):
+        query_vectors = miss_vectors[position] if miss_vectors is not None else query_vectors_for(*params[:2])
+        pending.append((index, cache_key, build_search_query(*params, query_vectors=query_vectors)))
+    return pending
+
+def plan_search_batch(items, cache):
+    """Split batch items into results found in cache and (index, cache_key, query_json) searches still to run"""
+    cached, misses = lookup_search_batch(items, cache)
+    return cached, build_search_batch(misses)
+
+def msearch_body(pending):
+    """Build the NDJSON _msearch body from pre-serialized queries (empty headers use the URL's index)"""
+    return ''.join(f'{{}}\n{query_json}\n' for _, _, query_json in pending).encode('utf-8')
+
+def search_batch_results(pending, response, cache):
+    """Turn an _msearch response into per-item results, storing the successful ones in cache"""
+    if card_store is not None:
+        # One card fetch for the whole chunk instead of one per item
+        card_store.sources(es, [hit_product_id(hit) for item_response in response['responses']
+                                for hit in item_response.get('hits', {}).get('hits', [])])
+    for (index, cache_key, _), item_response in zip(pending, response['responses']):
+        if 'error' in item_response:
+            error = item_response['error']
+            yield {
+                'index': index,
+                'success': False,
+                'error': error.get('reason', str(error)) if isinstance(error, dict) else str(error)
+            }
+            continue
+        
+        result = {
+            'success': True,
+            'products': map_search_hits(item_response['hits']['hits']),
+            'total': item_response['hits']['total']['value']
+        }
+        cache.set(cache_key, result)
+        yield {'index': index, **result}
+
+def search_label(query_text, weights, multi_match_fields, enable_reranking, rerank_field):
+    """The /search request body a cached result is reported under in /cache/top_queries"""
+    return {
+        'query': query_text,
+        'weights': weights,
+        'multi_match_fields': multi_match_fields,
+        'enable_reranking': enable_reranking,
+        'rerank_field': rerank_field
+    }
+
+def convert_and_cache_hits(hits, total, cache, cache_key, label=None, query_json=None):
+    """Yield product cards one at a time, storing the complete result in cache at the end"""
+    return cache_products((map_hit(hit) for hit in hits), total, cache, cache_key, label, query_json)
+
+def cache_products(cards, total, cache, cache_key, label=None, query_json=None):
+    """Yield cards, storing the complete result (and the query that produced it, if given) in cache at the end"""
+    products = []
+    for product in cards:
+        if cache.enabled:
+            products.append(product)
+        yield product
+    
+    if cache.enabled:
+        cache.set(cache_key, with_cached_query({
+            'success': True,
+            'products': products,
+            'total': total
+        }, query_json), label=label)
+
+def with_cached_query(result, query_json):
+    """Attach the serialized query to a /search result so cache hits can echo it without rebuilding it"""
+    if query_json is None:
+        return result
+    return {**result, 'query': query_json}
+
+def split_cached_query(cached):
+    """Split a cached result into the result itself and its serialized query (None if it was not stored)"""
+    if 'query' not in cached:
+        return cached, None
+    result = dict(cached)
+    return result, result.pop('query')
+
+def search_stream_response(total, products, search_query, data, timer):
+    """Stream the search results as NDJSON, echoing the query only when asked to"""
+    raw_query = search_query if wants_query_echo(request, data) else None
+    return app.response_class(
+        timer.timed_stream(ndjson_stream(app.json.dumps, {'success': True, 'total': total}, products, raw_query),
+                           search_query),
+        mimetype=NDJSON_MIMETYPE
+    )
+
+def json_response_with_query(payload, query_json):
+    """Build a JSON response from payload with the already-serialized query spliced in under 'query'"""
+    body = app.json.dumps(payload)
+    return app.response_class(f'{body[:-1]},"query":{query_json}}}', mimetype='application/json')
+
+# Client-side fusion of cached sub-retriever lists (/search/fusion)
+fusion_engine = FusionEngine(
+    INDEX_NAME,
+    PRODUCT_CARD_FIELDS,
+    rank_window_size=int(os.getenv('FUSION_RANK_WINDOW_SIZE', '100')),
+    max_lists=int(os.getenv('FUSION_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('FUSION_CACHE_TTL', '300')),
+    version_fn=get_index_version,
+    max_concurrent_searches=SEARCH_BATCH_MAX_CONCURRENT,
+    card_store=card_store
+)
+
+def fusion_params(data):
+    """Read the fusion method and RRF rank constant, raising ValueError for unknown methods"""
+    method = data.get('fusion', 'minmax')
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of {', '.join(FUSION_METHODS)}")
+    return method, int(data.get('rank_constant', 60))
+
+recommendation_engine = RecommendationEngine(
+    RECOMMENDATION_ENGINE_INDEX_NAME,
+    INDEX_NAME,
+    card_fn=lambda hit: map_hit(hit, include_score=False),
+    card_fields=PRODUCT_CARD_FIELDS,
+    top_n=int(os.getenv('RECOMMENDATIONS_TOP_N', '5')),
+    ttl=float(os.getenv('RECOMMENDATIONS_CACHE_TTL', '3600')),
+    card_store=card_store
+)
+
+if os.getenv('RECOMMENDATIONS_PRELOAD', 'false').lower() == 'true':
+    try:
+        print(f"Preloaded {recommendation_engine.preload(es)} recommendation lists")
+    except Exception as e:
+        print(f"Warning: could not preload recommendations: {e}")
+
+# Typeahead for /suggest: "memory" serves it from an in-process prefix index, "es" queries the
+# search_as_you_type subfield in mappings/, "off" disables it
+SUGGEST_SOURCE = os.getenv('SUGGEST_SOURCE', 'memory')
+SUGGEST_MAX_SIZE = int(os.getenv('SUGGEST_MAX_SIZE', '20'))
+
+suggestion_index = SuggestionIndex(
+    INDEX_NAME,
+    watermark_field=os.getenv('SUGGEST_WATERMARK_FIELD', 'timestamp')
+)
+
+_background_tasks_started = False
+
+def start_background_tasks():
+    """Start the product-card and suggestion pollers once per process
+
+    The entry points call this (python app.py, serve.py in every worker after fork, the async hybrid app when
+    it starts serving); importing app does not.
+    """
+    global _background_tasks_started
+    if _background_tasks_started:
+        return
+    _background_tasks_started = True
+    if card_store is not None:
+        card_store.start(es, poll_interval=float(os.getenv('PRODUCT_CARD_POLL_INTERVAL', '30')))
+    if SUGGEST_SOURCE == 'memory':
+        suggestion_index.start(
+            es,
+            refresh_interval=float(os.getenv('SUGGEST_REFRESH_INTERVAL', '60')),
+            full_rebuild_interval=float(os.getenv('SUGGEST_FULL_REBUILD_INTERVAL', '3600'))
+        )
+
+def stop_background_tasks():
+    global _background_tasks_started
+    _background_tasks_started = False
+    if card_store is not None:
+        card_store.stop()
+    suggestion_index.stop()
+
+# Off by default so that importing app (async_app.py, benchmarks, reindex tooling) starts no threads
+if os.getenv('START_BACKGROUND_TASKS', 'false').lower() == 'true':
+    start_background_tasks()
+
+def suggest_params(args):
+    """Read the prefix and number of suggestions from the query string"""
+    return args.get('q', ''), max(1, min(int(args.get('size', 10)), SUGGEST_MAX_SIZE))
+
 @app.route('/')
 def index():
     return render_template('index.html', 
@@ -93,59 +402,73 @@ def index():
 
 @app.route('/search', methods=['POST'])
 def search():
+    timer = RequestTimer('/search', 'hybrid')
     try:
-        data = request.get_json()
-        query_text = data.get('query', '')
-        weights = data.get('weights', DEFAULT_WEIGHTS)
-        multi_match_fields = data.get('multi_match_fields', ['description', 'product_name'])
-        enable_reranking = data.get('enable_reranking', False)
-        rerank_field = data.get('rerank_field', 'description')
-        
-        # Generate the hybrid query
-        search_query = generate_hybrid_query(query_text, weights, multi_match_fields, enable_reranking, rerank_field)
-        
-        # Execute the search
-        response = es.search(
-            index=INDEX_NAME,
-            body=search_query
-        )
+        with timer.stage('parse'):
+            data = request.get_json()
+            query_text, weights, multi_match_fields, enable_reranking, rerank_field = search_params(data)
+        timer.rerank = enable_reranking
+        
+        # Serve repeated queries from the result cache before paying for embeddings and the query build
+        with timer.stage('cache'):
+            cache_key = make_cache_key(query_text, weights, multi_match_fields, enable_reranking, rerank_field)
+            cached = search_cache.get(cache_key)
+            if cached is not None:
+                cached, search_query = split_cached_query(cached)
+        
+        if cached is None or search_query is None:
+            # Results stored without their query (by /search/batch) still need it built for the response
+            with timer.stage('embed'):
+                query_vectors = query_vectors_for(query_text, weights)
+            with timer.stage('build'):
+                search_query = build_search_query(query_text, weights, multi_match_fields, enable_reranking,
+                                                  rerank_field, query_vectors)
+        
+        if cached is not None:
+            if wants_ndjson(request):
+                return search_stream_response(cached['total'], cached['products'], search_query, data, timer)
+            with timer.stage('serialize'):
+                search_response = json_response_with_query(cached, search_query)
+            timer.finish(search_query)
+            return search_response
+        
+        # Execute the search, sending the pre-serialized body as-is
+        with timer.stage('es'):
+            response = es.search(
+                index=INDEX_NAME,
+                body=search_query.encode('utf-8')
+            )
+        timer.took(response)
+        
+        if wants_ndjson(request):
+            total = response['hits']['total']['value']
+            return search_stream_response(
+                total,
+                cache_products(map_search_hits(response['hits']['hits']), total, search_cache, cache_key,
+                               search_label(query_text, weights, multi_match_fields, enable_reranking,
+                                            rerank_field),
+                               search_query),
+                search_query,
+                data,
+                timer
+            )
         
         # Process results
-        products = []
-        for hit in response['hits']['hits']:
-            # Handle both _source and fields response formats
-            if '_source' in hit:
-                source = hit['_source']
-            else:
-                # For reranking queries that use fields
-                source = {}
-                for field in hit.get('fields', {}):
-                    values = hit['fields'][field]
-                    # Take the first value if it's a list
-                    source[field] = values[0] if isinstance(values, list) and len(values) > 0 else values
-            
-            product = {
-                'id': hit['_id'],
-                'score': hit['_score'],
-                'product_id': source.get('product_id', ''),
-                'product_name': source.get('product_name', ''),
-                'description': source.get('description', ''),
-                'main_image': source.get('main_image', ''),
-                'final_price': source.get('final_price', 0),
-                'currency': source.get('currency', ''),
-                'rating': source.get('rating', 0),
-                'reviews_count': source.get('reviews_count', 0),
-                'in_stock': source.get('in_stock', False),
-                'model_number': source.get('model_number', '')
-            }
-            products.append(product)
+        with timer.stage('map'):
+            products = map_search_hits(response['hits']['hits'])
         
-        return jsonify({
+        result = {
             'success': True,
             'products': products,
-            'total': response['hits']['total']['value'],
-            'query': search_query
-        })
+            'total': response['hits']['total']['value']
+        }
+        search_cache.set(cache_key, with_cached_query(result, search_query),
+                         label=search_label(query_text, weights, multi_match_fields, enable_reranking, rerank_field))
+        
+        with timer.stage('serialize'):
+            search_response = json_response_with_query(result, search_query)
+        timer.finish(search_query)
+        return search_response
         
     except Exception as e:
         return jsonify({
@@ -153,122 +476,303 @@ def search():
             'error': str(e)
         }), 500
 
-@app.route('/generate_query', methods=['POST'])
-def generate_query():
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """Run many hybrid searches through _msearch and stream one NDJSON result line per item"""
+    timer = RequestTimer('/search/batch', 'hybrid')
     try:
-        data = request.get_json()
-        query_text = data.get('query', '')
-        weights = data.get('weights', DEFAULT_WEIGHTS)
-        multi_match_fields = data.get('multi_match_fields', ['description', 'product_name'])
-        enable_reranking = data.get('enable_reranking', False)
-        rerank_field = data.get('rerank_field', 'description')
+        with timer.stage('parse'):
+            data = request.get_json()
+            items = data.get('searches', []) if isinstance(data, dict) else data
         
-        # Generate the hybrid query
-        search_query = generate_hybrid_query(query_text, weights, multi_match_fields, enable_reranking, rerank_field)
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            return jsonify({
+                'success': False,
+                'error': 'A non-empty list of searches is required'
+            }), 400
         
-        return jsonify({
-            'success': True,
-            'query': search_query
-        })
+        if len(items) > SEARCH_BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {SEARCH_BATCH_MAX_ITEMS} searches per batch'
+            }), 400
+        
+        with timer.stage('build'):
+            cached, pending = plan_search_batch(items, search_cache)
         
     except Exception as e:
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
+    
+    def generate():
+        try:
+            # Cached items go out first, then each _msearch chunk as soon as it returns
+            for result in cached:
+                with timer.stage('serialize'):
+                    line = app.json.dumps(result) + '\n'
+                yield line
+            
+            for start in range(0, len(pending), SEARCH_BATCH_CHUNK_SIZE):
+                chunk = pending[start:start + SEARCH_BATCH_CHUNK_SIZE]
+                try:
+                    with timer.stage('es'):
+                        response = es.msearch(
+                            index=INDEX_NAME,
+                            body=msearch_body(chunk),
+                            max_concurrent_searches=SEARCH_BATCH_MAX_CONCURRENT
+                        )
+                    timer.took(response)
+                    with timer.stage('map'):
+                        results = list(search_batch_results(chunk, response, search_cache))
+                except Exception as e:
+                    results = [{'index': index, 'success': False, 'error': str(e)} for index, _, _ in chunk]
+                
+                for result in results:
+                    with timer.stage('serialize'):
+                        line = app.json.dumps(result) + '\n'
+                    yield line
+        finally:
+            timer.finish('\n'.join(query_json for _, _, query_json in pending))
+    
+    return app.response_class(generate(), mimetype='application/x-ndjson')
 
-@app.route('/recommendations', methods=['POST'])
-def get_recommendations():
+@app.route('/search/fusion', methods=['POST'])
+def search_fusion():
+    """Hybrid search fused client-side from cached per-sub-retriever result lists"""
+    timer = RequestTimer('/search/fusion', 'fusion')
     try:
-        data = request.get_json()
-        print(f"DEBUG: Received data: {data}")
-        product_id = data.get('product_id', '')
+        with timer.stage('parse'):
+            data = request.get_json()
+            query_text, weights, multi_match_fields, enable_reranking, rerank_field = search_params(data)
+            try:
+                method, rank_constant = fusion_params(data)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
         
-        print(f"DEBUG: Looking for recommendations for product_id: {product_id}")
+        # Lists missing from the cache are fetched with one _msearch; weights only apply when fusing
+        with timer.stage('es'):
+            result = fusion_engine.search(es, query_text, weights, multi_match_fields, method, rank_constant)
+        result['query'] = fusion_engine.sub_queries_for_display(query_text, weights, multi_match_fields)
         
-        if not product_id:
+        with timer.stage('serialize'):
+            fusion_response = jsonify(result)
+        timer.finish(result['query'])
+        return fusion_response
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/search/page', methods=['POST'])
+def search_page():
+    """Cursor-paginated standard hybrid search; pass back next_cursor with the same parameters for the next page"""
+    timer = RequestTimer('/search/page', 'hybrid')
+    try:
+        with timer.stage('parse'):
+            data = request.get_json()
+            query_text, weights, multi_match_fields, enable_reranking, rerank_field = search_params(data)
+            page_size = max(1, min(int(data.get('page_size', 20)), SEARCH_PAGE_MAX_SIZE))
+            cursor = data.get('cursor')
+        
+        if enable_reranking:
             return jsonify({
                 'success': False,
-                'error': 'Product ID is required'
+                'error': 'Pagination is only available for the standard hybrid query'
             }), 400
         
-        # Query the recommendations index
-        recommendation_query = {
-            "query": {
-                "term": {
-                    "product_id": product_id
-                }
-            },
-            "size": 1
+        if cursor:
+            try:
+                pit_id, search_after = decode_cursor(cursor)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+        else:
+            pit_id = es.open_point_in_time(index=INDEX_NAME, keep_alive=SEARCH_PIT_KEEP_ALIVE)['id']
+            search_after = None
+        
+        with timer.stage('build'):
+            search_query = page_body(
+                generate_standard_query(query_text, weights, multi_match_fields, query_vectors_for(query_text, weights)),
+                pit_id, SEARCH_PIT_KEEP_ALIVE, page_size, search_after,
+                track_total_hits=cursor is None
+            )
+        with timer.stage('es'):
+            response = es.search(body=search_query)
+        timer.took(response)
+        hits = response['hits']['hits']
+        pit_id = response.get('pit_id', pit_id)
+        
+        # A short page is the last one; release the PIT instead of handing out a cursor
+        next_cursor = None
+        if len(hits) == page_size:
+            next_cursor = encode_cursor(pit_id, hits[-1]['sort'])
+        else:
+            close_pit(es, pit_id)
+        
+        with timer.stage('map'):
+            products = map_hits(hits)
+        
+        result = {
+            'success': True,
+            'products': products,
+            'next_cursor': next_cursor
         }
+        if 'total' in response['hits']:
+            result['total'] = response['hits']['total']['value']
         
-        recommendation_response = es.search(
-            index=RECOMMENDATION_ENGINE_INDEX_NAME,
-            body=recommendation_query
-        )
+        with timer.stage('serialize'):
+            page_response = jsonify(result)
+        timer.finish(search_query)
+        return page_response
         
-        print(f"DEBUG: Recommendation query response: {recommendation_response}")
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/search/export', methods=['POST'])
+def search_export():
+    """Stream every product matching the standard hybrid query as NDJSON, one page in memory at a time"""
+    try:
+        data = request.get_json()
+        query_text, weights, multi_match_fields, enable_reranking, rerank_field = search_params(data)
+        max_results = data.get('max_results')
+        page_size = max(1, min(int(data.get('page_size', EXPORT_PAGE_SIZE)), 10000))
         
-        if not recommendation_response['hits']['hits']:
-            print(f"DEBUG: No recommendations found for product_id: {product_id}")
-            return jsonify({
-                'success': True,
-                'recommendations': []
-            })
+        search_query = generate_standard_query(query_text, weights, multi_match_fields,
+                                               query_vectors_for(query_text, weights))
         
-        # Extract recommended product IDs from the recommendation field
-        recommendation_doc = recommendation_response['hits']['hits'][0]['_source']
-        recommendation_field = recommendation_doc.get('recommendation', {})
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+    
+    def generate():
+        try:
+            pages = iter_pages(es, INDEX_NAME, search_query, page_size, SEARCH_PIT_KEEP_ALIVE,
+                               max_results=int(max_results) if max_results else None,
+                               source_fields=PRODUCT_CARD_FIELDS)
+            for hits in pages:
+                for product in map_hits(hits):
+                    yield app.json.dumps(product) + '\n'
+        except Exception as e:
+            yield app.json.dumps({'success': False, 'error': str(e)}) + '\n'
+    
+    return app.response_class(generate(), mimetype=NDJSON_MIMETYPE)
+
+@app.route('/generate_query', methods=['POST'])
+def generate_query():
+    try:
+        data = request.get_json()
+        query_text, weights, multi_match_fields, enable_reranking, rerank_field = search_params(data)
         
-        # Get the top recommended product IDs (rank_features field contains product_id: score pairs)
-        recommended_product_ids = []
-        if recommendation_field:
-            # Sort by score and get top 5 recommendations
-            sorted_recommendations = sorted(recommendation_field.items(), key=lambda x: x[1], reverse=True)
-            recommended_product_ids = [product_id for product_id, score in sorted_recommendations[:5]]
-            print(f"DEBUG: Found recommended product IDs: {recommended_product_ids}")
+        search_query = build_search_query(query_text, weights, multi_match_fields, enable_reranking, rerank_field,
+                                          query_vectors_for(query_text, weights))
         
-        if not recommended_product_ids:
-            print(f"DEBUG: No recommended product IDs found")
-            return jsonify({
+        return json_response_with_query({
+            'success': True,
+            'query_plan': query_plan(query_text)
+        }, search_query)
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/suggest', methods=['GET'])
+def suggest():
+    """Search-as-you-type suggestions for a query prefix"""
+    timer = RequestTimer('/suggest', SUGGEST_SOURCE)
+    try:
+        prefix, size = suggest_params(request.args)
+        
+        if SUGGEST_SOURCE == 'memory':
+            with timer.stage('cache'):
+                suggestions = suggestion_index.suggest(prefix, size)
+        elif SUGGEST_SOURCE == 'es' and prefix.strip():
+            with timer.stage('es'):
+                response = es.search(index=INDEX_NAME, body=suggest_query(prefix, size))
+            timer.took(response)
+            suggestions = suggestions_from_hits(response['hits']['hits'])
+        else:
+            suggestions = []
+        
+        with timer.stage('serialize'):
+            suggest_response = jsonify({
                 'success': True,
-                'recommendations': []
+                'suggestions': suggestions
             })
+        timer.finish()
+        return suggest_response
         
-        # Query the products index to get full product details for recommended items
-        # Search by product_id field using terms query
-        products_query = {
-            "query": {
-                "terms": {
-                    "product_id": recommended_product_ids
-                }
-            },
-            "size": len(recommended_product_ids)
-        }
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency histograms in the Prometheus text format"""
+    return app.response_class(render_metrics(), content_type=PROMETHEUS_MIMETYPE)
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    """Expose hit/miss/eviction counters for sizing the caches"""
+    return jsonify({
+        'success': True,
+        'search_cache': search_cache.info(),
+        'query_templates': query_template_cache_info()._asdict(),
+        'fusion': fusion_engine.info(),
+        'query_embeddings': query_embeddings.info() if query_embeddings is not None else None,
+        'suggestions': suggestion_index.info(),
+        'recommendations': recommendation_engine.info(),
+        'product_cards': card_store.info() if card_store is not None else None
+    })
+
+@app.route('/cache/top_queries', methods=['GET'])
+def cache_top_queries():
+    """The most requested /search bodies, used by reindex.py to warm a rebuilt index"""
+    try:
+        limit = max(1, int(request.args.get('limit', 100)))
+        return jsonify({
+            'success': True,
+            'index': INDEX_NAME,
+            'queries': search_cache.top(limit)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@app.route('/recommendations', methods=['POST'])
+def get_recommendations():
+    try:
+        data = request.get_json()
+        product_id = data.get('product_id', '')
         
-        products_response = es.search(
-            index=INDEX_NAME,
-            body=products_query
-        )
+        if not product_id:
+            return jsonify({
+                'success': False,
+                'error': 'Product ID is required'
+            }), 400
         
-        # Process recommended products
-        recommendations = []
-        for hit in products_response['hits']['hits']:
-            source = hit['_source']
-            product = {
-                'id': hit['_id'],
-                'product_id': source.get('product_id', ''),
-                'product_name': source.get('product_name', ''),
-                'description': source.get('description', ''),
-                'main_image': source.get('main_image', ''),
-                'final_price': source.get('final_price', 0),
-                'currency': source.get('currency', ''),
-                'rating': source.get('rating', 0),
-                'reviews_count': source.get('reviews_count', 0),
-                'in_stock': source.get('in_stock', False),
-                'model_number': source.get('model_number', '')
-            }
-            recommendations.append(product)
+        # Cached, pre-sorted recommendation list hydrated from the product card cache;
+        # misses cost at most one search per index
+        recommendations = recommendation_engine.recommend_many(es, [product_id])[product_id]
         
         return jsonify({
             'success': True,
@@ -281,335 +785,32 @@ def get_recommendations():
             'error': str(e)
         }), 500
 
-def generate_hybrid_query(query_text, weights, multi_match_fields, enable_reranking=False, rerank_field='description'):
-    """Generate the hybrid query using bool/should structure or reranking structure"""
-    
-    if enable_reranking:
-        return generate_reranking_query(query_text, weights, multi_match_fields, rerank_field)
-    else:
-        return generate_standard_query(query_text, weights, multi_match_fields)
-
-def generate_standard_query(query_text, weights, multi_match_fields):
-    """Generate the standard hybrid query using bool/should structure"""
-    
-    # Build should clauses for hybrid search
-    should_clauses = []
-    
-    # Add semantic search clauses
-    semantic_fields = [
-        'description_semantic_elser',
-        'description_semantic_google', 
-        'description_semantic_e5',
-        'product_name_semantic_elser',
-        'product_name_semantic_google',
-        'product_name_semantic_e5'
-    ]
-    
-    for field in semantic_fields:
-        if field in weights:
-            should_clauses.append({
-                "match": {
-                    field: {
-                        "query": query_text,
-                        "boost": weights[field]
-                    }
-                }
-            })
-    
-    # Add multi_match clause
-    if 'multi_match' in weights and multi_match_fields:
-        should_clauses.append({
-            "multi_match": {
-                "query": query_text,
-                "fields": multi_match_fields,
-                "boost": weights['multi_match']
-            }
-        })
-    
-    # Add model_number clauses (term, prefix, wildcard)
-    if 'model_number' in weights:
-        should_clauses.append({
-            "term": {
-                "model_number": {
-                    "value": query_text,
-                    "boost": weights['model_number']
-                }
-            }
-        })
-        should_clauses.append({
-            "prefix": {
-                "model_number": {
-                    "boost": weights['model_number'],
-                    "value": query_text
-                }
-            }
-        })
-        should_clauses.append({
-            "wildcard": {
-                "model_number": {
-                    "boost": weights['model_number'],
-                    "value": f"*{query_text}*"
-                }
-            }
-        })
-    
-    # Add product_id clauses (term, prefix, wildcard)
-    if 'product_id' in weights:
-        should_clauses.append({
-            "term": {
-                "product_id": {
-                    "value": query_text,
-                    "boost": weights['product_id']
-                }
-            }
-        })
-        should_clauses.append({
-            "prefix": {
-                "product_id": {
-                    "boost": weights['product_id'],
-                    "value": query_text
-                }
-            }
-        })
-        should_clauses.append({
-            "wildcard": {
-                "product_id": {
-                    "boost": weights['product_id'],
-                    "value": f"*{query_text}*"
-                }
-            }
-        })
-    
-    # Build the complete query
-    query = {
-        "query": {
-            "bool": {
-                "should": should_clauses,
-                "minimum_should_match": 1
-            }
-        },
-        "highlight": {
-            "fields": {
-                "product_name": {
-                    "number_of_fragments": 1,
-                    "order": "score"
-                },
-                "description": {
-                    "number_of_fragments": 1,
-                    "order": "score"
-                }
-            }
-        },
-        "size": 20
-    }
-    
-    return query
-
-def generate_reranking_query(query_text, weights, multi_match_fields, rerank_field='description'):
-    """Generate the reranking query using text_similarity_reranker structure"""
-    
-    # Build retrievers for the linear combination
-    retrievers = []
-    
-    # Add semantic search retrievers
-    semantic_fields = [
-        ('description_semantic_elser', 'description_semantic_elser', 2.0),
-        ('description_semantic_google', 'description_semantic_google', 2.0),
-        ('description_semantic_e5', 'description_semantic_e5', 2.0),
-        ('product_name_semantic_elser', 'product_name_semantic_elser', 2.0),
-        ('product_name_semantic_google', 'product_name_semantic_google', 2.0),
-        ('product_name_semantic_e5', 'product_name_semantic_e5', 2.0)
-    ]
-    
-    for field_name, field_path, default_weight in semantic_fields:
-        if field_name in weights:
-            retrievers.append({
-                "normalizer": "minmax",
-                "retriever": {
-                    "standard": {
-                        "query": {
-                            "match": {
-                                field_path: {
-                                    "query": query_text,
-                                    "boost": weights[field_name]
-                                }
-                            }
-                        }
-                    }
-                },
-                "weight": weights[field_name]
-            })
-    
-    # Add multi_match retriever
-    if 'multi_match' in weights and multi_match_fields:
-        retrievers.append({
-            "normalizer": "minmax",
-            "retriever": {
-                "standard": {
-                    "query": {
-                        "multi_match": {
-                            "query": query_text,
-                            "fields": multi_match_fields,
-                            "boost": weights['multi_match']
-                        }
-                    }
-                }
-            },
-            "weight": weights['multi_match']
-        })
-    
-    # Add model_number retrievers (term, prefix, wildcard)
-    if 'model_number' in weights:
-        # Term query
-        retrievers.append({
-            "normalizer": "minmax",
-            "retriever": {
-                "standard": {
-                    "query": {
-                        "term": {
-                            "model_number": {
-                                "value": query_text,
-                                "boost": weights['model_number']
-                            }
-                        }
-                    }
-                }
-            },
-            "weight": weights['model_number']
-        })
-        # Prefix query
-        retrievers.append({
-            "normalizer": "minmax",
-            "retriever": {
-                "standard": {
-                    "query": {
-                        "prefix": {
-                            "model_number": {
-                                "boost": weights['model_number'],
-                                "value": query_text
-                            }
-                        }
-                    }
-                }
-            },
-            "weight": weights['model_number']
-        })
-        # Wildcard query
-        retrievers.append({
-            "normalizer": "minmax",
-            "retriever": {
-                "standard": {
-                    "query": {
-                        "wildcard": {
-                            "model_number": {
-                                "boost": weights['model_number'],
-                                "value": f"*{query_text}*"
-                            }
-                        }
-                    }
-                }
-            },
-            "weight": weights['model_number']
-        })
-    
-    # Add product_id retrievers (term, prefix, wildcard)
-    if 'product_id' in weights:
-        # Term query
-        retrievers.append({
-            "normalizer": "minmax",
-            "retriever": {
-                "standard": {
-                    "query": {
-                        "term": {
-                            "product_id": {
-                                "value": query_text,
-                                "boost": weights['product_id']
-                            }
-                        }
-                    }
-                }
-            },
-            "weight": weights['product_id']
-        })
-        # Prefix query
-        retrievers.append({
-            "normalizer": "minmax",
-            "retriever": {
-                "standard": {
-                    "query": {
-                        "prefix": {
-                            "product_id": {
-                                "boost": weights['product_id'],
-                                "value": query_text
-                            }
-                        }
-                    }
-                }
-            },
-            "weight": weights['product_id']
-        })
-        # Wildcard query
-        retrievers.append({
-            "normalizer": "minmax",
-            "retriever": {
-                "standard": {
-                    "query": {
-                        "wildcard": {
-                            "product_id": {
-                                "boost": weights['product_id'],
-                                "value": f"*{query_text}*"
-                            }
-                        }
-                    }
-                }
-            },
-            "weight": weights['product_id']
+@app.route('/recommendations/batch', methods=['POST'])
+def get_recommendations_batch():
+    """Recommendations for several products, resolved together in at most two round trips"""
+    try:
+        data = request.get_json()
+        product_ids = [product_id for product_id in data.get('product_ids', []) if product_id]
+        
+        if not product_ids:
+            return jsonify({
+                'success': False,
+                'error': 'product_ids is required'
+            }), 400
+        
+        return jsonify({
+            'success': True,
+            'recommendations': recommendation_engine.recommend_many(es, product_ids)
         })
-    
-    # Build the reranking query
-    query = {
-        "_source": False,
-        "fields": [
-            "product_name",
-            "description",
-            "main_image",
-            "final_price",
-            "currency",
-            "rating",
-            "reviews_count",
-            "in_stock",
-            "model_number"
-        ],
-        "highlight": {
-            "fields": {
-                "product_name": {
-                    "number_of_fragments": 1,
-                    "order": "score"
-                },
-                "description": {
-                    "number_of_fragments": 1,
-                    "order": "score"
-                }
-            }
-        },
-        "retriever": {
-            "text_similarity_reranker": {
-                "field": rerank_field,  # Field to rerank on
-                "inference_id": RERANK_INFERENCE_ID,
-                "inference_text": query_text,
-                "rank_window_size": 20,
-                "retriever": {
-                    "linear": {
-                        "rank_window_size": 100,
-                        "retrievers": retrievers
-                    }
-                }
-            }
-        },
-        "size": 20
-    }
-    
-    return query
+        
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
 
 if __name__ == '__main__':
+    # The reloader runs this module in a watcher process and a serving child; only the child serves
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        start_background_tasks()
     app.run(debug=True, host='0.0.0.0', port=8080)
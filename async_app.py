@@ -0,0 +1,797 @@
+"""
+Async serving mode for the search applications.
+
+ASGI versions of the Hybrid Search, Synonym and Rules apps built with Quart.
+The routes mirror app.py, simple_app.py and rules_app.py and reuse their query
+builders, but every Elasticsearch call goes through one shared AsyncElasticsearch
+client per worker process, so a single worker keeps many ES requests in flight.
+
+Run with an ASGI server, e.g.:
+    uvicorn async_app:hybrid_app --port 8080
+    uvicorn async_app:synonym_app --port 8046
+    uvicorn async_app:rules_app --port 8047
+
+Connection pool settings (variables.env):
+    ES_POOL_MAXSIZE        connections per Elasticsearch node (default 32)
+    ES_KEEPALIVE_TIMEOUT   seconds an idle pooled connection is kept open (default 30)
+    ES_REQUEST_TIMEOUT     per-request timeout in seconds (default 30)
+"""
+
+import asyncio
+import json
+import os
+
+import aiohttp
+from elastic_transport import AiohttpHttpNode
+from elasticsearch import AsyncElasticsearch
+from quart import Quart, render_template, request, jsonify
+from quart.json.provider import DefaultJSONProvider
+
+import app as hybrid
+import rules_app as rules
+import simple_app as synonyms
+from fusion import FusionEngine
+from hybrid_query import plan_weights, query_plan, query_template_cache_info
+from metrics import PROMETHEUS_MIMETYPE, RequestTimer, render_metrics
+from product_cards import hit_product_id
+from result_mapper import PRODUCT_CARD_FIELDS, FastJSONMixin, map_hit, map_hits
+from search_cache import SearchResultCache, make_cache_key
+from streaming import NDJSON_MIMETYPE, ndjson_stream, wants_ndjson, wants_query_echo
+from suggest import suggest_query, suggestions_from_hits
+
+# Elasticsearch configuration (variables.env has already been loaded by the app modules)
+ES_URL = os.getenv('ES_URL')
+ES_API_KEY = os.getenv('ES_API_KEY')
+ES_POOL_MAXSIZE = int(os.getenv('ES_POOL_MAXSIZE', '32'))
+ES_KEEPALIVE_TIMEOUT = float(os.getenv('ES_KEEPALIVE_TIMEOUT', '30'))
+ES_REQUEST_TIMEOUT = float(os.getenv('ES_REQUEST_TIMEOUT', '30'))
+
+class KeepAliveAiohttpNode(AiohttpHttpNode):
+    """aiohttp node whose pooled connections stay open for ES_KEEPALIVE_TIMEOUT seconds"""
+
+    def _create_aiohttp_session(self):
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            skip_auto_headers=('accept', 'accept-encoding', 'user-agent'),
+            auto_decompress=True,
+            loop=self._loop,
+            cookie_jar=aiohttp.DummyCookieJar(),
+            connector=aiohttp.TCPConnector(
+                limit=self._connections_per_node,
+                limit_per_host=self._connections_per_node,
+                keepalive_timeout=ES_KEEPALIVE_TIMEOUT,
+                use_dns_cache=True,
+                ssl=self._ssl_context or False,
+            ),
+        )
+
+# Shared AsyncElasticsearch client, created lazily and closed when the last app stops serving
+_es = None
+_es_users = 0
+
+def get_es():
+    global _es
+    if _es is None:
+        _es = AsyncElasticsearch(
+            ES_URL,
+            api_key=ES_API_KEY,
+            verify_certs=False,
+            node_class=KeepAliveAiohttpNode,
+            connections_per_node=ES_POOL_MAXSIZE,
+            request_timeout=ES_REQUEST_TIMEOUT
+        )
+    return _es
+
+async def _acquire_es():
+    global _es_users
+    _es_users += 1
+
+async def _release_es():
+    global _es, _es_users
+    _es_users -= 1
+    if _es_users == 0 and _es is not None:
+        await _es.close()
+        _es = None
+
+def use_shared_es(quart_app):
+    """Tie the shared client's lifetime to quart_app's serving lifetime"""
+    quart_app.before_serving(_acquire_es)
+    quart_app.after_serving(_release_es)
+
+class JSONProvider(FastJSONMixin, DefaultJSONProvider):
+    pass
+
+async def query_vectors_for(query_text, weights):
+    """Async counterpart of hybrid.query_vectors_for (missing models are embedded concurrently)"""
+    if hybrid.query_embeddings is None:
+        return None
+    return await hybrid.query_embeddings.avectors_for(get_es(), query_text,
+                                                      plan_weights(weights, query_plan(query_text)))
+
+def json_response_with_query(quart_app, payload, query_json):
+    """Build a JSON response from payload with the already-serialized query spliced in under 'query'"""
+    body = quart_app.json.dumps(payload)
+    return quart_app.response_class(f'{body[:-1]},"query":{query_json}}}', mimetype='application/json')
+
+def ndjson_response(quart_app, timer, query_body, header, products, raw_query=None):
+    return quart_app.response_class(
+        timer.timed_stream(ndjson_stream(quart_app.json.dumps, header, products, raw_query), query_body),
+        mimetype=NDJSON_MIMETYPE
+    )
+
+async def metrics_response():
+    """Per-stage latency histograms in the Prometheus text format (shared by the three apps in a process)"""
+    return render_metrics(), 200, {'Content-Type': PROMETHEUS_MIMETYPE}
+
+# ---------------------------------------------------------------------------
+# Hybrid Search App
+# ---------------------------------------------------------------------------
+
+hybrid_app = Quart(__name__)
+hybrid_app.json = JSONProvider(hybrid_app)
+use_shared_es(hybrid_app)
+hybrid_app.route('/metrics', methods=['GET'])(metrics_response)
+
+# Index version for cache invalidation, refreshed by a background task so lookups never block
+_index_version = None
+
+async def poll_index_version():
+    global _index_version
+    while True:
+        try:
+            stats = await get_es().indices.stats(index=hybrid.INDEX_NAME, metric='indexing,refresh')
+            primaries = stats['_all']['primaries']
+            _index_version = '{}:{}:{}'.format(
+                primaries['indexing']['index_total'],
+                primaries['indexing']['delete_total'],
+                primaries['refresh']['external_total']
+            )
+        except Exception as e:
+            print(f"Warning: could not read index version: {e}")
+            _index_version = None
+        await asyncio.sleep(search_cache.version_check_interval)
+
+search_cache = SearchResultCache(
+    max_entries=int(os.getenv('SEARCH_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('SEARCH_CACHE_TTL', '300')),
+    cache_dir=os.getenv('SEARCH_CACHE_DIR') or None,
+    version_fn=lambda: _index_version,
+    version_check_interval=float(os.getenv('SEARCH_CACHE_VERSION_CHECK_INTERVAL', '5'))
+)
+
+fusion_engine = FusionEngine(
+    hybrid.INDEX_NAME,
+    PRODUCT_CARD_FIELDS,
+    rank_window_size=int(os.getenv('FUSION_RANK_WINDOW_SIZE', '100')),
+    max_lists=int(os.getenv('FUSION_CACHE_SIZE', '4096')),
+    ttl=float(os.getenv('FUSION_CACHE_TTL', '300')),
+    version_fn=lambda: _index_version,
+    max_concurrent_searches=hybrid.SEARCH_BATCH_MAX_CONCURRENT,
+    card_store=hybrid.card_store
+)
+
+async def map_search_hits(hits):
+    """Product cards for the hits of a build_search_query() search (see app.map_search_hits)"""
+    if hybrid.card_store is None:
+        return map_hits(hits)
+    return await hybrid.card_store.ahydrate(get_es(), hits)
+
+_index_version_task = None
+
+@hybrid_app.before_serving
+async def _start_index_version_poller():
+    global _index_version_task
+    _index_version_task = asyncio.create_task(poll_index_version())
+    # The suggestion index and product-card poller of app.py back /suggest and the card store here too
+    hybrid.start_background_tasks()
+
+@hybrid_app.after_serving
+async def _stop_index_version_poller():
+    _index_version_task.cancel()
+    hybrid.stop_background_tasks()
+
+@hybrid_app.route('/')
+async def hybrid_index():
+    return await render_template('index.html',
+                                 default_weights=hybrid.DEFAULT_WEIGHTS,
+                                 text_fields=hybrid.TEXT_FIELDS)
+
+@hybrid_app.route('/search', methods=['POST'])
+async def hybrid_search():
+    timer = RequestTimer('/search', 'hybrid')
+    try:
+        with timer.stage('parse'):
+            data = await request.get_json()
+            query_text, weights, multi_match_fields, enable_reranking, rerank_field = hybrid.search_params(data)
+        timer.rerank = enable_reranking
+
+        # Serve repeated queries from the result cache before paying for embeddings and the query build
+        with timer.stage('cache'):
+            cache_key = make_cache_key(query_text, weights, multi_match_fields, enable_reranking, rerank_field)
+            cached = search_cache.get(cache_key)
+            if cached is not None:
+                cached, search_query = hybrid.split_cached_query(cached)
+
+        if cached is None or search_query is None:
+            with timer.stage('embed'):
+                query_vectors = await query_vectors_for(query_text, weights)
+            with timer.stage('build'):
+                search_query = hybrid.build_search_query(query_text, weights, multi_match_fields, enable_reranking,
+                                                         rerank_field, query_vectors)
+
+        stream = wants_ndjson(request)
+        raw_query = search_query if stream and wants_query_echo(request, data) else None
+
+        if cached is not None:
+            if stream:
+                return ndjson_response(hybrid_app, timer, search_query, {'success': True, 'total': cached['total']},
+                                       cached['products'], raw_query)
+            with timer.stage('serialize'):
+                search_response = json_response_with_query(hybrid_app, cached, search_query)
+            timer.finish(search_query)
+            return search_response
+
+        with timer.stage('es'):
+            response = await get_es().search(
+                index=hybrid.INDEX_NAME,
+                body=search_query.encode('utf-8')
+            )
+        timer.took(response)
+
+        if stream:
+            total = response['hits']['total']['value']
+            label = hybrid.search_label(query_text, weights, multi_match_fields, enable_reranking, rerank_field)
+            if hybrid.card_store is None:
+                products = hybrid.convert_and_cache_hits(response['hits']['hits'], total, search_cache, cache_key,
+                                                         label, search_query)
+            else:
+                products = hybrid.cache_products(await map_search_hits(response['hits']['hits']), total,
+                                                 search_cache, cache_key, label, search_query)
+            return ndjson_response(hybrid_app, timer, search_query, {'success': True, 'total': total},
+                                   products, raw_query)
+
+        with timer.stage('map'):
+            products = await map_search_hits(response['hits']['hits'])
+
+        result = {
+            'success': True,
+            'products': products,
+            'total': response['hits']['total']['value']
+        }
+        search_cache.set(cache_key, hybrid.with_cached_query(result, search_query),
+                         label=hybrid.search_label(query_text, weights, multi_match_fields, enable_reranking,
+                                                   rerank_field))
+
+        with timer.stage('serialize'):
+            search_response = json_response_with_query(hybrid_app, result, search_query)
+        timer.finish(search_query)
+        return search_response
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@hybrid_app.route('/search/batch', methods=['POST'])
+async def hybrid_search_batch():
+    timer = RequestTimer('/search/batch', 'hybrid')
+    try:
+        with timer.stage('parse'):
+            data = await request.get_json()
+            items = data.get('searches', []) if isinstance(data, dict) else data
+
+        if not isinstance(items, list) or not items or not all(isinstance(item, dict) for item in items):
+            return jsonify({
+                'success': False,
+                'error': 'A non-empty list of searches is required'
+            }), 400
+
+        if len(items) > hybrid.SEARCH_BATCH_MAX_ITEMS:
+            return jsonify({
+                'success': False,
+                'error': f'At most {hybrid.SEARCH_BATCH_MAX_ITEMS} searches per batch'
+            }), 400
+
+        # Only the items the result cache cannot answer need embeddings and a query
+        with timer.stage('cache'):
+            cached, misses = hybrid.lookup_search_batch(items, search_cache)
+        with timer.stage('embed'):
+            miss_vectors = await asyncio.gather(*(
+                query_vectors_for(*params[:2]) for _, _, params in misses
+            ))
+        with timer.stage('build'):
+            pending = hybrid.build_search_batch(misses, miss_vectors)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+    async def generate():
+        try:
+            for result in cached:
+                with timer.stage('serialize'):
+                    line = hybrid_app.json.dumps(result) + '\n'
+                yield line
+
+            chunk_size = hybrid.SEARCH_BATCH_CHUNK_SIZE
+            for start in range(0, len(pending), chunk_size):
+                chunk = pending[start:start + chunk_size]
+                try:
+                    with timer.stage('es'):
+                        response = await get_es().msearch(
+                            index=hybrid.INDEX_NAME,
+                            body=hybrid.msearch_body(chunk),
+                            max_concurrent_searches=hybrid.SEARCH_BATCH_MAX_CONCURRENT
+                        )
+                    timer.took(response)
+                    with timer.stage('map'):
+                        if hybrid.card_store is not None:
+                            # Fetch the chunk's missing cards here, so mapping below never waits on the sync client
+                            await hybrid.card_store.asources(get_es(), [
+                                hit_product_id(hit)
+                                for item in response['responses'] for hit in item.get('hits', {}).get('hits', [])
+                            ])
+                        results = list(hybrid.search_batch_results(chunk, response, search_cache))
+                except Exception as e:
+                    results = [{'index': index, 'success': False, 'error': str(e)} for index, _, _ in chunk]
+
+                for result in results:
+                    with timer.stage('serialize'):
+                        line = hybrid_app.json.dumps(result) + '\n'
+                    yield line
+        finally:
+            timer.finish('\n'.join(query_json for _, _, query_json in pending))
+
+    return hybrid_app.response_class(generate(), mimetype='application/x-ndjson')
+
+@hybrid_app.route('/search/fusion', methods=['POST'])
+async def hybrid_search_fusion():
+    timer = RequestTimer('/search/fusion', 'fusion')
+    try:
+        with timer.stage('parse'):
+            data = await request.get_json()
+            query_text, weights, multi_match_fields, enable_reranking, rerank_field = hybrid.search_params(data)
+            try:
+                method, rank_constant = hybrid.fusion_params(data)
+            except ValueError as e:
+                return jsonify({
+                    'success': False,
+                    'error': str(e)
+                }), 400
+
+        with timer.stage('es'):
+            result = await fusion_engine.asearch(get_es(), query_text, weights, multi_match_fields,
+                                                 method, rank_constant)
+        result['query'] = fusion_engine.sub_queries_for_display(query_text, weights, multi_match_fields)
+
+        with timer.stage('serialize'):
+            fusion_response = jsonify(result)
+        timer.finish(result['query'])
+        return fusion_response
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@hybrid_app.route('/suggest', methods=['GET'])
+async def hybrid_suggest():
+    timer = RequestTimer('/suggest', hybrid.SUGGEST_SOURCE)
+    try:
+        prefix, size = hybrid.suggest_params(request.args)
+
+        if hybrid.SUGGEST_SOURCE == 'memory':
+            # Served by the prefix index app.py keeps refreshed from a background thread
+            with timer.stage('cache'):
+                suggestions = hybrid.suggestion_index.suggest(prefix, size)
+        elif hybrid.SUGGEST_SOURCE == 'es' and prefix.strip():
+            with timer.stage('es'):
+                response = await get_es().search(index=hybrid.INDEX_NAME, body=suggest_query(prefix, size))
+            timer.took(response)
+            suggestions = suggestions_from_hits(response['hits']['hits'])
+        else:
+            suggestions = []
+
+        with timer.stage('serialize'):
+            suggest_response = jsonify({
+                'success': True,
+                'suggestions': suggestions
+            })
+        timer.finish()
+        return suggest_response
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@hybrid_app.route('/generate_query', methods=['POST'])
+async def hybrid_generate_query():
+    try:
+        data = await request.get_json()
+        params = hybrid.search_params(data)
+        search_query = hybrid.build_search_query(*params, query_vectors=await query_vectors_for(*params[:2]))
+
+        return json_response_with_query(hybrid_app, {
+            'success': True,
+            'query_plan': query_plan(params[0])
+        }, search_query)
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@hybrid_app.route('/cache/stats', methods=['GET'])
+async def hybrid_cache_stats():
+    return jsonify({
+        'success': True,
+        'search_cache': search_cache.info(),
+        'query_templates': query_template_cache_info()._asdict(),
+        'fusion': fusion_engine.info(),
+        'query_embeddings': hybrid.query_embeddings.info() if hybrid.query_embeddings is not None else None,
+        'suggestions': hybrid.suggestion_index.info(),
+        'recommendations': hybrid.recommendation_engine.info(),
+        'product_cards': hybrid.card_store.info() if hybrid.card_store is not None else None
+    })
+
+@hybrid_app.route('/cache/top_queries', methods=['GET'])
+async def hybrid_cache_top_queries():
+    try:
+        limit = max(1, int(request.args.get('limit', 100)))
+        return jsonify({
+            'success': True,
+            'index': hybrid.INDEX_NAME,
+            'queries': search_cache.top(limit)
+        })
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 400
+
+@hybrid_app.route('/recommendations', methods=['POST'])
+async def hybrid_recommendations():
+    try:
+        data = await request.get_json()
+        product_id = data.get('product_id', '')
+
+        if not product_id:
+            return jsonify({
+                'success': False,
+                'error': 'Product ID is required'
+            }), 400
+
+        recommendations = await hybrid.recommendation_engine.arecommend_many(get_es(), [product_id])
+
+        return jsonify({
+            'success': True,
+            'recommendations': recommendations[product_id]
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@hybrid_app.route('/recommendations/batch', methods=['POST'])
+async def hybrid_recommendations_batch():
+    try:
+        data = await request.get_json()
+        product_ids = [product_id for product_id in data.get('product_ids', []) if product_id]
+
+        if not product_ids:
+            return jsonify({
+                'success': False,
+                'error': 'product_ids is required'
+            }), 400
+
+        return jsonify({
+            'success': True,
+            'recommendations': await hybrid.recommendation_engine.arecommend_many(get_es(), product_ids)
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# ---------------------------------------------------------------------------
+# Synonym App
+# ---------------------------------------------------------------------------
+
+synonym_app = Quart(__name__)
+synonym_app.json = JSONProvider(synonym_app)
+use_shared_es(synonym_app)
+synonym_app.route('/metrics', methods=['GET'])(metrics_response)
+
+@synonym_app.route('/')
+async def synonym_index():
+    return await render_template('simple_index.html')
+
+@synonym_app.route('/search', methods=['POST'])
+async def synonym_search():
+    timer = RequestTimer('/search')
+    try:
+        with timer.stage('parse'):
+            data = await request.get_json()
+            query_text = data.get('query', '')
+            search_type = data.get('search_type', 'keyword')
+        timer.search_type = search_type
+
+        if not query_text.strip():
+            return jsonify({
+                'success': False,
+                'error': 'Query cannot be empty'
+            }), 400
+
+        with timer.stage('build'):
+            search_query = synonyms.generate_search_query(query_text, search_type)
+        with timer.stage('es'):
+            response = await get_es().search(
+                index=synonyms.INDEX_WITH_SYNONYMS,
+                body=search_query
+            )
+        timer.took(response)
+
+        if wants_ndjson(request):
+            header = {'success': True, 'total': response['hits']['total']['value']}
+            if wants_query_echo(request, data):
+                header['query'] = search_query
+            products = (map_hit(hit) for hit in response['hits']['hits'])
+            return ndjson_response(synonym_app, timer, search_query, header, products)
+
+        with timer.stage('map'):
+            products = map_hits(response['hits']['hits'])
+
+        with timer.stage('serialize'):
+            search_response = jsonify({
+                'success': True,
+                'products': products,
+                'total': response['hits']['total']['value'],
+                'query': search_query
+            })
+        timer.finish(search_query)
+        return search_response
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@synonym_app.route('/synonyms/yeti', methods=['GET'])
+async def synonym_get_synonyms():
+    """Get synonyms for 'yeti' from Elasticsearch"""
+    try:
+        try:
+            await get_es().info()
+        except Exception as e:
+            return jsonify({
+                'success': False,
+                'error': f"Cannot connect to Elasticsearch: {str(e)}"
+            }), 500
+
+        try:
+            response = await get_es().perform_request(
+                'GET',
+                '/_synonyms/yeti',
+                headers={'Accept': 'application/json'}
+            )
+            return jsonify({
+                'success': True,
+                'data': response.body
+            })
+        except Exception as e:
+            print(f"Cannot access actual synonyms API: {e}")
+            # Fallback to mock response
+            return jsonify({
+                'success': True,
+                'data': {
+                    'count': 1,
+                    'synonyms_set': [
+                        {
+                            'id': 'rule-1b45bf830312',
+                            'synonyms': 'yeti'
+                        }
+                    ]
+                }
+            })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@synonym_app.route('/synonyms/yeti/<rule_id>', methods=['PUT'])
+async def synonym_update_synonyms(rule_id):
+    """Update synonyms for a specific rule ID"""
+    try:
+        data = await request.get_json()
+        synonyms_text = data.get('synonyms', '')
+
+        if not synonyms_text.strip():
+            return jsonify({
+                'success': False,
+                'error': 'Synonyms cannot be empty'
+            }), 400
+
+        try:
+            response = await get_es().perform_request(
+                'PUT',
+                f'/_synonyms/yeti/{rule_id}',
+                body=json.dumps({'synonyms': synonyms_text}),
+                headers={'Content-Type': 'application/json', 'Accept': 'application/json'}
+            )
+            return jsonify({
+                'success': True,
+                'data': response.body
+            })
+        except Exception as e:
+            print(f"Cannot access actual synonyms API: {e}")
+            # Fallback to mock response
+            return jsonify({
+                'success': True,
+                'data': {
+                    'id': rule_id,
+                    'synonyms': synonyms_text
+                }
+            })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@synonym_app.route('/search-refinements/<query>', methods=['GET'])
+async def synonym_search_refinements(query):
+    """Get search refinements for a given query from ecommerce_shein_search_refinements index"""
+    try:
+        response = await get_es().search(
+            index='ecommerce_shein_search_refinements',
+            body={
+                "query": {
+                    "term": {
+                        "search_term": {
+                            "value": query.lower()
+                        }
+                    }
+                }
+            }
+        )
+
+        if response['hits']['total']['value'] > 0:
+            recommendations = response['hits']['hits'][0]['_source'].get('recommendations', {})
+            if recommendations:
+                best_recommendation = max(recommendations.items(), key=lambda x: x[1])
+                return jsonify({
+                    'success': True,
+                    'data': {
+                        'search_term': query,
+                        'best_recommendation': {
+                            'term': best_recommendation[0],
+                            'confidence': best_recommendation[1]
+                        },
+                        'all_recommendations': recommendations
+                    }
+                })
+
+        return jsonify({
+            'success': True,
+            'data': {
+                'search_term': query,
+                'best_recommendation': None,
+                'all_recommendations': {}
+            }
+        })
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@synonym_app.route('/kibana-synonyms-url', methods=['GET'])
+async def synonym_kibana_synonyms_url():
+    """Get the Kibana synonyms URL from environment variables"""
+    if not synonyms.KIBANA_SYNONYMS:
+        return jsonify({
+            'success': False,
+            'error': 'KIBANA_SYNONYMS environment variable not set'
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'url': synonyms.KIBANA_SYNONYMS
+    })
+
+# ---------------------------------------------------------------------------
+# Rules App
+# ---------------------------------------------------------------------------
+
+rules_app = Quart(__name__)
+rules_app.json = JSONProvider(rules_app)
+use_shared_es(rules_app)
+rules_app.route('/metrics', methods=['GET'])(metrics_response)
+
+@rules_app.route('/')
+async def rules_index():
+    return await render_template('rules_index.html')
+
+@rules_app.route('/search', methods=['POST'])
+async def rules_search():
+    timer = RequestTimer('/search')
+    try:
+        with timer.stage('parse'):
+            data = await request.get_json()
+            query_text = data.get('query', '')
+            search_type = data.get('search_type', 'text')
+        timer.search_type = search_type
+
+        if not query_text.strip():
+            return jsonify({
+                'success': False,
+                'error': 'Query cannot be empty'
+            }), 400
+
+        with timer.stage('build'):
+            search_query = rules.generate_search_query(query_text, search_type)
+        with timer.stage('es'):
+            response = await get_es().search(
+                index=rules.INDEX_NAME,
+                body=search_query
+            )
+        timer.took(response)
+
+        if wants_ndjson(request):
+            header = {'success': True, 'total': response['hits']['total']['value'], 'search_type': search_type}
+            if wants_query_echo(request, data):
+                header['query'] = search_query
+            products = (map_hit(hit) for hit in response['hits']['hits'])
+            return ndjson_response(rules_app, timer, search_query, header, products)
+
+        with timer.stage('map'):
+            products = map_hits(response['hits']['hits'])
+
+        with timer.stage('serialize'):
+            search_response = jsonify({
+                'success': True,
+                'products': products,
+                'total': response['hits']['total']['value'],
+                'query': search_query,
+                'search_type': search_type
+            })
+        timer.finish(search_query)
+        return search_response
+
+    except Exception as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@rules_app.route('/kibana-query-rules-url', methods=['GET'])
+async def rules_kibana_query_rules_url():
+    """Get the Kibana query rules URL from environment variables"""
+    if not rules.KIBANA_QUERY_RULES:
+        return jsonify({
+            'success': False,
+            'error': 'KIBANA_QUERY_RULES environment variable not set'
+        }), 400
+
+    return jsonify({
+        'success': True,
+        'url': rules.KIBANA_QUERY_RULES
+    })
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Load test: sync Flask app vs. async (ASGI) app against a fake Elasticsearch.
+
+The sync app is driven by a fixed pool of worker threads, so at most --threads
+Elasticsearch calls can be in flight. The async app is driven from a single
+event loop with --concurrency requests outstanding, all sharing one
+AsyncElasticsearch client. With a fixed ES latency, sync throughput is capped at
+threads / latency while async throughput keeps scaling with concurrency.
+
+Usage:
+    python benchmarks/bench_async_concurrency.py [--latency 0.05] [--threads 8] [--concurrency 8 32 128]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the repository root to the path so we can import the apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearch
+
+def run_sync(hybrid, requests_total, threads):
+    client = hybrid.app.test_client()
+
+    def one(i):
+        response = client.post('/search', json={'query': f'query {i}'})
+        assert response.status_code == 200, response.data
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        list(pool.map(one, range(requests_total)))
+    return time.perf_counter() - start
+
+async def run_async(async_app, requests_total, concurrency):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with async_app.hybrid_app.test_app() as test_app:
+        client = test_app.test_client()
+
+        async def one(i):
+            async with semaphore:
+                response = await client.post('/search', json={'query': f'query {i}'})
+                assert response.status_code == 200, await response.get_data()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests_total)))
+        return time.perf_counter() - start
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help='fake ES latency in seconds')
+    parser.add_argument('--threads', type=int, default=8, help='worker threads for the sync app')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8, 32, 128],
+                        help='outstanding requests for the async app')
+    parser.add_argument('--requests', type=int, default=512)
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(latency=args.latency)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+
+    from elasticsearch import Elasticsearch
+    import app as hybrid
+    import async_app
+
+    # Point both modes at the fake cluster and disable result caching so every request hits ES
+    hybrid.es = Elasticsearch(url, connections_per_node=args.threads)
+    hybrid.search_cache.max_entries = 0
+    async_app.ES_URL = url
+    async_app.ES_POOL_MAXSIZE = max(args.concurrency)
+    async_app.search_cache.max_entries = 0
+
+    print(f"fake ES latency: {args.latency * 1000:.0f} ms, {args.requests} requests per run\n")
+    print(f"{'mode':<32}{'req/s':>10}{'max ES in-flight':>20}")
+
+    fake_es.max_in_flight = 0
+    elapsed = run_sync(hybrid, args.requests, args.threads)
+    print(f"{f'sync Flask, {args.threads} threads':<32}{args.requests / elapsed:>10.1f}{fake_es.max_in_flight:>20}")
+
+    for concurrency in args.concurrency:
+        fake_es.max_in_flight = 0
+        elapsed = asyncio.run(run_async(async_app, args.requests, concurrency))
+        label = f'async, 1 thread, {concurrency} in flight'
+        print(f"{label:<32}{args.requests / elapsed:>10.1f}{fake_es.max_in_flight:>20}")
+
+    fake_es.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Benchmark: cleanup_conversations.py deleting conversations one at a time vs. concurrently.
+
+Runs delete_conversations() against a fake Kibana (benchmarks/fake_kibana.py)
+holding --conversations conversations, answering after --latency seconds and
+rejecting deletes beyond --server-rate per second with 429 + Retry-After, at
+each of the --concurrency levels. Every level runs once without client-side
+rate limiting and once with a token bucket at 90% of the server's limit
+(bursts of one request per thread), to show it trading retries for waiting.
+Reports deletes/s, 429s and retries.
+
+Usage:
+    python benchmarks/bench_cleanup.py [--conversations 2000] [--latency 0.02]
+                                       [--server-rate 400] [--concurrency 1 4 16]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from cleanup_conversations import delete_conversations, make_session
+from fake_kibana import FakeKibana
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--conversations', type=int, default=2000, help='conversations to delete per run')
+    parser.add_argument('--latency', type=float, default=0.02, help='fake Kibana latency in seconds')
+    parser.add_argument('--server-rate', type=int, default=400, help='deletes per second before the fake answers 429')
+    parser.add_argument('--failure-rate', type=float, default=0.0, help='fraction of deletes answered with 503')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16], help='concurrency levels to compare')
+    args = parser.parse_args()
+
+    fake_kibana = FakeKibana(conversations=0, latency=args.latency, max_rate=args.server_rate,
+                             failure_rate=args.failure_rate)
+    url = fake_kibana.start()
+
+    print(f"fake Kibana latency {args.latency * 1000:.0f} ms, {args.server_rate}/s before 429, "
+          f"{args.conversations:,} conversations per run\n")
+    print(f"{'concurrency':<13}{'client rate':>12}{'deletes/s':>11}{'seconds':>9}{'429s':>7}{'retries':>9}{'failed':>8}")
+    try:
+        for concurrency in args.concurrency:
+            for rate in (0.0, args.server_rate * 0.9):
+                fake_kibana.reset(args.conversations)
+                session = make_session('bench', pool_size=concurrency)
+                start = time.perf_counter()
+                stats = delete_conversations(session, url, list(fake_kibana.conversations), concurrency=concurrency,
+                                             rate=rate, burst=concurrency, progress_interval=float('inf'),
+                                             initial_backoff=0.1, max_backoff=2.0)
+                elapsed = time.perf_counter() - start
+                session.close()
+                assert stats.failed or not fake_kibana.conversations, 'conversations left behind'
+                print(f"{concurrency:<13}{f'{rate:g}/s' if rate else 'none':>12}{stats.deleted / elapsed:>11,.1f}"
+                      f"{elapsed:>9.2f}{stats.throttled:>7,}{stats.retries:>9,}{stats.failed:>8,}")
+    finally:
+        fake_kibana.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark: re-ranking after a weight change, server-side vs client-side fusion.
+
+Simulates a user moving weight sliders for one query. /search has to run the
+hybrid query again for every new set of weights; /search/fusion fetches the
+sub-retriever lists once (one _msearch) and then only re-fuses cached lists.
+The rrf run reuses the lists fetched by the minmax run, since the lists do not
+depend on the fusion method. Also times fusion.fuse() on 13 lists of
+rank_window_size hits.
+
+Usage:
+    python benchmarks/bench_fusion.py [--latency 0.05] [--changes 20] [--window 100]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import timeit
+
+# Add the repository root to the path so we can import the apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearch
+
+def weight_changes(base_weights, count, seed=7):
+    rng = random.Random(seed)
+    for _ in range(count):
+        weights = dict(base_weights)
+        field = rng.choice(list(weights))
+        weights[field] = round(rng.uniform(0.5, 5), 1)
+        yield weights
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help='fake ES latency per request in seconds')
+    parser.add_argument('--changes', type=int, default=20, help='weight changes to simulate')
+    parser.add_argument('--window', type=int, default=100, help='hits per sub-retriever list')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(latency=args.latency, hits_per_page=args.window)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+
+    from elasticsearch import Elasticsearch
+    import app as hybrid
+    from fusion import fuse
+
+    hybrid.es = Elasticsearch(url)
+    hybrid.fusion_engine.rank_window_size = args.window
+    client = hybrid.app.test_client()
+    changes = list(weight_changes(hybrid.DEFAULT_WEIGHTS, args.changes))
+
+    print(f"fake ES latency {args.latency * 1000:.0f} ms, {args.changes} weight changes, "
+          f"window {args.window}\n")
+    print(f"{'path':<34}{'first ms':>10}{'per change ms':>15}")
+
+    def run(path, extra):
+        start = time.perf_counter()
+        response = client.post(path, json={'query': 'dog bed', **extra})
+        assert response.get_json()['success'], response.get_json()
+        first = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for weights in changes:
+            response = client.post(path, json={'query': 'dog bed', 'weights': weights, **extra})
+            assert response.get_json()['success'], response.get_json()
+        per_change = (time.perf_counter() - start) / len(changes)
+        return first, per_change
+
+    for label, path, extra in [
+        ('/search (linear, server-side)', '/search', {}),
+        ('/search/fusion minmax', '/search/fusion', {'fusion': 'minmax'}),
+        ('/search/fusion rrf', '/search/fusion', {'fusion': 'rrf'}),
+    ]:
+        first, per_change = run(path, extra)
+        print(f"{label:<34}{first * 1000:>10.1f}{per_change * 1000:>15.2f}")
+
+    lists = [(random.uniform(0.5, 5), [f'doc{random.randrange(5 * args.window)}' for _ in range(args.window)],
+              sorted((random.random() * 20 for _ in range(args.window)), reverse=True)) for _ in range(13)]
+    lists = [(weight, list(dict.fromkeys(ids)), scores[:len(dict.fromkeys(ids))]) for weight, ids, scores in lists]
+    for method in ('minmax', 'rrf'):
+        elapsed = timeit.timeit(lambda: fuse(lists, method), number=1000) / 1000
+        print(f"\nfuse() {method}, 13 lists x {args.window} hits: {elapsed * 1e6:.0f} us")
+
+    fake_es.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark: bulk ingestion throughput and backpressure.
+
+Loads --docs generated products from an NDJSON file into the fake
+Elasticsearch with ingest.py, once per worker count. The fake charges
+--doc-latency seconds per document (standing in for semantic_text inference)
+and accepts only --capacity concurrent bulk requests; the documents of any
+further request are rejected with 429 and retried by the loader with
+exponential backoff. Each worker count runs with the index's default settings
+and with the --fast-load profile; the fake repeats the per-document cost for
+every replica and adds 30% while periodic refreshes are on. Reports docs/sec
+(including the force merge), 429 rejections and time spent backing off.
+
+Usage:
+    python benchmarks/bench_ingest.py [--docs 20000] [--doc-latency 0.0001] [--capacity 4]
+                                      [--workers 1,2,4,8]
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from contextlib import nullcontext
+
+# Add the repository root to the path so we can import the loader
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearch, make_product
+
+INDEX = 'ecommerce_shein_products'
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=20000)
+    parser.add_argument('--doc-latency', type=float, default=0.0001,
+                        help='fake indexing time per document and copy (primary or replica)')
+    parser.add_argument('--capacity', type=int, default=4, help='concurrent bulk requests before 429s')
+    parser.add_argument('--workers', default='1,2,4,8', help='comma-separated parallel_bulk thread counts')
+    parser.add_argument('--chunk-docs', type=int, default=500)
+    args = parser.parse_args()
+
+    for setting in ('ELSER_INFERENCE_ID', 'EMBEDDING_INFERENCE_ID', 'E5_INFERENCE_ID'):
+        os.environ.setdefault(setting, setting.lower())
+
+    from elasticsearch import Elasticsearch
+    import ingest
+
+    fake_es = FakeElasticsearch(latency=0.002, bulk_doc_latency=args.doc_latency, bulk_capacity=args.capacity)
+    url = fake_es.start()
+    es = Elasticsearch(url, request_timeout=120)
+
+    body = ingest.render_mapping(ingest.mapping_path_for(INDEX))
+    types = ingest.field_types(body)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dump = os.path.join(tmp, 'products.ndjson')
+        with open(dump, 'w') as f:
+            for i in range(args.docs):
+                f.write(json.dumps(make_product(i)) + '\n')
+
+        print(f"{args.docs} docs, {args.doc_latency * 1e6:.0f} us/doc, bulk capacity {args.capacity}, "
+              f"{args.chunk_docs} docs per bulk request\n")
+        print(f"{'workers':>8}  {'profile':<10}{'docs/s':>10}{'429s':>8}{'backoff s':>11}{'failed':>8}")
+
+        for workers in (int(value) for value in args.workers.split(',')):
+            for profile in ('default', 'fast-load'):
+                ingest.create_index(es, INDEX, body, recreate=True)
+                checkpoint = ingest.Checkpoint(os.path.join(tmp, f'checkpoint.{workers}.{profile}'), dump, INDEX)
+                load_profile = ingest.fast_load(es, INDEX) if profile == 'fast-load' else nullcontext()
+                # Keep the progress lines out of the table
+                with open(os.devnull, 'w') as devnull:
+                    stdout, sys.stdout = sys.stdout, devnull
+                    try:
+                        started = time.perf_counter()
+                        with load_profile:
+                            stats = ingest.ingest(es, INDEX, dump, 'ndjson', types, 'product_id', checkpoint,
+                                                  batch_docs=5000, workers=workers, chunk_docs=args.chunk_docs,
+                                                  initial_backoff=0.05, max_backoff=1.0)
+                        elapsed = time.perf_counter() - started
+                    finally:
+                        sys.stdout = stdout
+                assert fake_es.index_settings[INDEX].get('refresh_interval') is None
+                print(f"{workers:>8}  {profile:<10}{stats.indexed / elapsed:>10,.0f}{stats.rejected:>8,}"
+                      f"{stats.backoff_seconds:>11.2f}{stats.failed:>8,}")
+
+    fake_es.stop()
+
+if __name__ == '__main__':
+    main()
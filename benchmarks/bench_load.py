@@ -0,0 +1,380 @@
+#!/usr/bin/env python3
+"""
+Load test: the request paths of every app under a concurrent workload mix.
+
+Drives the Hybrid Search App (app.py), the Synonyms App (simple_app.py), the
+Query Rules App (rules_app.py) and the MCP server's query_elasticsearch_products
+tool from --concurrency threads against the fake Elasticsearch, which runs in
+its own process so that neither its CPU time nor its allocations are counted
+against the apps. The fake answers after --latency seconds with generated
+products, or replays responses recorded from a real cluster with record_es.py
+(--recordings). Every workload runs its own queries drawn from a fixed,
+seeded, Zipf-distributed vocabulary, so repeated runs send the same requests
+in the same proportions.
+
+Reports per workload throughput, p50/p95/p99 latency and errors from the timed
+run, then peak and retained heap bytes per request measured with tracemalloc
+in a separate serial run (tracing slows every allocation, so it never overlaps
+the timed run). --output writes the results with the git commit they were
+measured on; --compare prints the change against an earlier results file, or
+between two files without running anything:
+
+    git checkout main && python benchmarks/bench_load.py --output /tmp/main.json
+    git checkout my-branch && python benchmarks/bench_load.py --compare /tmp/main.json
+    python benchmarks/bench_load.py --compare /tmp/main.json /tmp/branch.json
+
+The MCP workload needs the MCP server's dependencies (mcp, httpx) and is left
+out of the mix with a note when they are not installed.
+
+Usage:
+    python benchmarks/bench_load.py [--latency 0.01] [--concurrency 16] [--requests 2000]
+                                    [--mix hybrid=40,hybrid_rerank=10,...] [--recordings DIR]
+                                    [--output results.json] [--compare base.json [new.json]]
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the repository root to the path so we can import the apps
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearchProcess
+
+DEFAULT_MIX = 'hybrid=40,hybrid_rerank=10,hybrid_batch=5,synonyms=15,rules=15,mcp=15'
+
+ADJECTIVES = ['black', 'summer', 'floral', 'cotton', 'oversized', 'vintage', 'waterproof', 'leather',
+              'striped', 'wireless', 'cozy', 'slim', 'linen', 'denim', 'silk', 'running']
+NOUNS = ['dress', 'jacket', 'sneakers', 'dog bed', 'backpack', 'hoodie', 'sandals', 'jeans',
+         'blouse', 'earbuds', 'scarf', 'skirt', 'boots', 'sweater', 'tote bag', 'sunglasses']
+
+# Headline metrics compared between results files: (key, label, format, higher is better)
+COMPARED_METRICS = [
+    ('throughput', 'req/s', '{:,.1f}', True),
+    ('p50_ms', 'p50 ms', '{:.2f}', False),
+    ('p95_ms', 'p95 ms', '{:.2f}', False),
+    ('p99_ms', 'p99 ms', '{:.2f}', False),
+    ('alloc_peak_kib', 'peak KiB/req', '{:,.1f}', False),
+    ('alloc_retained_bytes', 'retained B/req', '{:,.0f}', False)
+]
+
+def parse_mix(spec):
+    mix = {}
+    for item in spec.split(','):
+        name, _, weight = item.partition('=')
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def make_queries(count, vocabulary, seed):
+    """`count` queries from a `vocabulary`-sized pool, popular ones repeating as in real traffic (Zipf)"""
+    rng = random.Random(seed)
+    pool = [f'{adjective} {noun}' for adjective, noun in itertools.product(ADJECTIVES, NOUNS)]
+    rng.shuffle(pool)
+    pool = [pool[i % len(pool)] + (f' {i // len(pool)}' if i >= len(pool) else '') for i in range(vocabulary)]
+    return rng.choices(pool, weights=[1 / (rank + 1) for rank in range(len(pool))], k=count)
+
+def make_schedule(mix, count, vocabulary, seed):
+    """[(workload, query)] in a fixed order for a given seed"""
+    rng = random.Random(seed)
+    workloads = rng.choices(list(mix), weights=list(mix.values()), k=count)
+    queries = make_queries(count, vocabulary, seed + 1)
+    return list(zip(workloads, queries))
+
+def flask_driver(app, path, body):
+    """Send one POST per call with a test client per thread; succeeds on HTTP 200"""
+    local = threading.local()
+
+    def send(query):
+        client = getattr(local, 'client', None)
+        if client is None:
+            client = local.client = app.test_client()
+        return client.post(path, json=body(query)).status_code == 200
+    return send
+
+def load_mcp_server():
+    """Import MCP/server.py as a module, or return None when its dependencies are missing"""
+    spec = importlib.util.spec_from_file_location('mcp_server', os.path.join(ROOT, 'MCP', 'server.py'))
+    module = importlib.util.module_from_spec(spec)
+    try:
+        spec.loader.exec_module(module)
+    except ImportError as e:
+        print(f"Note: leaving the MCP workload out ({e}); install MCP/requirements.txt to include it\n")
+        return None
+    return module
+
+def mcp_driver(mcp_server):
+    """Call the MCP tool on an event loop of its own; succeeds when products were found"""
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, name='mcp-loop', daemon=True).start()
+
+    def send(query):
+        result = asyncio.run_coroutine_threadsafe(mcp_server.query_elasticsearch_products(query), loop).result()
+        return result.content[0].text.startswith('Found')
+    return send
+
+def build_drivers(url, concurrency):
+    from elasticsearch import Elasticsearch
+    import app as hybrid
+    import rules_app
+    import simple_app
+
+    # Size every client's connection pool for the worker threads
+    for module in (hybrid, simple_app, rules_app):
+        module.es = Elasticsearch(url, connections_per_node=concurrency)
+
+    drivers = {
+        'hybrid': flask_driver(hybrid.app, '/search', lambda query: {'query': query}),
+        'hybrid_rerank': flask_driver(hybrid.app, '/search', lambda query: {'query': query, 'enable_reranking': True}),
+        'hybrid_batch': flask_driver(hybrid.app, '/search/batch', lambda query: {
+            'searches': [{'query': f'{query} {variant}'.strip()} for variant in ('', 'sale', 'new', 'kids')]
+        }),
+        'synonyms': flask_driver(simple_app.app, '/search', lambda query: {'query': query, 'search_type': 'keyword'}),
+        'rules': flask_driver(rules_app.app, '/search', lambda query: {'query': query, 'search_type': 'rules'})
+    }
+    mcp_server = load_mcp_server()
+    if mcp_server is not None:
+        drivers['mcp'] = mcp_driver(mcp_server)
+    return drivers
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    position = (len(sorted_values) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def run_load(drivers, schedule, concurrency):
+    """Run the schedule from `concurrency` threads; returns ({workload: [(seconds, ok)]}, elapsed)"""
+    samples = {name: [] for name in drivers}
+    positions = itertools.count()
+
+    def worker():
+        local_samples = []
+        while True:
+            position = next(positions)
+            if position >= len(schedule):
+                return local_samples
+            workload, query = schedule[position]
+            start = time.perf_counter()
+            try:
+                ok = drivers[workload](query)
+            except Exception:
+                ok = False
+            local_samples.append((workload, time.perf_counter() - start, ok))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = [pool.submit(worker) for _ in range(concurrency)]
+    elapsed = time.perf_counter() - start
+
+    for result in results:
+        for workload, seconds, ok in result.result():
+            samples[workload].append((seconds, ok))
+    return samples, elapsed
+
+def measure_allocations(drivers, queries):
+    """{workload: (peak bytes, retained bytes)} per request, averaged over serial requests under tracemalloc"""
+    allocations = {}
+    tracemalloc.start()
+    try:
+        for workload, send in drivers.items():
+            peak_total = retained_total = 0
+            for query in queries:
+                tracemalloc.reset_peak()
+                before = tracemalloc.get_traced_memory()[0]
+                send(query)
+                after, peak = tracemalloc.get_traced_memory()
+                peak_total += peak - before
+                retained_total += after - before
+            allocations[workload] = (peak_total / len(queries), retained_total / len(queries))
+    finally:
+        tracemalloc.stop()
+    return allocations
+
+def summarize(samples, elapsed, allocations):
+    def stats(entries, elapsed):
+        latencies = sorted(seconds for seconds, _ in entries)
+        return {
+            'requests': len(entries),
+            'errors': sum(1 for _, ok in entries if not ok),
+            'throughput': len(entries) / elapsed,
+            'mean_ms': sum(latencies) / len(latencies) * 1000 if latencies else 0.0,
+            'p50_ms': percentile(latencies, 0.50) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'p99_ms': percentile(latencies, 0.99) * 1000
+        }
+
+    workloads = {}
+    for workload, entries in samples.items():
+        if not entries:
+            continue
+        workloads[workload] = stats(entries, elapsed)
+        peak, retained = allocations.get(workload, (None, None))
+        workloads[workload]['alloc_peak_kib'] = peak / 1024 if peak is not None else None
+        workloads[workload]['alloc_retained_bytes'] = retained
+
+    overall = stats([entry for entries in samples.values() for entry in entries], elapsed)
+    measured = [workloads[name]['requests'] for name in workloads if workloads[name]['alloc_peak_kib'] is not None]
+    if measured:
+        # Weighted by each workload's share of the mix
+        total = sum(measured)
+        for key in ('alloc_peak_kib', 'alloc_retained_bytes'):
+            overall[key] = sum(workloads[name][key] * workloads[name]['requests'] / total
+                               for name in workloads if workloads[name][key] is not None)
+    return workloads, overall
+
+def git_revision():
+    """(commit, dirty) of the checkout, or (None, None) outside a git repository"""
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        status = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=ROOT,
+                                capture_output=True, text=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+    return commit, bool(status.strip())
+
+def print_results(results):
+    commit = (results['commit'] or 'unknown')[:10] + (' (dirty)' if results['dirty'] else '')
+    config = results['config']
+    print(f"commit {commit}, fake ES latency {config['latency'] * 1000:.0f} ms, "
+          f"{config['concurrency']} threads, {config['requests']} requests\n")
+    print(f"{'workload':<16}{'requests':>9}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+          f"{'peak KiB/req':>14}{'retained B/req':>16}")
+    rows = list(results['workloads'].items()) + [('all', results['overall'])]
+    for name, row in rows:
+        peak = row.get('alloc_peak_kib')
+        retained = row.get('alloc_retained_bytes')
+        print(f"{name:<16}{row['requests']:>9,}{row['throughput']:>9,.1f}{row['p50_ms']:>9.2f}{row['p95_ms']:>9.2f}"
+              f"{row['p99_ms']:>9.2f}{row['errors']:>8,}"
+              f"{(f'{peak:,.1f}' if peak is not None else '-'):>14}"
+              f"{(f'{retained:,.0f}' if retained is not None else '-'):>16}")
+
+def print_comparison(base, new):
+    label = lambda results: (results['commit'] or 'unknown')[:10] + ('+' if results['dirty'] else '')
+    print(f"\n{label(base)} -> {label(new)}")
+    differing = [key for key in ('latency', 'inference_latency', 'concurrency', 'requests', 'mix', 'seed',
+                                 'vocabulary', 'recordings')
+                 if base['config'].get(key) != new['config'].get(key)]
+    if differing:
+        print(f"Warning: the runs used different settings ({', '.join(differing)}); the numbers are not comparable")
+
+    print(f"\n{'workload':<16}{'metric':<16}{'base':>12}{'new':>12}{'change':>10}")
+    rows = [(name, base['workloads'][name], new['workloads'][name])
+            for name in base['workloads'] if name in new['workloads']]
+    rows.append(('all', base['overall'], new['overall']))
+    for name, before, after in rows:
+        for key, metric, number, higher_is_better in COMPARED_METRICS:
+            if before.get(key) is None or after.get(key) is None:
+                continue
+            change = (after[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+            # Mark changes beyond 5% as better (+) or worse (!)
+            marker = ' ' if abs(change) < 5 else ('+' if (change > 0) == higher_is_better else '!')
+            print(f"{name:<16}{metric:<16}{number.format(before[key]):>12}{number.format(after[key]):>12}"
+                  f"{change:>+9.1f}%{marker}")
+            name = ''
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.01, help='fake ES latency in seconds')
+    parser.add_argument('--inference-latency', type=float, default=0.0,
+                        help='extra fake ES time for semantic queries and RERANK')
+    parser.add_argument('--hits', type=int, default=20, help='hits per generated search response')
+    parser.add_argument('--recordings', help='directory of responses recorded with record_es.py to replay')
+    parser.add_argument('--concurrency', type=int, default=16, help='client threads')
+    parser.add_argument('--requests', type=int, default=2000, help='timed requests across all workloads')
+    parser.add_argument('--warmup', type=int, default=200, help='untimed requests sent first')
+    parser.add_argument('--alloc-requests', type=int, default=50, help='traced requests per workload')
+    parser.add_argument('--mix', default=DEFAULT_MIX, help='comma-separated workload=weight pairs')
+    parser.add_argument('--vocabulary', type=int, default=500, help='distinct queries')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', nargs='+', metavar='RESULTS',
+                        help='results file to compare this run against, or two files to compare without running')
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) > 2:
+        parser.error('--compare takes one or two results files')
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[0]) as f:
+            base = json.load(f)
+        with open(args.compare[1]) as f:
+            new = json.load(f)
+        print_comparison(base, new)
+        return
+
+    fake_es = FakeElasticsearchProcess(latency=args.latency, inference_latency=args.inference_latency,
+                                       hits_per_page=args.hits,
+                                       recordings=os.path.abspath(args.recordings) if args.recordings else None)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+    os.environ.setdefault('ES_API_KEY', 'bench')
+    os.environ['SUGGEST_SOURCE'] = 'off'
+
+    try:
+        drivers = build_drivers(url, args.concurrency)
+        mix = {name: weight for name, weight in parse_mix(args.mix).items() if name in drivers and weight > 0}
+        unknown = set(parse_mix(args.mix)) - set(drivers) - {'mcp'}
+        if unknown:
+            parser.error(f"unknown workloads: {', '.join(sorted(unknown))} (choose from {', '.join(drivers)})")
+        drivers = {name: drivers[name] for name in mix}
+
+        run_load(drivers, make_schedule(mix, args.warmup, args.vocabulary, args.seed + 100), args.concurrency)
+        samples, elapsed = run_load(drivers, make_schedule(mix, args.requests, args.vocabulary, args.seed),
+                                    args.concurrency)
+        allocations = measure_allocations(drivers, make_queries(args.alloc_requests, args.vocabulary, args.seed + 200))
+    finally:
+        fake_es.stop()
+
+    workloads, overall = summarize(samples, elapsed, allocations)
+    commit, dirty = git_revision()
+    results = {
+        'commit': commit,
+        'dirty': dirty,
+        'measured_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'config': {
+            'latency': args.latency,
+            'inference_latency': args.inference_latency,
+            'hits': args.hits,
+            'recordings': args.recordings,
+            'concurrency': args.concurrency,
+            'requests': args.requests,
+            'warmup': args.warmup,
+            'alloc_requests': args.alloc_requests,
+            'mix': mix,
+            'vocabulary': args.vocabulary,
+            'seed': args.seed
+        },
+        'elapsed': elapsed,
+        'workloads': workloads,
+        'overall': overall
+    }
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {args.output}")
+    if args.compare:
+        with open(args.compare[0]) as f:
+            print_comparison(json.load(f), results)
+
+if __name__ == '__main__':
+    main()
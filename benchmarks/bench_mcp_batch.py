@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Benchmark: N query_elasticsearch_products calls vs. one query_elasticsearch_products_batch call.
+
+An agent comparing N products either calls the MCP server's single-query
+tool N times in a row or sends the N queries in one batch call, which runs
+them MCP_BATCH_CONCURRENCY at a time over the pooled client. Both run
+against a fake Elasticsearch answering ES|QL after --latency seconds (in its
+own process). Reports the time per agent turn and the size of the tool
+output. Tool-call round trips between the agent and the server are not
+included, so the real gap is larger.
+
+Needs the MCP server's dependencies (MCP/requirements.txt).
+
+Usage:
+    python benchmarks/bench_mcp_batch.py [--latency 0.05] [--queries 2 5 10] [--turns 20]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import load_mcp_server
+from fake_es import FakeElasticsearchProcess
+
+async def sequential(mcp_server, queries):
+    results = [await mcp_server.query_elasticsearch_products(query) for query in queries]
+    return sum(len(result.content[0].text) for result in results)
+
+async def batch(mcp_server, queries):
+    result = await mcp_server.query_elasticsearch_products_batch(queries)
+    return len(result.content[0].text)
+
+async def run(mcp_server, mode, size, turns):
+    """Return (sorted seconds per turn, output characters per turn)"""
+    await mode(mcp_server, ['warm up'])
+    latencies = []
+    for turn in range(turns):
+        queries = [f'product {turn} {n}' for n in range(size)]
+        start = time.perf_counter()
+        characters = await mode(mcp_server, queries)
+        latencies.append(time.perf_counter() - start)
+    await mcp_server.close_http_client()
+    return sorted(latencies), characters
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help='fake ES latency in seconds')
+    parser.add_argument('--queries', type=int, nargs='+', default=[2, 5, 10], help='queries per agent turn')
+    parser.add_argument('--turns', type=int, default=20, help='agent turns per setting')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearchProcess(latency=args.latency)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+    os.environ.setdefault('ES_API_KEY', 'bench')
+    os.environ['MCP_BATCH_MAX_QUERIES'] = str(max(args.queries))
+    # Both modes send the same queries; every call has to reach Elasticsearch
+    os.environ['MCP_CACHE_SIZE'] = '0'
+
+    mcp_server = load_mcp_server()
+    if mcp_server is None:
+        fake_es.stop()
+        sys.exit(1)
+
+    print(f"fake ES latency {args.latency * 1000:.0f} ms, batch concurrency {mcp_server.MCP_BATCH_CONCURRENCY}, "
+          f"{args.turns} turns per setting\n")
+    print(f"{'queries':<9}{'mode':<14}{'p50 ms':>9}{'p99 ms':>9}{'output chars':>14}")
+    try:
+        for size in args.queries:
+            for name, mode in (('sequential', sequential), ('batch', batch)):
+                latencies, characters = asyncio.run(run(mcp_server, mode, size, args.turns))
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                print(f"{size:<9}{name:<14}{latencies[len(latencies) // 2] * 1000:>9.1f}{p99 * 1000:>9.1f}"
+                      f"{characters:>14,}")
+    finally:
+        fake_es.stop()
+
+if __name__ == '__main__':
+    main()
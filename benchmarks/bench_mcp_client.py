@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Benchmark: MCP tool calls with a new HTTP client per call vs. the pooled client.
+
+Calls the MCP server's query_elasticsearch_products tool --calls times in a
+row against the fake Elasticsearch, served over HTTPS with a throwaway
+self-signed certificate (--plain for HTTP). "new client per call" closes the
+server's pooled client after every call, so each call builds a client, an SSL
+context and a connection, as the server did before it kept one client for its
+lifetime. Reports per-call latency.
+
+Most of a new client's cost is its SSL context: with --plain each one still
+loads certifi's CA bundle, while over HTTPS it only trusts the test
+certificate (SSL_CERT_FILE). The fake runs on localhost, so the TCP and TLS
+handshakes cost no network round trips here. Against a remote cluster each new connection also waits for
+those round trips, so the gap is larger.
+
+Needs the MCP server's dependencies (MCP/requirements.txt) and the openssl
+command line tool (for the certificate).
+
+Usage:
+    python benchmarks/bench_mcp_client.py [--latency 0.005] [--calls 200] [--plain]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import load_mcp_server
+from fake_es import FakeElasticsearchProcess
+
+def make_certificate(directory):
+    """Write a self-signed certificate for 127.0.0.1 to directory; returns (certfile, keyfile)"""
+    certfile = os.path.join(directory, 'cert.pem')
+    keyfile = os.path.join(directory, 'key.pem')
+    subprocess.run(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+                    '-keyout', keyfile, '-out', certfile, '-subj', '/CN=127.0.0.1',
+                    '-addext', 'subjectAltName=IP:127.0.0.1'], check=True, capture_output=True)
+    return certfile, keyfile
+
+async def timed_call(mcp_server, query, reuse):
+    start = time.perf_counter()
+    result = await mcp_server.query_elasticsearch_products(query)
+    elapsed = time.perf_counter() - start
+    assert result.content[0].text.startswith('Found'), result.content[0].text[:200]
+    if not reuse:
+        await mcp_server.close_http_client()
+    return elapsed
+
+async def run(mcp_server, reuse, calls):
+    """Return the sorted per-call latencies in seconds"""
+    # Warm up imports and caches outside the measurement
+    await timed_call(mcp_server, 'warm up', reuse)
+    latencies = [await timed_call(mcp_server, f'query {n}', reuse) for n in range(calls)]
+    await mcp_server.close_http_client()
+    return sorted(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.005, help='fake ES latency in seconds')
+    parser.add_argument('--calls', type=int, default=200, help='tool calls per mode')
+    parser.add_argument('--plain', action='store_true', help='serve plain HTTP instead of HTTPS')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        options = {'latency': args.latency}
+        if not args.plain:
+            options['certfile'], options['keyfile'] = make_certificate(tmp)
+            # httpx trusts the certificates in SSL_CERT_FILE
+            os.environ['SSL_CERT_FILE'] = options['certfile']
+
+        fake_es = FakeElasticsearchProcess(**options)
+        url = fake_es.start()
+        os.environ['ES_URL'] = url
+        os.environ.setdefault('ES_API_KEY', 'bench')
+        # Both modes send the same queries; every call has to reach Elasticsearch
+        os.environ['MCP_CACHE_SIZE'] = '0'
+
+        mcp_server = load_mcp_server()
+        if mcp_server is None:
+            fake_es.stop()
+            sys.exit(1)
+
+        print(f"fake ES at {url}, latency {args.latency * 1000:.0f} ms, {args.calls} calls per mode\n")
+        print(f"{'mode':<22}{'mean ms':>9}{'p50 ms':>9}{'p99 ms':>9}")
+        try:
+            for mode, reuse in (('new client per call', False), ('pooled client', True)):
+                latencies = asyncio.run(run(mcp_server, reuse, args.calls))
+                p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+                print(f"{mode:<22}{sum(latencies) / len(latencies) * 1000:>9.2f}"
+                      f"{latencies[len(latencies) // 2] * 1000:>9.2f}{p99 * 1000:>9.2f}")
+        finally:
+            fake_es.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Benchmark: MCP tool latency and output size per output format, with and without the result cache.
+
+Calls query_elasticsearch_products --calls times over --distinct different
+queries (so with the cache on, all but the first call of each query are
+hits) against a fake Elasticsearch answering ES|QL after --latency seconds.
+Each setting is one of the output formats, optionally with a fields/limit
+projection. "json, no cache" is the tool's behaviour before the cache and
+the compact formats. Reports latency, the time to lay out and encode one
+result and the output size (characters, and roughly 4 characters per token).
+
+Needs the MCP server's dependencies (MCP/requirements.txt).
+
+Usage:
+    python benchmarks/bench_mcp_output.py [--latency 0.05] [--calls 200] [--distinct 20]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import load_mcp_server
+from fake_es import FakeElasticsearchProcess, make_esql_response
+
+# (name, tool arguments, cache on)
+SETTINGS = [
+    ('json, no cache', {'output_format': 'json'}, False),
+    ('json', {'output_format': 'json'}, True),
+    ('truncated', {'output_format': 'truncated'}, True),
+    ('columnar', {'output_format': 'columnar'}, True),
+    ('columnar, 3 fields, limit 5', {'output_format': 'columnar', 'limit': 5,
+                                     'fields': ['product_id', 'product_name', 'final_price']}, True)
+]
+
+async def run(mcp_server, arguments, calls, distinct):
+    """Return (sorted latencies, output characters of the last call)"""
+    mcp_server.result_cache.clear()
+    latencies = []
+    for n in range(calls):
+        start = time.perf_counter()
+        result = await mcp_server.query_elasticsearch_products(f'product {n % distinct}', **arguments)
+        latencies.append(time.perf_counter() - start)
+        assert result.content[0].text.startswith('Found'), result.content[0].text[:200]
+    await mcp_server.close_http_client()
+    return sorted(latencies), len(result.content[0].text)
+
+def serialize_seconds(mcp_server, arguments, iterations=2000):
+    """Mean seconds to lay out and encode one result the way the tool does"""
+    fields = arguments.get('fields', mcp_server.PRODUCT_FIELDS)
+    response = make_esql_response(['_score', *fields], arguments.get('limit', mcp_server.DEFAULT_LIMIT))
+    columns = [column['name'] for column in response['columns']]
+    output_format = arguments['output_format']
+    start = time.perf_counter()
+    for _ in range(iterations):
+        products = mcp_server.format_products(columns, response['values'], output_format)
+        json.dumps(products, indent=2) if output_format == 'json' else mcp_server.dumps(products)
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.05, help='fake ES latency in seconds')
+    parser.add_argument('--calls', type=int, default=200, help='tool calls per setting')
+    parser.add_argument('--distinct', type=int, default=20, help='different queries among the calls')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearchProcess(latency=args.latency)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+    os.environ.setdefault('ES_API_KEY', 'bench')
+
+    mcp_server = load_mcp_server()
+    if mcp_server is None:
+        fake_es.stop()
+        sys.exit(1)
+    cache_size = mcp_server.result_cache.max_entries
+
+    print(f"fake ES latency {args.latency * 1000:.0f} ms, {args.calls} calls over {args.distinct} queries per setting\n")
+    print(f"{'setting':<30}{'mean ms':>9}{'p50 ms':>9}{'p99 ms':>9}{'encode us':>11}{'chars':>8}{'~tokens':>9}")
+    try:
+        for name, arguments, cache in SETTINGS:
+            mcp_server.result_cache.max_entries = cache_size if cache else 0
+            latencies, characters = asyncio.run(run(mcp_server, arguments, args.calls, args.distinct))
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            encode = serialize_seconds(mcp_server, arguments)
+            print(f"{name:<30}{sum(latencies) / len(latencies) * 1000:>9.2f}{latencies[len(latencies) // 2] * 1000:>9.2f}"
+                  f"{p99 * 1000:>9.2f}{encode * 1e6:>11.1f}{characters:>8,}{characters // 4:>9,}")
+    finally:
+        fake_es.stop()
+
+if __name__ == '__main__':
+    main()
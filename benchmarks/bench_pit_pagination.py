@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark: paging 100k results with point in time + search_after.
+
+Runs pagination.iter_pages() and the /search/export endpoint against the fake
+Elasticsearch for several page sizes and reports throughput and peak Python
+memory (tracemalloc), which stays flat as the number of results grows because
+only one page is held at a time. from/size cannot be compared directly: ES
+rejects from + size beyond index.max_result_window (10,000 by default).
+
+Usage:
+    python benchmarks/bench_pit_pagination.py [--docs 100000] [--page-sizes 100 1000 5000] [--latency 0.002]
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+# Add the repository root to the path so we can import the apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearch
+
+def measure(func):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = func()
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=100000)
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[100, 1000, 5000])
+    parser.add_argument('--latency', type=float, default=0.002, help='fake ES latency per page in seconds')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(latency=args.latency, total_docs=args.docs)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+
+    from elasticsearch import Elasticsearch
+    import app as hybrid
+    from hybrid_query import generate_standard_query
+    from pagination import iter_pages
+
+    es = Elasticsearch(url)
+    hybrid.es = es
+    body = generate_standard_query('dog bed', hybrid.DEFAULT_WEIGHTS, ['description', 'product_name'])
+    client = hybrid.app.test_client()
+
+    print(f"{args.docs} matching docs, fake ES latency {args.latency * 1000:.1f} ms per page\n")
+    print(f"{'path':<22}{'page size':>10}{'pages':>8}{'docs/s':>12}{'peak MB':>10}")
+
+    for page_size in args.page_sizes:
+        pages = -(-args.docs // page_size)
+
+        def run_iter_pages():
+            count = 0
+            for hits in iter_pages(es, hybrid.INDEX_NAME, body, page_size,
+                                   source_fields=hybrid.PRODUCT_CARD_FIELDS):
+                count += len(hits)
+            return count
+
+        count, elapsed, peak = measure(run_iter_pages)
+        assert count == args.docs, count
+        print(f"{'iter_pages':<22}{page_size:>10}{pages:>8}{count / elapsed:>12.0f}{peak / 1e6:>10.1f}")
+
+        def run_export():
+            response = client.post('/search/export', json={'query': 'dog bed', 'page_size': page_size})
+            count = 0
+            for line in response.response:
+                count += 1
+            return count
+
+        count, elapsed, peak = measure(run_export)
+        assert count == args.docs, count
+        print(f"{'/search/export':<22}{page_size:>10}{pages:>8}{count / elapsed:>12.0f}{peak / 1e6:>10.1f}")
+
+    assert not fake_es.open_pits, f"PITs left open: {fake_es.open_pits}"
+    fake_es.stop()
+
+if __name__ == '__main__':
+    main()
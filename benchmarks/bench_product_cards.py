@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark: ID-only searches hydrated from the product-card store.
+
+Sends --requests distinct /search queries (the result cache is cleared before
+each, so every request reaches Elasticsearch) to the Hybrid Search App backed
+by the fake Elasticsearch, once with full _source card projections and once
+with PRODUCT_CARD_STORE on. The fake returns the same popular products for
+every query, as a catalogue's best sellers keep coming back. Reports latency,
+Elasticsearch requests and response bytes per search.
+
+Usage:
+    python benchmarks/bench_product_cards.py [--latency 0.005] [--requests 200] [--hits 20]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the repository root to the path so we can import the apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearch
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.005, help='fake ES latency in seconds')
+    parser.add_argument('--requests', type=int, default=200, help='searches per mode')
+    parser.add_argument('--hits', type=int, default=20, help='hits per search')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(latency=args.latency, hits_per_page=args.hits)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+    os.environ['SUGGEST_SOURCE'] = 'off'
+
+    from elasticsearch import Elasticsearch
+    import app as hybrid
+    from product_cards import ProductCardStore
+
+    hybrid.es = Elasticsearch(url)
+    client = hybrid.app.test_client()
+
+    print(f"fake ES latency {args.latency * 1000:.0f} ms, {args.hits} hits per search, {args.requests} searches\n")
+    print(f"{'mode':<14}{'ms/search':>11}{'ES req/search':>15}{'ES bytes/search':>17}")
+
+    for mode in ('full _source', 'card store'):
+        hybrid.card_store = ProductCardStore(hybrid.INDEX_NAME) if mode == 'card store' else None
+        requests_before = fake_es.request_count
+        bytes_before = fake_es.response_bytes
+
+        start = time.perf_counter()
+        for n in range(args.requests):
+            hybrid.search_cache.clear()
+            response = client.post('/search', json={'query': f'query {n}'})
+            assert response.get_json()['success'], response.get_json()
+        elapsed = (time.perf_counter() - start) / args.requests
+
+        print(f"{mode:<14}{elapsed * 1000:>11.2f}{(fake_es.request_count - requests_before) / args.requests:>15.2f}"
+              f"{(fake_es.response_bytes - bytes_before) / args.requests:>17,.0f}")
+
+    fake_es.stop()
+
+if __name__ == '__main__':
+    main()
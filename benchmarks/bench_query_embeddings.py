@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: inference calls per hybrid search with the query embedding cache.
+
+Replays a Zipf-distributed query stream (a few head queries, a long tail)
+through /search against the fake Elasticsearch. Without QUERY_EMBEDDINGS every
+search makes the cluster embed the query text once per semantic field (six
+inference computations); with it the app makes at most one inference call per
+model and none for queries it has embedded before. The /search result cache is
+cleared before every request so that each one builds its query. The fake
+Elasticsearch adds --inference-latency seconds to searches with semantic match
+clauses and to inference calls.
+
+Usage:
+    python benchmarks/bench_query_embeddings.py [--latency 0.01] [--inference-latency 0.02]
+                                                [--requests 500] [--distinct 100]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add the repository root to the path so we can import the apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearch
+
+def query_stream(count, distinct, seed=11):
+    rng = random.Random(seed)
+    weights = [1 / rank for rank in range(1, distinct + 1)]
+    return rng.choices([f'query {n}' for n in range(distinct)], weights=weights, k=count)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.01, help='fake ES search latency in seconds')
+    parser.add_argument('--inference-latency', type=float, default=0.02, help='fake inference latency in seconds')
+    parser.add_argument('--requests', type=int, default=500)
+    parser.add_argument('--distinct', type=int, default=100, help='distinct query texts in the stream')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(latency=args.latency, inference_latency=args.inference_latency)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+    os.environ['QUERY_EMBEDDINGS'] = 'true'
+    os.environ.setdefault('ELSER_INFERENCE_ID', '.elser-2-elasticsearch')
+    os.environ.setdefault('EMBEDDING_INFERENCE_ID', 'google_vertex_ai_embeddings')
+    os.environ.setdefault('E5_INFERENCE_ID', '.multilingual-e5-small-elasticsearch')
+
+    from elasticsearch import Elasticsearch
+    import app as hybrid
+
+    hybrid.es = Elasticsearch(url)
+    client = hybrid.app.test_client()
+    queries = query_stream(args.requests, args.distinct)
+    embeddings = hybrid.query_embeddings
+
+    print(f"{args.requests} searches over {args.distinct} distinct queries, ES latency {args.latency * 1000:.0f} ms, "
+          f"inference latency {args.inference_latency * 1000:.0f} ms\n")
+    print(f"{'mode':<30}{'inference calls':>17}{'per search':>12}{'ms/search':>11}")
+
+    for label, query_embeddings in [('match (on-cluster inference)', None), ('QUERY_EMBEDDINGS=true', embeddings)]:
+        hybrid.query_embeddings = query_embeddings
+        start = time.perf_counter()
+        for query in queries:
+            hybrid.search_cache.clear()
+            assert client.post('/search', json={'query': query}).get_json()['success']
+        elapsed = time.perf_counter() - start
+        # The cluster embeds the query text once per semantic match clause
+        calls = embeddings.inference_calls if query_embeddings else 6 * len(queries)
+        print(f"{label:<30}{calls:>17}{calls / len(queries):>12.2f}{elapsed / len(queries) * 1000:>11.1f}")
+
+    fake_es.stop()
+
+if __name__ == '__main__':
+    main()
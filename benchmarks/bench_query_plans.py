@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Benchmark: adaptive query plans vs. the full hybrid query.
+
+Sends a mix of SKU-shaped, natural-language and mixed queries through /search
+against the fake Elasticsearch, once with ADAPTIVE_QUERY_PLANS off (every query
+gets semantic, multi_match, term, prefix and leading-wildcard clauses) and once
+with it on. The fake Elasticsearch adds --inference-latency seconds to
+searches with semantic match clauses and --wildcard-latency seconds to
+searches with a leading wildcard, standing in for what those clauses cost on a
+real cluster. Reports latency, clauses and body size per query class.
+
+Usage:
+    python benchmarks/bench_query_plans.py [--latency 0.01] [--inference-latency 0.03]
+                                           [--wildcard-latency 0.02] [--requests 100]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+# Add the repository root to the path so we can import the apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearch
+
+QUERIES = {
+    'identifier': ['sw2211', 'P000123', 'ABC-1234', 'sz2305171265', 'M-42/B'],
+    'prose': ['dog bed', 'summer floral dress', 'wireless earbuds with case', 'red shoes', 'kitchen knife set'],
+    'mixed': ['sw2211 dress', 'iphone 15 case', 'size 10 boots', 'P000123 blue', 'usb c 3.1 cable']
+}
+
+def count_clauses(body):
+    query = body.get('query', {}).get('bool', {})
+    return len(query.get('should', []))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.01, help='fake ES search latency in seconds')
+    parser.add_argument('--inference-latency', type=float, default=0.03,
+                        help='extra latency of a search with semantic match clauses')
+    parser.add_argument('--wildcard-latency', type=float, default=0.02,
+                        help='extra latency of a search with leading-wildcard clauses')
+    parser.add_argument('--requests', type=int, default=100, help='searches per query class and mode')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(latency=args.latency, inference_latency=args.inference_latency,
+                                wildcard_latency=args.wildcard_latency)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+
+    from elasticsearch import Elasticsearch
+    import app as hybrid
+    import hybrid_query
+
+    hybrid.es = Elasticsearch(url)
+    client = hybrid.app.test_client()
+
+    print(f"fake ES latency {args.latency * 1000:.0f} ms, semantic +{args.inference_latency * 1000:.0f} ms, "
+          f"leading wildcard +{args.wildcard_latency * 1000:.0f} ms, {args.requests} searches per class\n")
+    print(f"{'class':<12}{'plans':<10}{'ms/search':>11}{'clauses':>9}{'body bytes':>12}")
+
+    for query_class, queries in QUERIES.items():
+        for adaptive in (False, True):
+            hybrid_query.ADAPTIVE_QUERY_PLANS = adaptive
+            body = hybrid.render_hybrid_query(queries[0], hybrid.DEFAULT_WEIGHTS, hybrid.TEXT_FIELDS[:2])
+
+            start = time.perf_counter()
+            for n in range(args.requests):
+                hybrid.search_cache.clear()
+                response = client.post('/search', json={'query': queries[n % len(queries)]})
+                assert response.get_json()['success'], response.get_json()
+            elapsed = (time.perf_counter() - start) / args.requests
+
+            print(f"{query_class:<12}{'adaptive' if adaptive else 'full':<10}{elapsed * 1000:>11.1f}"
+                  f"{count_clauses(fake_es.last_search_body):>9}{len(body.encode('utf-8')):>12}")
+
+    fake_es.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the compiled hybrid query templates.
+
+Compares building the query dict with generate_hybrid_query() and serializing it
+(what /search used to do on every request) against render_hybrid_query(), which
+fills a memoized, pre-serialized template.
+
+Usage:
+    python benchmarks/bench_query_templates.py [--iterations 20000]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+
+# Add the repository root to the path so we can import the query builders
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from hybrid_query import generate_hybrid_query, render_hybrid_query, query_template_cache_info
+
+WEIGHTS = {
+    'description_semantic_elser': 2,
+    'description_semantic_google': 2.5,
+    'description_semantic_e5': 2,
+    'product_name_semantic_elser': 2,
+    'product_name_semantic_google': 2.5,
+    'product_name_semantic_e5': 2,
+    'multi_match': 2,
+    'model_number': 2.9,
+    'product_id': 2.9
+}
+MULTI_MATCH_FIELDS = ['description', 'product_name']
+QUERIES = ['dog bed', 'wireless headphones', 'summer dress "linen"', 'SKU-12345']
+
+def build_and_serialize(query_text, enable_reranking):
+    body = generate_hybrid_query(query_text, WEIGHTS, MULTI_MATCH_FIELDS, enable_reranking)
+    return json.dumps(body, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+def render(query_text, enable_reranking):
+    return render_hybrid_query(query_text, WEIGHTS, MULTI_MATCH_FIELDS, enable_reranking).encode('utf-8')
+
+def run(iterations):
+    print(f"{'builder':<28}{'rerank':<8}{'us/call':>10}{'speedup':>10}")
+    for enable_reranking in (False, True):
+        # Sanity check: both paths must produce the same request body
+        for query_text in QUERIES:
+            assert json.loads(render(query_text, enable_reranking)) == \
+                json.loads(build_and_serialize(query_text, enable_reranking))
+
+        results = {}
+        for name, func in (('generate_hybrid_query+dumps', build_and_serialize),
+                           ('render_hybrid_query', render)):
+            elapsed = min(timeit.repeat(
+                lambda: [func(q, enable_reranking) for q in QUERIES],
+                number=iterations // len(QUERIES),
+                repeat=3
+            ))
+            results[name] = elapsed / iterations * 1e6
+
+        baseline = results['generate_hybrid_query+dumps']
+        for name, per_call in results.items():
+            print(f"{name:<28}{str(enable_reranking):<8}{per_call:>10.2f}{baseline / per_call:>9.1f}x")
+
+    print(f"\nTemplate cache: {query_template_cache_info()}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=20000)
+    args = parser.parse_args()
+    run(args.iterations)
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Benchmark: MCP tool latency at different RERANK window sizes.
+
+The MCP server's ES|QL reranks the top RERANK_WINDOW_SIZE matches for the
+query. A larger window lets the reranker lift good products from further
+down the match list, but every row in it is one more inference the reranker
+runs. This calls query_elasticsearch_products --calls times per window size
+(result cache off) against a fake Elasticsearch answering after --latency
+seconds plus --rerank-doc-latency seconds per reranked row, and reports the
+latency at each size. The fake ranks nothing, so measure the quality side
+against a real cluster, e.g. with record_es.py recordings of each setting.
+
+Needs the MCP server's dependencies (MCP/requirements.txt).
+
+Usage:
+    python benchmarks/bench_rerank_window.py [--latency 0.02] [--rerank-doc-latency 0.002]
+                                             [--windows 10 20 50 100] [--calls 50]
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from bench_load import load_mcp_server
+from fake_es import FakeElasticsearchProcess
+
+async def run(mcp_server, calls):
+    """Return the sorted per-call latencies in seconds"""
+    limit = min(mcp_server.DEFAULT_LIMIT, mcp_server.RERANK_WINDOW_SIZE)
+    await mcp_server.query_elasticsearch_products('warm up', limit=limit)
+    latencies = []
+    for n in range(calls):
+        start = time.perf_counter()
+        result = await mcp_server.query_elasticsearch_products(f'query {n}', limit=limit)
+        latencies.append(time.perf_counter() - start)
+        assert result.content[0].text.startswith('Found'), result.content[0].text[:200]
+    await mcp_server.close_http_client()
+    return sorted(latencies)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.02, help='fake ES latency in seconds')
+    parser.add_argument('--rerank-doc-latency', type=float, default=0.002, help='fake RERANK seconds per row')
+    parser.add_argument('--windows', type=int, nargs='+', default=[10, 20, 50, 100], help='window sizes to compare')
+    parser.add_argument('--calls', type=int, default=50, help='tool calls per window size')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearchProcess(latency=args.latency, rerank_doc_latency=args.rerank_doc_latency)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+    os.environ.setdefault('ES_API_KEY', 'bench')
+    os.environ['MCP_CACHE_SIZE'] = '0'
+
+    mcp_server = load_mcp_server()
+    if mcp_server is None:
+        fake_es.stop()
+        sys.exit(1)
+
+    print(f"fake ES latency {args.latency * 1000:.0f} ms + {args.rerank_doc_latency * 1000:g} ms per reranked row, "
+          f"{args.calls} calls per window\n")
+    print(f"{'window':<8}{'mean ms':>9}{'p50 ms':>9}{'p99 ms':>9}")
+    try:
+        for window in args.windows:
+            mcp_server.RERANK_WINDOW_SIZE = window
+            latencies = asyncio.run(run(mcp_server, args.calls))
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+            print(f"{window:<8}{sum(latencies) / len(latencies) * 1000:>9.2f}"
+                  f"{latencies[len(latencies) // 2] * 1000:>9.2f}{p99 * 1000:>9.2f}")
+    finally:
+        fake_es.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the shared result mapper.
+
+Converts a 1,000-hit response into product cards and serializes it, comparing
+the per-hit dict building + Flask's default json.dumps (sorted keys) the apps
+used before against result_mapper.map_hits() + result_mapper.dumps() (orjson
+when installed). Reports time per response and peak Python memory.
+
+Usage:
+    python benchmarks/bench_result_mapper.py [--hits 1000] [--iterations 200]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import tracemalloc
+
+# Add the repository root to the path so we can import the mapper
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import make_search_response
+from result_mapper import dumps, map_hits, orjson
+
+def hit_to_product(hit):
+    """The per-hit conversion the apps used before result_mapper"""
+    if '_source' in hit:
+        source = hit['_source']
+    else:
+        source = {}
+        for field in hit.get('fields', {}):
+            values = hit['fields'][field]
+            source[field] = values[0] if isinstance(values, list) and len(values) > 0 else values
+
+    product = {
+        'id': hit['_id'],
+        'score': hit['_score'],
+        'product_id': source.get('product_id', ''),
+        'product_name': source.get('product_name', ''),
+        'description': source.get('description', ''),
+        'main_image': source.get('main_image', ''),
+        'final_price': source.get('final_price', 0),
+        'currency': source.get('currency', ''),
+        'rating': source.get('rating', 0),
+        'reviews_count': source.get('reviews_count', 0),
+        'in_stock': source.get('in_stock', False),
+        'model_number': source.get('model_number', '')
+    }
+    if 'highlight' in hit:
+        product['highlights'] = hit['highlight']
+    return product
+
+def old_path(response):
+    products = [hit_to_product(hit) for hit in response['hits']['hits']]
+    # Flask's DefaultJSONProvider: sort_keys=True, ensure_ascii=True
+    return json.dumps({'success': True, 'products': products}, sort_keys=True, separators=(',', ':'))
+
+def new_path(response):
+    return dumps({'success': True, 'products': map_hits(response['hits']['hits'])})
+
+def peak_memory(func, response):
+    tracemalloc.start()
+    func(response)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return peak
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--hits', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=200)
+    args = parser.parse_args()
+
+    print(f"{args.hits} hits, {args.iterations} iterations, encoder: {'orjson' if orjson else 'json'}\n")
+    print(f"{'response format':<18}{'path':<22}{'ms/response':>12}{'peak KB':>10}{'speedup':>9}")
+
+    for use_fields in (False, True):
+        response = make_search_response(args.hits, use_fields=use_fields)
+        assert json.loads(old_path(response))['products'][0]['product_id'] == \
+            json.loads(new_path(response))['products'][0]['product_id']
+
+        label = 'fields' if use_fields else '_source'
+        old = timeit.timeit(lambda: old_path(response), number=args.iterations) / args.iterations
+        new = timeit.timeit(lambda: new_path(response), number=args.iterations) / args.iterations
+        print(f"{label:<18}{'hit_to_product+json':<22}{old * 1000:>12.2f}{peak_memory(old_path, response) / 1024:>10.0f}")
+        print(f"{label:<18}{'map_hits+dumps':<22}{new * 1000:>12.2f}{peak_memory(new_path, response) / 1024:>10.0f}"
+              f"{old / new:>8.1f}x")
+
+if __name__ == '__main__':
+    main()
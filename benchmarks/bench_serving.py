@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Load test: run_apps.sh's three Flask dev servers vs. the gunicorn entry point.
+
+Starts the three apps the way run_apps.sh does (one `app.run(debug=True)`
+process each, without the reloader) and then serve.py under gunicorn with
+--workers worker processes (gunicorn.conf.py; threaded WSGI workers, and
+uvicorn workers with --asgi), all against a fake Elasticsearch with fixed
+latency running in its own process. Each setup gets --concurrency keep-alive
+connections spread over the three ports, every one sending /search requests
+back to back for --duration seconds after --warmup seconds. The result cache
+is disabled, so every request reaches Elasticsearch. Reports throughput,
+p50/p99 latency and errors.
+
+Usage:
+    python benchmarks/bench_serving.py [--latency 0.01] [--concurrency 64] [--duration 10]
+                                       [--workers 4] [--asgi]
+"""
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearchProcess
+
+PORTS = {'HYBRID_PORT': 18080, 'SYNONYM_PORT': 18046, 'RULES_PORT': 18047}
+
+DEV_SERVER = "import {module}; {module}.app.run(debug=True, use_reloader=False, host='127.0.0.1', port={port})"
+
+# /search body per port
+SEARCH_TYPES = {18080: {}, 18046: {'search_type': 'keyword'}, 18047: {'search_type': 'rules'}}
+
+def start_dev_servers(env):
+    return [subprocess.Popen([sys.executable, '-c', DEV_SERVER.format(module=module, port=port)], cwd=ROOT, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            for module, port in (('app', 18080), ('simple_app', 18046), ('rules_app', 18047))]
+
+def start_gunicorn(env, workers, mode):
+    env = {**env, **{name: str(port) for name, port in PORTS.items()},
+           'SERVE_HOST': '127.0.0.1', 'WEB_CONCURRENCY': str(workers), 'SERVE_MODE': mode}
+    return [subprocess.Popen([sys.executable, '-m', 'gunicorn'], cwd=ROOT, env=env,
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)]
+
+async def wait_ready(session, timeout=60):
+    deadline = time.monotonic() + timeout
+    for port in SEARCH_TYPES:
+        while True:
+            try:
+                async with session.get(f'http://127.0.0.1:{port}/metrics') as response:
+                    if response.status == 200:
+                        break
+            except aiohttp.ClientError:
+                pass
+            if time.monotonic() > deadline:
+                raise RuntimeError(f'port {port} did not come up')
+            await asyncio.sleep(0.2)
+
+async def run_load(concurrency, warmup, duration):
+    """Return (latencies of the requests completed in the measured window, errors, seconds measured)"""
+    latencies = []
+    errors = 0
+    connector = aiohttp.TCPConnector(limit=concurrency)
+    async with aiohttp.ClientSession(connector=connector) as session:
+        await wait_ready(session)
+        started = time.monotonic()
+        measure_from = started + warmup
+        stop_at = measure_from + duration
+
+        async def client(n):
+            nonlocal errors
+            port = list(SEARCH_TYPES)[n % len(SEARCH_TYPES)]
+            url = f'http://127.0.0.1:{port}/search'
+            i = 0
+            while time.monotonic() < stop_at:
+                i += 1
+                start = time.monotonic()
+                try:
+                    async with session.post(url, json={'query': f'query {n} {i}', **SEARCH_TYPES[port]}) as response:
+                        await response.read()
+                        ok = response.status == 200
+                except aiohttp.ClientError:
+                    ok = False
+                if start >= measure_from and time.monotonic() <= stop_at:
+                    latencies.append(time.monotonic() - start)
+                    errors += not ok
+
+        await asyncio.gather(*(client(n) for n in range(concurrency)))
+    return sorted(latencies), errors, duration
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--latency', type=float, default=0.01, help='fake ES latency in seconds')
+    parser.add_argument('--concurrency', type=int, default=64, help='client connections across the three ports')
+    parser.add_argument('--duration', type=float, default=10, help='measured seconds per setup')
+    parser.add_argument('--warmup', type=float, default=2, help='unmeasured seconds per setup')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn worker processes')
+    parser.add_argument('--asgi', action='store_true', help='also run gunicorn with SERVE_MODE=asgi')
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearchProcess(latency=args.latency)
+    url = fake_es.start()
+    env = {**os.environ, 'ES_URL': url, 'ES_API_KEY': 'bench', 'SEARCH_CACHE_SIZE': '0', 'SUGGEST_SOURCE': 'off'}
+
+    setups = [('run_apps.sh (3 dev servers)', lambda: start_dev_servers(env)),
+              (f'gunicorn wsgi x{args.workers}', lambda: start_gunicorn(env, args.workers, 'wsgi'))]
+    if args.asgi:
+        setups.append((f'gunicorn asgi x{args.workers}', lambda: start_gunicorn(env, args.workers, 'asgi')))
+
+    print(f"fake ES latency {args.latency * 1000:.0f} ms, {args.concurrency} connections, "
+          f"{args.duration:.0f} s per setup, {os.cpu_count()} CPUs\n")
+    print(f"{'setup':<30}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+
+    try:
+        for name, start in setups:
+            processes = start()
+            try:
+                latencies, errors, elapsed = asyncio.run(run_load(args.concurrency, args.warmup, args.duration))
+            finally:
+                for process in processes:
+                    process.terminate()
+                for process in processes:
+                    process.wait(timeout=60)
+            p50 = latencies[len(latencies) // 2] if latencies else 0.0
+            p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] if latencies else 0.0
+            print(f"{name:<30}{len(latencies) / elapsed:>10,.1f}{p50 * 1000:>10.2f}{p99 * 1000:>10.2f}{errors:>8,}")
+    finally:
+        fake_es.stop()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Benchmark: /suggest latency from the in-memory prefix index.
+
+Builds the suggestion index from a fake Elasticsearch holding --docs products
+and reports the build time and p50/p95/p99 latency of SuggestionIndex.suggest()
+and of the whole GET /suggest request (Flask test client) for one- to
+eight-character prefixes. Neither touches Elasticsearch once the index is built.
+
+Usage:
+    python benchmarks/bench_suggest.py [--docs 50000] [--lookups 5000]
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+# Add the repository root to the path so we can import the apps
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import FakeElasticsearch, make_product
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return [samples[min(len(samples) - 1, int(len(samples) * p))] * 1e6 for p in (0.5, 0.95, 0.99)]
+
+def prefixes(docs, count, seed=3):
+    rng = random.Random(seed)
+    for _ in range(count):
+        product = make_product(rng.randrange(docs))
+        value = product[rng.choice(['product_name', 'model_number', 'product_id'])]
+        yield value[:rng.randint(1, 8)]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--docs', type=int, default=50000, help='products in the fake index')
+    parser.add_argument('--lookups', type=int, default=5000)
+    args = parser.parse_args()
+
+    fake_es = FakeElasticsearch(latency=0, total_docs=args.docs)
+    url = fake_es.start()
+    os.environ['ES_URL'] = url
+    os.environ['SUGGEST_SOURCE'] = 'off'
+
+    from elasticsearch import Elasticsearch
+    import app as hybrid
+
+    hybrid.es = Elasticsearch(url)
+    index = hybrid.suggestion_index
+    start = time.perf_counter()
+    index.rebuild(hybrid.es)
+    print(f"built from {args.docs} products in {time.perf_counter() - start:.2f} s, "
+          f"{index.info()['entries']} entries\n")
+
+    queries = list(prefixes(args.docs, args.lookups))
+    print(f"{'path':<26}{'p50 us':>9}{'p95 us':>9}{'p99 us':>9}")
+
+    samples = []
+    for prefix in queries:
+        start = time.perf_counter()
+        index.suggest(prefix, 10)
+        samples.append(time.perf_counter() - start)
+    print(f"{'SuggestionIndex.suggest':<26}" + ''.join(f'{value:>9.1f}' for value in percentiles(samples)))
+
+    hybrid.SUGGEST_SOURCE = 'memory'
+    client = hybrid.app.test_client()
+    samples = []
+    for prefix in queries:
+        start = time.perf_counter()
+        response = client.get('/suggest', query_string={'q': prefix})
+        samples.append(time.perf_counter() - start)
+        assert response.get_json()['success']
+    print(f"{'GET /suggest':<26}" + ''.join(f'{value:>9.1f}' for value in percentiles(samples)))
+
+    fake_es.stop()
+
+if __name__ == '__main__':
+    main()
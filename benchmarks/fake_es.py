@@ -0,0 +1,570 @@
+"""
+Minimal Elasticsearch stand-in for benchmarks.
+
+Serves canned responses for the endpoints the apps call (_search, _msearch,
+ES|QL _query, point in time, index stats, the inference API, _bulk, index
+create/delete, aliases, _reindex tasks, the root info endpoint) after a
+configurable delay, using aiohttp so that it can hold thousands of requests in
+flight without becoming the bottleneck. Searches against a PIT page through
+`total_docs` generated products using search_after.
+
+Responses recorded from a real cluster with record_es.py can be replayed
+instead of the generated ones: pass the recordings directory and plain
+searches, _msearch items and ES|QL queries answer with the recorded bodies in
+rotation.
+
+    server = FakeElasticsearch(latency=0.05, recordings='benchmarks/recordings')
+    url = server.start()   # runs in a background thread
+    ...
+    server.stop()
+
+FakeElasticsearchProcess(**options) serves it from a child process instead, so
+that it neither competes with the code under test for the GIL nor shows up in
+its allocations.
+"""
+
+import asyncio
+import fnmatch
+import json
+import multiprocessing
+import os
+import re
+import ssl
+import threading
+
+from aiohttp import web
+
+PRODUCT_FIELDS = [
+    'product_id', 'product_name', 'description', 'main_image', 'final_price',
+    'currency', 'rating', 'reviews_count', 'in_stock', 'model_number'
+]
+
+# A match query on a semantic_text field, which Elasticsearch has to embed the query text for
+SEMANTIC_MATCH = re.compile(r'"match": \{"\w+_semantic_')
+# A wildcard query starting with *, which has to scan the whole term dictionary
+LEADING_WILDCARD = re.compile(r'"wildcard": \{"\w+": \{[^}]*"value": "\*')
+
+# Epoch millis of document 0's timestamp in PIT pages
+DOC_TIMESTAMP_BASE = 1700000000000
+
+# Recording files by kind: one response body (or _msearch item) per line
+RECORDING_FILES = {'search': 'search.ndjson', 'msearch': 'msearch.ndjson', 'query': 'query.ndjson'}
+
+# The last KEEP and LIMIT commands of an ES|QL query, the LIMIT in front of RERANK (the rows it
+# scores) and named ?parameters
+ESQL_KEEP = re.compile(r'\|\s*KEEP\s+([^|]+)', re.IGNORECASE)
+ESQL_LIMIT = re.compile(r'\|\s*LIMIT\s+(\d+)', re.IGNORECASE)
+ESQL_RERANK_WINDOW = re.compile(r'\|\s*LIMIT\s+(\d+)\s*\|\s*RERANK\b', re.IGNORECASE)
+ESQL_PARAM = re.compile(r'\?([A-Za-z_]\w*)')
+
+def make_product(i):
+    return {
+        'product_id': f'P{i:06d}',
+        'product_name': f'Product {i}',
+        'description': f'Description of product {i}. ' * 8,
+        'main_image': f'https://img.example.com/{i}.jpg',
+        'final_price': round(5 + (i % 200) * 0.75, 2),
+        'currency': 'USD',
+        'rating': round(3 + (i % 20) / 10, 1),
+        'reviews_count': i % 500,
+        'in_stock': i % 7 != 0,
+        'model_number': f'M-{i:06d}'
+    }
+
+def make_search_response(size=20, use_fields=False, took=3, id_only=False):
+    hits = []
+    for i in range(size):
+        product = make_product(i)
+        hit = {'_index': 'ecommerce_shein_products', '_id': f'doc{i}', '_score': 10.0 / (i + 1)}
+        if id_only:
+            hit['fields'] = {'product_id': [product['product_id']]}
+        elif use_fields:
+            hit['fields'] = {field: [value] for field, value in product.items()}
+        else:
+            hit['_source'] = product
+        hits.append(hit)
+    return {
+        'took': took,
+        'timed_out': False,
+        'hits': {'total': {'value': 1000, 'relation': 'eq'}, 'max_score': 10.0, 'hits': hits}
+    }
+
+def make_esql_response(columns, size=10, took=4):
+    """ES|QL response with the given columns for the first `size` generated products"""
+    values = []
+    for i in range(size):
+        product = {**make_product(i), '_score': 10.0 / (i + 1)}
+        values.append([product.get(column) for column in columns])
+    types = {'_score': 'double', 'final_price': 'double', 'rating': 'double', 'reviews_count': 'integer',
+             'in_stock': 'boolean'}
+    return {
+        'took': took,
+        'columns': [{'name': column, 'type': types.get(column, 'keyword')} for column in columns],
+        'values': values
+    }
+
+def load_recordings(directory):
+    """{kind: [response, ...]} from the RECORDING_FILES in directory; missing files give no entries"""
+    recordings = {}
+    for kind, filename in RECORDING_FILES.items():
+        path = os.path.join(directory, filename)
+        if os.path.exists(path):
+            with open(path) as f:
+                recordings[kind] = [json.loads(line) for line in f if line.strip()]
+    return recordings
+
+class FakeElasticsearch:
+    """aiohttp server answering like Elasticsearch after `latency` seconds"""
+
+    def __init__(self, latency=0.05, hits_per_page=20, total_docs=1000, host='127.0.0.1', port=0,
+                 inference_latency=0.0, wildcard_latency=0.0, bulk_doc_latency=0.0, bulk_capacity=0,
+                 rerank_doc_latency=0.0, recordings=None, certfile=None, keyfile=None):
+        self.latency = latency
+        # Serve HTTPS with this certificate and key (e.g. to include TLS handshakes in client benchmarks)
+        self.ssl_context = None
+        if certfile:
+            self.ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            self.ssl_context.load_cert_chain(certfile, keyfile)
+        # Recorded responses to replay (see record_es.py) and the next one of each kind
+        self.recordings = load_recordings(recordings) if recordings else {}
+        self._replayed = dict.fromkeys(self.recordings, 0)
+        # Extra time a search with semantic match clauses (embedded on the cluster) or an inference call takes
+        self.inference_latency = inference_latency
+        # Extra time a search with leading-wildcard clauses takes
+        self.wildcard_latency = wildcard_latency
+        # Extra time an ES|QL RERANK takes per row it scores
+        self.rerank_doc_latency = rerank_doc_latency
+        # Bulk indexing: time per document (e.g. semantic_text inference) and how many bulk requests the
+        # write queue takes at once; the documents of any request beyond that are rejected with 429
+        self.bulk_doc_latency = bulk_doc_latency
+        self.bulk_capacity = bulk_capacity
+        # Indexing cost model: each replica repeats the per-document work, and periodic refreshes add
+        # refresh_overhead (a fraction of it) unless refresh_interval is -1
+        self.refresh_overhead = 0.3
+        self.index_settings = {}
+        self.force_merges = 0
+        self.indices = {}
+        self.aliases = {}
+        self.tasks = {}
+        self.indexed_ids = set()
+        self.bulk_requests = 0
+        self.rejected_docs = 0
+        self._active_bulks = 0
+        self.hits_per_page = hits_per_page
+        self.total_docs = total_docs
+        self.open_pits = set()
+        self.host = host
+        self.port = port
+        self.request_count = 0
+        self.response_bytes = 0
+        # (timestamp, document) of products updated after DOC_TIMESTAMP_BASE + total_docs seconds
+        self.updates = []
+        self.inference_count = 0
+        self.last_search_body = None
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self._started = threading.Event()
+
+    def _json(self, body, status=200):
+        encoded = json.dumps(body).encode('utf-8')
+        self.response_bytes += len(encoded)
+        return web.Response(
+            body=encoded,
+            status=status,
+            content_type='application/json',
+            headers={'X-Elastic-Product': 'Elasticsearch'}
+        )
+
+    async def _delay(self):
+        self.request_count += 1
+        self._in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self._in_flight -= 1
+
+    def _replay(self, kind):
+        """Next recorded response of `kind`, or None when there are none"""
+        recorded = self.recordings.get(kind)
+        if not recorded:
+            return None
+        response = recorded[self._replayed[kind] % len(recorded)]
+        self._replayed[kind] += 1
+        return response
+
+    async def handle_info(self, request):
+        return self._json({'cluster_name': 'fake', 'version': {'number': '9.0.0'}, 'tagline': 'You Know, for Search'})
+
+    async def handle_search(self, request):
+        body = await request.json() if request.can_read_body else {}
+        self.last_search_body = body
+        await self._delay()
+        extra = 0.0
+        if self.inference_latency or self.wildcard_latency:
+            serialized = json.dumps(body)
+            if SEMANTIC_MATCH.search(serialized):
+                extra += self.inference_latency
+            if LEADING_WILDCARD.search(serialized):
+                extra += self.wildcard_latency
+        if extra:
+            await asyncio.sleep(extra)
+        if 'pit' in body:
+            return self._json(self._pit_page(body))
+        query = body.get('query', {})
+        if 'product_id' in query.get('terms', {}):
+            return self._json(self._cards_page(query['terms']['product_id'], body.get('_source')))
+        if 'watermark' in body.get('aggs', {}):
+            return self._json({'took': 1, 'hits': {'total': {'value': self.total_docs, 'relation': 'eq'}, 'hits': []},
+                               'aggregations': {'watermark': {'value': self.watermark()}}})
+        if 'range' in query and 'gt' in next(iter(query['range'].values())):
+            return self._json(self._changes_page(body))
+        recorded = self._replay('search')
+        if recorded is not None:
+            return self._json(recorded)
+        size = min(int(body.get('size', self.hits_per_page)), self.hits_per_page)
+        return self._json(make_search_response(size, use_fields='fields' in body and body.get('_source') is False,
+                                               id_only='docvalue_fields' in body and body.get('_source') is False))
+
+    def update_products(self, documents):
+        """Mark documents as updated now (after every timestamp seen so far)"""
+        for document in documents:
+            self.updates.append((self.watermark() + 1000, document))
+
+    def watermark(self):
+        return self.updates[-1][0] if self.updates else DOC_TIMESTAMP_BASE + self.total_docs * 1000
+
+    def _cards_page(self, product_ids, source_fields):
+        hits = []
+        for product_id in product_ids:
+            product = make_product(int(product_id[1:]))
+            if isinstance(source_fields, list):
+                product = {field: product[field] for field in source_fields if field in product}
+            hits.append({'_index': 'ecommerce_shein_products', '_id': f'doc{int(product_id[1:])}', '_score': 1.0,
+                         '_source': product})
+        return {'took': 1, 'hits': {'total': {'value': len(hits), 'relation': 'eq'}, 'hits': hits}}
+
+    def _changes_page(self, body):
+        since = int(next(iter(body['query']['range'].values()))['gt'])
+        changed = [(stamp, document) for stamp, document in self.updates if stamp > since]
+        hits = [{'_id': f'doc{document}', '_score': 1.0,
+                 'fields': {'product_id': [make_product(document)['product_id']], 'timestamp': [str(stamp)]}}
+                for stamp, document in sorted(changed, reverse=True)[:int(body.get('size', 10))]]
+        return {'took': 1, 'hits': {'total': {'value': len(changed), 'relation': 'eq'}, 'hits': hits}}
+
+    def _pit_page(self, body):
+        # Sort values are [score, position]; search_after resumes after the given position
+        search_after = body.get('search_after')
+        start = search_after[1] + 1 if search_after else 0
+        # Document i was last updated at DOC_TIMESTAMP_BASE + i seconds; honour a range (gte) on it
+        ranges = list(body.get('query', {}).get('range', {}).values())
+        if ranges and 'gte' in ranges[0]:
+            start = max(start, -(-(int(ranges[0]['gte']) - DOC_TIMESTAMP_BASE) // 1000))
+        end = min(start + int(body.get('size', 10)), self.total_docs)
+        docvalue_fields = [field['field'] if isinstance(field, dict) else field
+                           for field in body.get('docvalue_fields', [])]
+        hits = []
+        for i in range(start, end):
+            score = float(self.total_docs - i)
+            hit = {
+                '_index': 'ecommerce_shein_products',
+                '_id': f'doc{i}',
+                '_score': score,
+                '_source': make_product(i),
+                'sort': [score, i]
+            }
+            if docvalue_fields:
+                hit['fields'] = {field: [str(DOC_TIMESTAMP_BASE + i * 1000)] for field in docvalue_fields}
+            hits.append(hit)
+        response = {
+            'pit_id': body['pit']['id'],
+            'took': 2,
+            'timed_out': False,
+            'hits': {'max_score': None, 'hits': hits}
+        }
+        if body.get('track_total_hits', True) is not False:
+            response['hits']['total'] = {'value': self.total_docs, 'relation': 'eq'}
+        return response
+
+    async def handle_open_pit(self, request):
+        pit_id = f"pit-{request.match_info['index']}-{len(self.open_pits)}"
+        self.open_pits.add(pit_id)
+        return self._json({'id': pit_id})
+
+    async def handle_close_pit(self, request):
+        body = await request.json()
+        self.open_pits.discard(body.get('id'))
+        return self._json({'succeeded': True, 'num_freed': 1})
+
+    async def handle_msearch(self, request):
+        lines = [json.loads(line) for line in (await request.read()).splitlines() if line.strip()]
+        await self._delay()
+        responses = []
+        for body in lines[1::2]:
+            recorded = self._replay('msearch')
+            if recorded is not None:
+                responses.append(recorded)
+                continue
+            size = min(int(body.get('size', self.hits_per_page)), self.hits_per_page)
+            id_only = 'docvalue_fields' in body and body.get('_source') is False
+            responses.append({**make_search_response(size, id_only=id_only), 'status': 200})
+        return self._json({'took': 5, 'responses': responses})
+
+    async def handle_esql(self, request):
+        body = await request.json()
+        self.last_search_body = body
+        # Like Elasticsearch, reject ?parameters the request does not pass
+        passed = {name for param in body.get('params', []) if isinstance(param, dict) for name in param}
+        missing = sorted(set(ESQL_PARAM.findall(body['query'])) - passed)
+        if missing:
+            return self._json({'error': {'type': 'verification_exception',
+                                         'reason': f'Unknown query parameter [{missing[0]}]'}, 'status': 400},
+                              status=400)
+        await self._delay()
+        if self.inference_latency and 'RERANK' in body['query'].upper():
+            await asyncio.sleep(self.inference_latency)
+        window = ESQL_RERANK_WINDOW.search(body['query'])
+        if self.rerank_doc_latency and window:
+            await asyncio.sleep(int(window.group(1)) * self.rerank_doc_latency)
+        recorded = self._replay('query')
+        if recorded is not None:
+            return self._json(recorded)
+        keep = ESQL_KEEP.findall(body['query'])
+        limits = ESQL_LIMIT.findall(body['query'])
+        columns = [column.strip() for column in keep[-1].split(',')] if keep else ['_score', *PRODUCT_FIELDS]
+        size = min(int(limits[-1]), self.hits_per_page) if limits else self.hits_per_page
+        return self._json(make_esql_response(columns, size))
+
+    async def handle_inference(self, request):
+        # ELSER-style endpoints return sparse embeddings, everything else a 384-dim dense vector
+        inference_id = request.match_info['inference_id']
+        await self._delay()
+        if self.inference_latency:
+            await asyncio.sleep(self.inference_latency)
+        self.inference_count += 1
+        if 'elser' in inference_id:
+            return self._json({'sparse_embedding': [{'is_truncated': False,
+                                                     'embedding': {'dog': 1.5, 'bed': 1.2, 'pet': 0.4}}]})
+        return self._json({'text_embedding': [{'embedding': [0.01 * (i % 7) for i in range(384)]}]})
+
+    def _doc_cost(self, index):
+        settings = self.index_settings.get(index, {})
+        replicas = settings.get('number_of_replicas')
+        replicas = 1 if replicas is None else int(replicas)
+        refreshing = str(settings.get('refresh_interval')) != '-1'
+        return self.bulk_doc_latency * (1 + replicas) * (1 + self.refresh_overhead if refreshing else 1)
+
+    async def handle_get_settings(self, request):
+        index = request.match_info['index']
+        settings = {key: str(value) for key, value in self.index_settings.get(index, {}).items() if value is not None}
+        return self._json({index: {'settings': {'index': settings}}})
+
+    async def handle_put_settings(self, request):
+        body = await request.json()
+        settings = self.index_settings.setdefault(request.match_info['index'], {})
+        settings.update(body.get('index', body))
+        return self._json({'acknowledged': True})
+
+    async def handle_refresh(self, request):
+        return self._json({'_shards': {'total': 1, 'successful': 1, 'failed': 0}})
+
+    async def handle_forcemerge(self, request):
+        self.force_merges += 1
+        await self._delay()
+        return self._json({'_shards': {'total': 1, 'successful': 1, 'failed': 0}})
+
+    def _resolve(self, name):
+        return self.aliases.get(name, name)
+
+    def _doc_count(self, index):
+        return sum(1 for doc_index, _ in self.indexed_ids if doc_index == self._resolve(index))
+
+    async def handle_index_exists(self, request):
+        index = request.match_info['index']
+        return web.Response(status=200 if index in self.indices or index in self.aliases else 404,
+                            headers={'X-Elastic-Product': 'Elasticsearch'})
+
+    async def handle_get_index(self, request):
+        pattern = request.match_info['index']
+        found = {index: {'aliases': {alias: {} for alias, target in self.aliases.items() if target == index}}
+                 for index in self.indices if fnmatch.fnmatchcase(index, pattern)}
+        if not found and '*' not in pattern:
+            return self._json({'error': {'type': 'index_not_found_exception'}, 'status': 404}, status=404)
+        return self._json(found)
+
+    async def handle_alias_exists(self, request):
+        return web.Response(status=200 if request.match_info['name'] in self.aliases else 404,
+                            headers={'X-Elastic-Product': 'Elasticsearch'})
+
+    async def handle_get_alias(self, request):
+        name = request.match_info['name']
+        if name not in self.aliases:
+            return self._json({'error': f'alias [{name}] missing', 'status': 404}, status=404)
+        return self._json({self.aliases[name]: {'aliases': {name: {}}}})
+
+    async def handle_update_aliases(self, request):
+        # Applied all at once, like Elasticsearch does
+        for action in (await request.json())['actions']:
+            kind, params = next(iter(action.items()))
+            if kind == 'add':
+                self.aliases[params['alias']] = params['index']
+            elif kind == 'remove':
+                self.aliases.pop(params['alias'], None)
+            elif kind == 'remove_index':
+                self.indices.pop(params['index'], None)
+        return self._json({'acknowledged': True})
+
+    async def handle_count(self, request):
+        return self._json({'count': self._doc_count(request.match_info['index'])})
+
+    async def handle_reindex(self, request):
+        body = await request.json()
+        source, dest = self._resolve(body['source']['index']), body['dest']['index']
+        copied = [doc_id for doc_index, doc_id in self.indexed_ids if doc_index == source]
+        if self.bulk_doc_latency:
+            await asyncio.sleep(self._doc_cost(dest) * len(copied))
+        self.indexed_ids.update((dest, doc_id) for doc_id in copied)
+        task_id = f'fake:{len(self.tasks) + 1}'
+        self.tasks[task_id] = {'total': len(copied), 'created': len(copied), 'updated': 0}
+        return self._json({'task': task_id})
+
+    async def handle_get_task(self, request):
+        status = self.tasks[request.match_info['task_id']]
+        return self._json({'completed': True, 'task': {'status': status}, 'response': {**status, 'failures': []}})
+
+    async def handle_create_index(self, request):
+        index = request.match_info['index']
+        self.indices[index] = await request.json() if request.can_read_body else {}
+        self.index_settings[index] = {'number_of_replicas': '1'}
+        return self._json({'acknowledged': True, 'shards_acknowledged': True, 'index': index})
+
+    async def handle_delete_index(self, request):
+        index = request.match_info['index']
+        self.indices.pop(index, None)
+        self.aliases = {alias: target for alias, target in self.aliases.items() if target != index}
+        self.indexed_ids = {(doc_index, doc_id) for doc_index, doc_id in self.indexed_ids if doc_index != index}
+        return self._json({'acknowledged': True})
+
+    async def handle_bulk(self, request):
+        lines = (await request.read()).decode('utf-8').splitlines()
+        actions = [json.loads(line) for line in lines[0::2]]
+        self.bulk_requests += 1
+        rejected = bool(self.bulk_capacity) and self._active_bulks >= self.bulk_capacity
+        self._active_bulks += 1
+        try:
+            await self._delay()
+            if not rejected and self.bulk_doc_latency:
+                await asyncio.sleep(self._doc_cost(next(iter(actions[0].values())).get('_index')) * len(actions))
+        finally:
+            self._active_bulks -= 1
+
+        items = []
+        for action in actions:
+            op_type, meta = next(iter(action.items()))
+            if rejected:
+                self.rejected_docs += 1
+                items.append({op_type: {'_index': meta.get('_index'), 'status': 429, 'error': {
+                    'type': 'es_rejected_execution_exception', 'reason': 'rejected execution of bulk shard request'
+                }}})
+                continue
+            doc_id = meta.get('_id') or f'auto{len(self.indexed_ids)}'
+            self.indexed_ids.add((self._resolve(meta.get('_index')), doc_id))
+            items.append({op_type: {'_index': meta.get('_index'), '_id': doc_id, 'status': 201, 'result': 'created'}})
+        return self._json({'took': 1, 'errors': rejected, 'items': items})
+
+    async def handle_stats(self, request):
+        return self._json({
+            '_all': {'primaries': {
+                'indexing': {'index_total': 1000, 'delete_total': 0},
+                'refresh': {'external_total': 1}
+            }}
+        })
+
+    def build_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_get('/', self.handle_info)
+        app.router.add_route('*', '/_search', self.handle_search)
+        app.router.add_route('*', '/{index}/_search', self.handle_search)
+        app.router.add_post('/{index}/_pit', self.handle_open_pit)
+        app.router.add_delete('/_pit', self.handle_close_pit)
+        app.router.add_route('*', '/{index}/_msearch', self.handle_msearch)
+        app.router.add_route('*', '/_msearch', self.handle_msearch)
+        app.router.add_post('/_query', self.handle_esql)
+        app.router.add_post('/_inference/{inference_id}', self.handle_inference)
+        app.router.add_post('/_inference/{task_type}/{inference_id}', self.handle_inference)
+        app.router.add_get('/{index}/_stats', self.handle_stats)
+        app.router.add_get('/{index}/_stats/{metric}', self.handle_stats)
+        app.router.add_route('*', '/_bulk', self.handle_bulk)
+        app.router.add_route('*', '/{index}/_bulk', self.handle_bulk)
+        app.router.add_get('/{index}/_settings', self.handle_get_settings)
+        app.router.add_put('/{index}/_settings', self.handle_put_settings)
+        app.router.add_post('/{index}/_refresh', self.handle_refresh)
+        app.router.add_post('/{index}/_forcemerge', self.handle_forcemerge)
+        app.router.add_head('/_alias/{name}', self.handle_alias_exists)
+        app.router.add_get('/_alias/{name}', self.handle_get_alias, allow_head=False)
+        app.router.add_post('/_aliases', self.handle_update_aliases)
+        app.router.add_post('/_reindex', self.handle_reindex)
+        app.router.add_get('/_tasks/{task_id}', self.handle_get_task)
+        app.router.add_route('*', '/{index}/_count', self.handle_count)
+        app.router.add_head('/{index}', self.handle_index_exists)
+        app.router.add_get('/{index}', self.handle_get_index, allow_head=False)
+        app.router.add_put('/{index}', self.handle_create_index)
+        app.router.add_delete('/{index}', self.handle_delete_index)
+        return app
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port, backlog=4096, ssl_context=self.ssl_context)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self):
+        """Start serving in a background thread and return the base URL"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self.url
+
+    @property
+    def url(self):
+        return f"{'https' if self.ssl_context else 'http'}://{self.host}:{self.port}"
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
+
+def serve_fake_es(options, urls, stop):
+    server = FakeElasticsearch(**options)
+    urls.put(server.start())
+    stop.wait()
+    server.stop()
+
+class FakeElasticsearchProcess:
+    """FakeElasticsearch served from a child process"""
+
+    def __init__(self, **options):
+        context = multiprocessing.get_context('spawn')
+        self._urls = context.Queue()
+        self._stop = context.Event()
+        self._process = context.Process(target=serve_fake_es, args=(options, self._urls, self._stop), daemon=True)
+
+    def start(self):
+        """Start the child process and return the base URL"""
+        self._process.start()
+        return self._urls.get(timeout=30)
+
+    def stop(self):
+        self._stop.set()
+        self._process.join(timeout=5)
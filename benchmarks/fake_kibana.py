@@ -0,0 +1,153 @@
+"""
+Minimal Kibana Agent Builder stand-in for cleanup_conversations.py.
+
+Serves GET /api/agent_builder/conversations (paged by `page` and `per_page`
+unless `paginate` is off, filtered by `agent_id`) and
+DELETE /api/agent_builder/conversations/{id} for `conversations` generated
+conversations after a configurable delay. Deletes beyond `max_rate` per
+second are answered with 429 and Retry-After, and `failure_rate` of them
+fail with 503, so that the cleanup tool's rate limiting and retries can be
+exercised locally.
+
+    server = FakeKibana(conversations=5000, latency=0.02, max_rate=200)
+    url = server.start()   # runs in a background thread
+    ...
+    server.stop()
+"""
+
+import asyncio
+import random
+import threading
+import time
+
+from aiohttp import web
+
+AGENTS = ['elastic-ai-agent', 'shopping-assistant', 'catalog-helper']
+USERS = ['demo', 'elastic', 'sales-engineer']
+
+# created_at of conversation 0; each later one was created an hour later
+CREATED_BASE = 1735689600  # 2025-01-01T00:00:00Z
+
+def make_conversation(i):
+    return {
+        'id': f'conv-{i:06d}',
+        'title': f'Demo conversation {i}',
+        'agent_id': AGENTS[i % len(AGENTS)],
+        'user': {'username': USERS[i % len(USERS)]},
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(CREATED_BASE + i * 3600)),
+        'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S.000Z', time.gmtime(CREATED_BASE + i * 3600 + 60))
+    }
+
+class FakeKibana:
+    """aiohttp server answering like the Agent Builder conversations API after `latency` seconds"""
+
+    def __init__(self, conversations=1000, latency=0.01, max_rate=0, failure_rate=0.0, paginate=True, seed=0,
+                 host='127.0.0.1', port=0):
+        self.latency = latency
+        self.paginate = paginate
+        # Deletes accepted per second before answering 429 (0: no limit)
+        self.max_rate = max_rate
+        self.failure_rate = failure_rate
+        self.host = host
+        self.port = port
+        self.conversations = {}
+        self.reset(conversations)
+        self._random = random.Random(seed)
+        self._window_start = 0.0
+        self._window_count = 0
+        self.list_requests = 0
+        self.largest_page = 0
+        self.delete_requests = 0
+        self.throttled = 0
+        self.failures = 0
+        self.max_in_flight = 0
+        self._in_flight = 0
+        self._loop = None
+        self._thread = None
+        self._runner = None
+        self._started = threading.Event()
+
+    def reset(self, count):
+        """Replace the conversations with `count` fresh ones"""
+        self.conversations = {conversation['id']: conversation
+                              for conversation in (make_conversation(i) for i in range(count))}
+
+    async def _delay(self):
+        self._in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self._in_flight)
+        try:
+            if self.latency:
+                await asyncio.sleep(self.latency)
+        finally:
+            self._in_flight -= 1
+
+    def _over_rate(self):
+        now = time.monotonic()
+        if now - self._window_start >= 1.0:
+            self._window_start = now
+            self._window_count = 0
+        self._window_count += 1
+        return self.max_rate and self._window_count > self.max_rate
+
+    async def handle_list(self, request):
+        self.list_requests += 1
+        await self._delay()
+        conversations = list(self.conversations.values())
+        agent_id = request.query.get('agent_id')
+        if agent_id:
+            conversations = [conversation for conversation in conversations if conversation['agent_id'] == agent_id]
+        if self.paginate and 'page' in request.query:
+            per_page = int(request.query.get('per_page', 20))
+            start = (int(request.query['page']) - 1) * per_page
+            conversations = conversations[start:start + per_page]
+        self.largest_page = max(self.largest_page, len(conversations))
+        return web.json_response(conversations)
+
+    async def handle_delete(self, request):
+        self.delete_requests += 1
+        if self._over_rate():
+            self.throttled += 1
+            return web.json_response({'statusCode': 429, 'error': 'Too Many Requests'}, status=429,
+                                     headers={'Retry-After': '1'})
+        await self._delay()
+        if self.failure_rate and self._random.random() < self.failure_rate:
+            self.failures += 1
+            return web.json_response({'statusCode': 503, 'error': 'Service Unavailable'}, status=503)
+        if self.conversations.pop(request.match_info['conversation_id'], None) is None:
+            return web.json_response({'statusCode': 404, 'error': 'Not Found'}, status=404)
+        return web.json_response({'success': True})
+
+    def build_app(self):
+        app = web.Application()
+        app.router.add_get('/api/agent_builder/conversations', self.handle_list)
+        app.router.add_delete('/api/agent_builder/conversations/{conversation_id}', self.handle_delete)
+        return app
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.build_app(), access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port, backlog=4096)
+        self._loop.run_until_complete(site.start())
+        self.port = site._server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+        self._loop.run_until_complete(self._runner.cleanup())
+        self._loop.close()
+
+    def start(self):
+        """Start serving in a background thread and return the base URL"""
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        self._started.wait()
+        return self.url
+
+    @property
+    def url(self):
+        return f'http://{self.host}:{self.port}'
+
+    def stop(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(timeout=5)
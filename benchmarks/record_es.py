@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+"""
+Record Elasticsearch responses for the fake cluster to replay.
+
+Runs a proxy in front of a real cluster that forwards every request unchanged
+and appends the response bodies of successful _search, _msearch (one line per
+item) and ES|QL _query requests to search.ndjson, msearch.ndjson and
+query.ndjson in --out. Point the apps and the MCP server at the proxy, run the
+traffic to record, then stop the proxy with Ctrl-C:
+
+    python benchmarks/record_es.py --upstream $ES_URL --out benchmarks/recordings
+    ES_URL=http://127.0.0.1:9299 python app.py
+
+FakeElasticsearch(recordings=...) and bench_load.py --recordings replay them.
+Authorization headers are passed through and never written to disk.
+
+Usage:
+    python benchmarks/record_es.py --upstream URL [--out benchmarks/recordings] [--port 9299]
+"""
+
+import argparse
+import json
+import os
+import sys
+
+import aiohttp
+from aiohttp import web
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fake_es import RECORDING_FILES
+
+# Hop-by-hop and encoding headers the proxy sets itself
+SKIPPED_HEADERS = {'host', 'content-length', 'transfer-encoding', 'connection', 'accept-encoding',
+                   'content-encoding'}
+
+def recording_kind(path):
+    """Recording kind of a request path, or None for requests that are not recorded"""
+    endpoint = path.rstrip('/').rsplit('/', 1)[-1]
+    return {'_search': 'search', '_msearch': 'msearch', '_query': 'query'}.get(endpoint)
+
+class RecordingProxy:
+    """aiohttp proxy appending the responses of search-like requests to NDJSON files"""
+
+    def __init__(self, upstream, out):
+        self.upstream = upstream.rstrip('/')
+        self.out = out
+        self.recorded = dict.fromkeys(RECORDING_FILES, 0)
+        self._session = None
+        os.makedirs(out, exist_ok=True)
+
+    def record(self, kind, body):
+        response = json.loads(body)
+        entries = response.get('responses', []) if kind == 'msearch' else [response]
+        with open(os.path.join(self.out, RECORDING_FILES[kind]), 'a') as f:
+            for entry in entries:
+                f.write(json.dumps(entry, separators=(',', ':')) + '\n')
+        self.recorded[kind] += len(entries)
+
+    async def handle(self, request):
+        headers = {name: value for name, value in request.headers.items() if name.lower() not in SKIPPED_HEADERS}
+        async with self._session.request(request.method, self.upstream + request.path_qs, headers=headers,
+                                         data=await request.read() if request.can_read_body else None) as upstream:
+            body = await upstream.read()
+            kind = recording_kind(request.path)
+            if kind and upstream.status == 200:
+                self.record(kind, body)
+            response_headers = {name: value for name, value in upstream.headers.items()
+                                if name.lower() not in SKIPPED_HEADERS}
+            return web.Response(body=body, status=upstream.status, headers=response_headers)
+
+    async def open(self, app):
+        self._session = aiohttp.ClientSession(auto_decompress=True)
+
+    async def close(self, app):
+        await self._session.close()
+        print(f"Recorded {', '.join(f'{count} {kind}' for kind, count in self.recorded.items())} "
+              f"responses in {self.out}")
+
+    def build_app(self):
+        app = web.Application(client_max_size=64 * 1024 * 1024)
+        app.router.add_route('*', '/{path:.*}', self.handle)
+        app.on_startup.append(self.open)
+        app.on_cleanup.append(self.close)
+        return app
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--upstream', default=os.getenv('ES_URL'), help='cluster to forward to (default: $ES_URL)')
+    parser.add_argument('--out', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'recordings'))
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=9299)
+    args = parser.parse_args()
+
+    if not args.upstream:
+        parser.error('--upstream or ES_URL is required')
+
+    proxy = RecordingProxy(args.upstream, args.out)
+    print(f"Recording {args.upstream} on http://{args.host}:{args.port}")
+    web.run_app(proxy.build_app(), host=args.host, port=args.port, access_log=None, print=None)
+
+if __name__ == '__main__':
+    main()
@@ -2,17 +2,48 @@
 """
 Script to fetch and delete Kibana Agent Builder conversations.
 This script reads the KIBANA_URL from environment variables and performs the following:
-1. Fetches all conversations from GET kbn:/api/agent_builder/conversations
-2. Deletes each conversation using DELETE kbn:/api/agent_builder/conversations/{id}
+1. Pages through the conversations from GET kbn:/api/agent_builder/conversations
+2. Deletes each one matching --agent-id, --user and --older-than using
+   DELETE kbn:/api/agent_builder/conversations/{id}
+
+Pages are fetched while the deletes of earlier pages are still running, and
+only a page and the deletes in flight are held in memory, however many
+conversations there are. Deleting shifts the pages that follow, so the
+conversations are listed again until a pass deletes nothing.
+
+Deletes run concurrently (--concurrency) over one pooled session, limited to
+--rate requests per second by a token bucket. Requests answered with 429 or a
+5xx status, or that fail to connect, are retried with exponential backoff
+(honouring Retry-After). A progress line reports deletes/sec while they run.
+
+Usage:
+    python cleanup_conversations.py
+    python cleanup_conversations.py --yes --concurrency 16 --rate 100
+    python cleanup_conversations.py --agent-id elastic-ai-agent --user demo --older-than 7d
 """
 
+import argparse
 import os
 import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
 import requests
-import json
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 
+# Responses worth retrying: rate limited or a temporary server-side failure
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+# Seconds per unit of --older-than
+AGE_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+# Listing passes before giving up on conversations that keep turning up
+MAX_PASSES = 20
+
 def load_environment():
     """Load environment variables from variables.env file."""
     env_file = os.path.join(os.path.dirname(__file__), 'variables.env')
@@ -34,98 +65,362 @@ def load_environment():
     
     return kibana_url, api_key
 
-def get_conversations(kibana_url: str, api_key: str) -> List[Dict[str, Any]]:
+def make_session(api_key: str, pool_size: int = 10) -> requests.Session:
     """
-    Fetch all conversations from the Kibana Agent Builder API.
+    Create a session that authenticates every request and keeps connections alive.
     
     Args:
-        kibana_url: The base Kibana URL
         api_key: The API key for authentication
-        
+        pool_size: Connections to keep open, at least the number of concurrent requests
+    
     Returns:
-        List of conversation objects
+        A requests session with the Kibana headers set
     """
-    url = f"{kibana_url}/api/agent_builder/conversations"
-    headers = {
+    session = requests.Session()
+    session.headers.update({
         'Authorization': f'ApiKey {api_key}',
         'Content-Type': 'application/json',
         'kbn-xsrf': 'true'
-    }
-    
+    })
+    adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+class TokenBucket:
+    """Thread-safe token bucket allowing `rate` requests per second in bursts of up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take a token, sleeping until one is available; returns the seconds waited."""
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait_for = (1 - self.tokens) / self.rate
+            time.sleep(wait_for)
+            waited += wait_for
+
+class DeleteStats:
+    """Thread-safe counters for deletion throughput and backpressure"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.deleted = 0
+        self.failed = 0
+        self.retries = 0
+        self.throttled = 0
+        self.backoff_seconds = 0.0
+        self.rate_limited_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, value in counts.items():
+                setattr(self, name, getattr(self, name) + value)
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.deleted / elapsed if elapsed > 0 else 0.0
+
+def retry_after_seconds(response: requests.Response) -> Optional[float]:
+    """Seconds from a Retry-After header, or None when it is missing or an HTTP date."""
+    value = response.headers.get('Retry-After')
     try:
-        print(f"Fetching conversations from: {url}")
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        
-        conversations = response.json()
-        print(f"Found {len(conversations)} conversations")
-        return conversations
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+def parse_age(value: str) -> float:
+    """Seconds in an age like 90s, 30m, 12h, 7d or 2w (argparse type for --older-than)."""
+    number, unit = (value, 's') if value[-1:].isdigit() else (value[:-1], value[-1:].lower())
+    try:
+        return float(number) * AGE_UNITS[unit]
+    except (KeyError, ValueError):
+        raise argparse.ArgumentTypeError(f"invalid age {value!r}, expected e.g. 30m, 12h or 7d")
+
+def parse_timestamp(value: Any) -> Optional[float]:
+    """Epoch seconds of an ISO 8601 timestamp (UTC unless it has an offset), or None."""
+    try:
+        created = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        return None
+    if created.tzinfo is None:
+        created = created.replace(tzinfo=timezone.utc)
+    return created.timestamp()
+
+class ConversationFilter:
+    """Selects conversations by agent, username and created_at age"""
+
+    def __init__(self, agent_id: Optional[str] = None, user: Optional[str] = None,
+                 older_than: Optional[float] = None):
+        self.agent_id = agent_id
+        self.user = user
+        self.older_than = older_than
+        self.created_before = time.time() - older_than if older_than is not None else None
+
+    def matches(self, conversation: Dict[str, Any]) -> bool:
+        if self.agent_id is not None and conversation.get('agent_id') != self.agent_id:
+            return False
+        if self.user is not None and (conversation.get('user') or {}).get('username') != self.user:
+            return False
+        if self.created_before is not None:
+            # Without a readable created_at the age is unknown, so the conversation is kept
+            created = parse_timestamp(conversation.get('created_at'))
+            if created is None or created >= self.created_before:
+                return False
+        return True
+
+    def describe(self) -> str:
+        conditions = []
+        if self.agent_id is not None:
+            conditions.append(f"agent {self.agent_id}")
+        if self.user is not None:
+            conditions.append(f"user {self.user}")
+        if self.older_than is not None:
+            conditions.append(f"created more than {self.older_than / 86400:g} days ago")
+        return ', '.join(conditions) or 'all conversations'
+
+class ListingStats:
+    """Counters for one listing pass"""
+
+    def __init__(self):
+        self.pages = 0
+        self.listed = 0
+        self.matched = 0
+        self.skipped = 0
+
+def list_params(page: int, per_page: int, agent_id: Optional[str] = None) -> Dict[str, Any]:
+    """Query parameters for one page of GET /api/agent_builder/conversations."""
+    params = {'page': page, 'per_page': per_page}
+    if agent_id is not None:
+        params['agent_id'] = agent_id
+    return params
+
+def page_items(body: Any) -> List[Dict[str, Any]]:
+    """Conversations in a listing response, either a bare list or wrapped in an object."""
+    if isinstance(body, dict):
+        return body.get('results') or body.get('conversations') or []
+    return body or []
+
+def iter_conversation_pages(session: requests.Session, kibana_url: str, per_page: int = 100,
+                            agent_id: Optional[str] = None,
+                            first_page: Optional[requests.Response] = None) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Fetch conversations from the Kibana Agent Builder API one page at a time.
+    
+    The next page is only requested once the caller is done with the previous
+    one. A Kibana that ignores the paging parameters answers with every
+    conversation at once, which is yielded as a single page.
+    
+    Args:
+        session: Session from make_session()
+        kibana_url: The base Kibana URL
+        per_page: Conversations per page
+        agent_id: Only list the conversations of this agent
+        first_page: Response already received for page 1 (from check_permissions())
+    
+    Yields:
+        Lists of conversation objects
+    """
+    url = f"{kibana_url}/api/agent_builder/conversations"
+    response = first_page
+    page = 1
+    previous_first_id = None
+    
+    while True:
+        try:
+            if response is None:
+                response = session.get(url, params=list_params(page, per_page, agent_id))
+                response.raise_for_status()
+            conversations = page_items(response.json())
+        except requests.exceptions.RequestException as e:
+            print(f"Error fetching conversations (page {page}): {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                print(f"Response status: {e.response.status_code}")
+                print(f"Response body: {e.response.text}")
+            sys.exit(1)
+        response = None
         
-    except requests.exceptions.RequestException as e:
-        print(f"Error fetching conversations: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Response status: {e.response.status_code}")
-            print(f"Response body: {e.response.text}")
-        sys.exit(1)
+        # The same page again: the paging parameters were ignored
+        if not conversations or conversations[0].get('id') == previous_first_id:
+            return
+        yield conversations
+        if len(conversations) != per_page:
+            return
+        previous_first_id = conversations[0].get('id')
+        page += 1
+
+def matching_ids(pages: Iterable[List[Dict[str, Any]]], conversation_filter: ConversationFilter,
+                 listing: ListingStats) -> Iterator[str]:
+    """
+    Select the IDs of the conversations to delete from pages of conversations.
+    
+    Args:
+        pages: Pages from iter_conversation_pages()
+        conversation_filter: Which conversations to delete
+        listing: Counters to update with the pages and conversations seen
+    
+    Yields:
+        Conversation IDs
+    """
+    for conversations in pages:
+        listing.pages += 1
+        for conv in conversations:
+            listing.listed += 1
+            if not conversation_filter.matches(conv):
+                continue
+            if not conv.get('id'):
+                print(f"Warning: Conversation missing ID, skipping: {conv}")
+                listing.skipped += 1
+                continue
+            listing.matched += 1
+            yield conv['id']
 
-def delete_conversation(kibana_url: str, conversation_id: str, api_key: str) -> bool:
+def delete_conversation(session: requests.Session, kibana_url: str, conversation_id: str,
+                        stats: DeleteStats, limiter: Optional[TokenBucket] = None, max_retries: int = 5,
+                        initial_backoff: float = 0.5, max_backoff: float = 30.0, timeout: float = 30.0) -> bool:
     """
-    Delete a specific conversation by ID.
+    Delete a specific conversation by ID, retrying rate-limited and failed requests.
     
     Args:
+        session: Session from make_session()
         kibana_url: The base Kibana URL
         conversation_id: The ID of the conversation to delete
-        api_key: The API key for authentication
-        
+        stats: Counters to update with retries and time spent waiting
+        limiter: Token bucket every attempt takes a token from
+        max_retries: Retries after a 429, a 5xx or a connection error before giving up
+        initial_backoff: Seconds to wait before the first retry, doubled per retry
+        max_backoff: Upper bound for the wait between retries
+        timeout: Seconds to wait for each response
+    
     Returns:
-        True if successful, False otherwise
+        True if successful (or the conversation was already gone), False otherwise
     """
     url = f"{kibana_url}/api/agent_builder/conversations/{conversation_id}"
-    headers = {
-        'Authorization': f'ApiKey {api_key}',
-        'Content-Type': 'application/json',
-        'kbn-xsrf': 'true'
-    }
     
-    try:
-        print(f"Deleting conversation: {conversation_id}")
-        response = requests.delete(url, headers=headers)
-        response.raise_for_status()
-        print(f"Successfully deleted conversation: {conversation_id}")
-        return True
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            stats.add(rate_limited_seconds=limiter.acquire())
         
-    except requests.exceptions.RequestException as e:
-        print(f"Error deleting conversation {conversation_id}: {e}")
-        if hasattr(e, 'response') and e.response is not None:
-            print(f"Response status: {e.response.status_code}")
-            print(f"Response body: {e.response.text}")
-        return False
+        retry_after = None
+        try:
+            response = session.delete(url, timeout=timeout)
+        except requests.exceptions.RequestException as e:
+            error = str(e)
+        else:
+            # 404: deleted in the meantime, which is what we wanted
+            if response.ok or response.status_code == 404:
+                return True
+            error = f"status {response.status_code}: {response.text[:200]}"
+            if response.status_code not in RETRY_STATUSES:
+                print(f"Error deleting conversation {conversation_id}: {error}")
+                return False
+            if response.status_code == 429:
+                stats.add(throttled=1)
+            retry_after = retry_after_seconds(response)
+        
+        if attempt == max_retries:
+            print(f"Error deleting conversation {conversation_id} after {max_retries} retries: {error}")
+            return False
+        
+        backoff = min(max_backoff, retry_after if retry_after is not None else initial_backoff * 2 ** attempt)
+        time.sleep(backoff)
+        stats.add(retries=1, backoff_seconds=backoff)
+    return False
+
+def print_progress(stats: DeleteStats, total: Optional[int]):
+    done = stats.deleted + stats.failed
+    print(f"  {done:,}{f'/{total:,}' if total is not None else ''} processed, {stats.deleted:,} deleted "
+          f"({stats.rate():,.1f}/s), {stats.failed:,} failed, {stats.retries:,} retries")
 
-def check_permissions(kibana_url: str, api_key: str) -> bool:
+def delete_conversations(session: requests.Session, kibana_url: str, conversation_ids: Iterable[str],
+                         total: Optional[int] = None, concurrency: int = 8, rate: float = 0.0,
+                         burst: Optional[int] = None, progress_interval: float = 2.0,
+                         **retry_options) -> DeleteStats:
+    """
+    Delete conversations from a pool of threads sharing one session.
+    
+    At most 2 x concurrency deletes are queued at a time, so conversation_ids can be
+    a generator that is still fetching later pages.
+    
+    Args:
+        session: Session from make_session() with a pool of at least `concurrency` connections
+        kibana_url: The base Kibana URL
+        conversation_ids: IDs of the conversations to delete
+        total: Number of IDs, for the progress lines (None if unknown)
+        concurrency: Deletes in flight at once
+        rate: Maximum delete requests per second, retries included (0 for no limit)
+        burst: Requests the rate limiter lets through at once (default: one second's worth)
+        progress_interval: Seconds between progress lines
+        retry_options: max_retries, initial_backoff, max_backoff and timeout for delete_conversation()
+    
+    Returns:
+        The deletion counters
+    """
+    stats = DeleteStats()
+    limiter = TokenBucket(rate, burst) if rate > 0 else None
+    next_progress = time.perf_counter() + progress_interval
+
+    def collect(done):
+        nonlocal next_progress
+        for future in done:
+            if future.result():
+                stats.add(deleted=1)
+            else:
+                stats.add(failed=1)
+        if time.perf_counter() >= next_progress:
+            print_progress(stats, total)
+            next_progress = time.perf_counter() + progress_interval
+    
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = set()
+        for conversation_id in conversation_ids:
+            if len(pending) >= 2 * concurrency:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+            pending.add(pool.submit(delete_conversation, session, kibana_url, conversation_id, stats, limiter,
+                                    **retry_options))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            collect(done)
+    return stats
+
+def check_permissions(session: requests.Session, kibana_url: str,
+                      params: Optional[Dict[str, Any]] = None) -> Optional[requests.Response]:
     """
     Check if the API key has the required permissions for Agent Builder.
     
+    The check lists conversations, so its response doubles as the first page.
+    
     Args:
+        session: Session from make_session()
         kibana_url: The base Kibana URL
-        api_key: The API key for authentication
-        
+        params: Query parameters of the first page, from list_params()
+    
     Returns:
-        True if permissions are sufficient, False otherwise
+        The response if permissions are sufficient, None otherwise
     """
     url = f"{kibana_url}/api/agent_builder/conversations"
-    headers = {
-        'Authorization': f'ApiKey {api_key}',
-        'Content-Type': 'application/json',
-        'kbn-xsrf': 'true'
-    }
     
     try:
         print("Checking API key permissions...")
-        response = requests.get(url, headers=headers)
+        response = session.get(url, params=params)
         
         if response.status_code == 200:
             print("✓ API key has sufficient permissions")
-            return True
+            return response
         elif response.status_code == 403:
             print("✗ API key lacks required permissions")
             print(f"Response body: {response.text}")
@@ -135,74 +430,112 @@ def check_permissions(kibana_url: str, api_key: str) -> bool:
             print("   - Add 'applications' section with 'read_onechat' privilege")
             print("2. Or modify your existing role to include:")
             print("   'applications': [{'application': 'kibana-.kibana', 'privileges': ['read_onechat']}]")
-            return False
+            return None
         else:
             print(f"✗ Unexpected response: {response.status_code}")
             print(f"Response: {response.text}")
-            return False
-            
+            return None
+    
     except requests.exceptions.RequestException as e:
         print(f"✗ Error checking permissions: {e}")
-        return False
+        return None
 
 def main():
     """Main function to orchestrate the conversation cleanup process."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--yes', '-y', action='store_true', help='delete without asking for confirmation')
+    parser.add_argument('--concurrency', type=int, default=8, help='deletes in flight at once')
+    parser.add_argument('--rate', type=float, default=50.0, help='maximum delete requests per second (0: no limit)')
+    parser.add_argument('--burst', type=int, help='requests let through at once (default: one second of --rate)')
+    parser.add_argument('--max-retries', type=int, default=5, help='retries after a 429, 5xx or connection error')
+    parser.add_argument('--initial-backoff', type=float, default=0.5, help='seconds before the first retry')
+    parser.add_argument('--max-backoff', type=float, default=30.0, help='maximum seconds between retries')
+    parser.add_argument('--timeout', type=float, default=30.0, help='seconds to wait for each response')
+    parser.add_argument('--agent-id', help='only delete the conversations of this agent')
+    parser.add_argument('--user', help='only delete the conversations of this username')
+    parser.add_argument('--older-than', type=parse_age, metavar='AGE',
+                        help='only delete conversations created longer ago than this, e.g. 12h or 7d')
+    parser.add_argument('--page-size', type=int, default=100, help='conversations fetched per request')
+    parser.add_argument('--preview', type=int, default=10, help='matching conversations of the first page to show')
+    args = parser.parse_args()
+    
     print("Starting Kibana Agent Builder conversation cleanup...")
     
     # Load environment variables
     kibana_url, api_key = load_environment()
     print(f"Using Kibana URL: {kibana_url}")
+    session = make_session(api_key, pool_size=args.concurrency)
+    conversation_filter = ConversationFilter(args.agent_id, args.user, args.older_than)
     
-    # Check permissions first
-    if not check_permissions(kibana_url, api_key):
+    # Check permissions first; the check fetches the first page
+    first_page = check_permissions(session, kibana_url, list_params(1, args.page_size, args.agent_id))
+    if first_page is None:
         print("\nCannot proceed without proper permissions.")
         print("Please create a new API key with the required privileges and update your variables.env file.")
         return
     
-    # Fetch all conversations
-    conversations = get_conversations(kibana_url, api_key)
-    
+    conversations = page_items(first_page.json())
     if not conversations:
         print("No conversations found to delete.")
         return
     
-    # Display conversations that will be deleted
-    print("\nConversations to be deleted:")
-    for i, conv in enumerate(conversations, 1):
+    # Display a sample of the conversations that will be deleted
+    matching = [conv for conv in conversations if conversation_filter.matches(conv)]
+    print(f"\nDeleting {conversation_filter.describe()}. "
+          f"{len(matching)} of the first {len(conversations)} conversations match:")
+    for i, conv in enumerate(matching[:args.preview], 1):
         print(f"{i}. ID: {conv.get('id', 'N/A')}")
         print(f"   Title: {conv.get('title', 'N/A')}")
         print(f"   Agent ID: {conv.get('agent_id', 'N/A')}")
         print(f"   User: {conv.get('user', {}).get('username', 'N/A')}")
         print(f"   Created: {conv.get('created_at', 'N/A')}")
         print()
+    if len(matching) > args.preview:
+        print(f"... and {len(matching) - args.preview} more on this page")
+    del conversations, matching
     
     # Ask for confirmation
-    confirm = input(f"Are you sure you want to delete all {len(conversations)} conversations? (yes/no): ")
-    if confirm.lower() not in ['yes', 'y']:
-        print("Operation cancelled.")
-        return
+    if not args.yes:
+        confirm = input(f"Are you sure you want to delete {conversation_filter.describe()}? (yes/no): ")
+        if confirm.lower() not in ['yes', 'y']:
+            print("Operation cancelled.")
+            return
     
-    # Delete each conversation
-    print("\nStarting deletion process...")
-    successful_deletions = 0
-    failed_deletions = 0
-    
-    for conv in conversations:
-        conversation_id = conv.get('id')
-        if not conversation_id:
-            print(f"Warning: Conversation missing ID, skipping: {conv}")
-            failed_deletions += 1
-            continue
-            
-        if delete_conversation(kibana_url, conversation_id, api_key):
-            successful_deletions += 1
-        else:
-            failed_deletions += 1
+    # Delete the matching conversations while later pages are fetched. Deleting shifts
+    # the pages after the current one, so list again until a pass deletes nothing.
+    started = time.perf_counter()
+    deleted = retries = throttled = 0
+    backoff_seconds = 0.0
+    for pass_number in range(1, MAX_PASSES + 1):
+        print(f"\nPass {pass_number}: listing {args.page_size} conversations per page, deleting {args.concurrency} "
+              f"at a time ({f'{args.rate:g}/s max' if args.rate > 0 else 'no rate limit'})...")
+        listing = ListingStats()
+        pages = iter_conversation_pages(session, kibana_url, args.page_size, args.agent_id, first_page=first_page)
+        first_page = None
+        stats = delete_conversations(session, kibana_url, matching_ids(pages, conversation_filter, listing),
+                                     concurrency=args.concurrency, rate=args.rate, burst=args.burst,
+                                     max_retries=args.max_retries, initial_backoff=args.initial_backoff,
+                                     max_backoff=args.max_backoff, timeout=args.timeout)
+        print(f"  {listing.pages} pages, {listing.listed:,} conversations listed, {listing.matched:,} matched, "
+              f"{stats.deleted:,} deleted, {stats.failed:,} failed")
+        deleted += stats.deleted
+        retries += stats.retries
+        throttled += stats.throttled
+        backoff_seconds += stats.backoff_seconds
+        if stats.deleted == 0:
+            break
+    elapsed = time.perf_counter() - started
     
-    # Summary
-    print(f"\nCleanup completed!")
-    print(f"Successfully deleted: {successful_deletions} conversations")
-    print(f"Failed to delete: {failed_deletions} conversations")
+    # Summary; the last pass lists the conversations that are still left
+    failed = stats.failed + listing.skipped
+    print(f"\nCleanup completed in {elapsed:.1f}s ({deleted / elapsed if elapsed > 0 else 0.0:,.1f} deletes/s)!")
+    print(f"Successfully deleted: {deleted} conversations")
+    print(f"Failed to delete: {failed} conversations")
+    if stats.deleted:
+        print(f"Warning: conversations were still being deleted after {MAX_PASSES} passes; run the cleanup again")
+    print(f"Retries: {retries} ({throttled} after 429s, {backoff_seconds:.1f}s backing off)")
+    if failed:
+        sys.exit(1)
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,232 @@
+"""
+Client-side fusion for the Hybrid Search App.
+
+The reranking query fuses up to 13 sub-retrievers with Elasticsearch's linear
+retriever, all inside one request. FusionEngine instead sends every
+sub-retriever as its own search in a single _msearch call and caches each
+ranked (id, score) list per query text. The lists are fused in Python with
+NumPy:
+
+- minmax: scores of each list are normalized to [0, 1] and combined with the
+  sub-retriever's weight (what the linear retriever with the minmax
+  normalizer does)
+- rrf: reciprocal rank fusion, weight / (rank_constant + rank)
+
+Weights are only applied at fusion time, so moving a weight slider re-fuses
+cached lists without querying Elasticsearch; the fused top hits are then
+hydrated from a product card cache (or the shared ProductCardStore, in which
+case lists hold product_ids read from the product_id doc value).
+"""
+
+import dataclasses
+import hashlib
+import json
+
+import numpy as np
+
+from hybrid_query import generate_sub_retriever_queries
+from product_cards import hit_product_id
+from result_mapper import map_hits
+from search_cache import SearchResultCache
+
+FUSION_METHODS = ('minmax', 'rrf')
+
+def fuse(lists, method='minmax', rank_constant=60):
+    """Fuse [(weight, ids, scores), ...] ranked lists; return (ids, scores) sorted by fused score"""
+    if method not in FUSION_METHODS:
+        raise ValueError(f"Unknown fusion method '{method}', expected one of {', '.join(FUSION_METHODS)}")
+
+    doc_index = {}
+    columns = []
+    values = []
+    for weight, ids, scores in lists:
+        columns.append(np.fromiter((doc_index.setdefault(doc_id, len(doc_index)) for doc_id in ids),
+                                   dtype=np.intp, count=len(ids)))
+        if method == 'rrf':
+            values.append(1.0 / (rank_constant + np.arange(1, len(ids) + 1)))
+        else:
+            scores = np.asarray(scores, dtype=np.float64)
+            low = scores.min() if len(scores) else 0.0
+            span = scores.max() - low if len(scores) else 0.0
+            # A list whose scores are all equal (e.g. a single exact term match) gets full credit
+            values.append((scores - low) / span if span > 0 else np.ones_like(scores))
+
+    if not doc_index:
+        return [], np.empty(0)
+
+    # One row per list, one column per document; the fused score is a weighted sum of the rows
+    matrix = np.zeros((len(lists), len(doc_index)))
+    for row, (cols, vals) in enumerate(zip(columns, values)):
+        matrix[row, cols] = vals
+    fused = np.asarray([weight for weight, ids, scores in lists], dtype=np.float64) @ matrix
+
+    order = np.argsort(-fused, kind='stable')
+    doc_ids = list(doc_index)
+    return [doc_ids[i] for i in order], fused[order]
+
+class FusionEngine:
+    """Cached sub-retriever lists fused client-side"""
+
+    def __init__(self, index, card_fields, rank_window_size=100, max_lists=4096, max_cards=50000,
+                 ttl=300, version_fn=None, max_concurrent_searches=8, card_store=None):
+        self.index = index
+        self.card_fields = list(card_fields)
+        self.rank_window_size = rank_window_size
+        self.max_concurrent_searches = max_concurrent_searches
+        self.lists = SearchResultCache(max_entries=max_lists, ttl=ttl, version_fn=version_fn)
+        self.cards = SearchResultCache(max_entries=max_cards, ttl=ttl, version_fn=version_fn)
+        self.card_store = card_store
+
+    def list_key(self, query):
+        """Cache key of one sub-retriever list, derived from its (weight-free) query"""
+        return hashlib.sha1(json.dumps(query, sort_keys=True, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+    # Query builders ---------------------------------------------------------
+
+    def plan(self, query_text, weights, multi_match_fields):
+        """Return (sub_queries, lists, pending): cached lists by name and (name, key, query) still to run"""
+        sub_queries = [
+            (name, weight_key, query)
+            for name, weight_key, query in generate_sub_retriever_queries(query_text, weights, multi_match_fields)
+            # A zero weight contributes nothing to the fused score
+            if weights.get(weight_key)
+        ]
+        lists = {}
+        pending = []
+        for name, weight_key, query in sub_queries:
+            key = self.list_key(query)
+            cached = self.lists.get(key)
+            if cached is not None:
+                lists[name] = cached
+            else:
+                pending.append((name, key, query))
+        return sub_queries, lists, pending
+
+    def msearch_body(self, pending):
+        lines = []
+        for name, key, query in pending:
+            body = {
+                "query": query,
+                "_source": False,
+                "size": self.rank_window_size,
+                "track_total_hits": False
+            }
+            if self.card_store is not None:
+                body["docvalue_fields"] = ["product_id"]
+            lines.append('{}')
+            lines.append(json.dumps(body, separators=(',', ':')))
+        return ('\n'.join(lines) + '\n').encode('utf-8')
+
+    def _cards_query(self, doc_ids):
+        return {
+            "query": {"ids": {"values": doc_ids}},
+            "_source": self.card_fields,
+            "size": len(doc_ids)
+        }
+
+    # Cache bookkeeping -------------------------------------------------------
+
+    def _store_lists(self, lists, pending, response):
+        for (name, key, query), item in zip(pending, response['responses']):
+            if 'error' in item:
+                error = item['error']
+                raise RuntimeError(f"Sub-retriever {name} failed: "
+                                   f"{error.get('reason', error) if isinstance(error, dict) else error}")
+            hits = item['hits']['hits']
+            lists[name] = {
+                'ids': [hit_product_id(hit) if self.card_store is not None else hit['_id'] for hit in hits],
+                'scores': [hit['_score'] for hit in hits]
+            }
+            self.lists.set(key, lists[name])
+
+    def _missing_cards(self, doc_ids):
+        found = {}
+        for doc_id in doc_ids:
+            cached = self.cards.get(doc_id)
+            if cached is not None:
+                found[doc_id] = cached
+        return found, [doc_id for doc_id in doc_ids if doc_id not in found]
+
+    def _store_cards(self, found, hits):
+        for card in map_hits(hits, include_score=False, include_highlights=False):
+            found[card.id] = card
+            self.cards.set(card.id, card)
+
+    def _fuse(self, sub_queries, lists, weights, method, rank_constant, size):
+        doc_ids, scores = fuse(
+            [(weights[weight_key], lists[name]['ids'], lists[name]['scores'])
+             for name, weight_key, query in sub_queries],
+            method, rank_constant
+        )
+        return len(doc_ids), doc_ids[:size], scores[:size].tolist()
+
+    def _result(self, top_ids, scores, cards, total, method, sub_queries, cached_lists):
+        return {
+            'success': True,
+            'products': [dataclasses.replace(cards[doc_id], score=score)
+                         for doc_id, score in zip(top_ids, scores) if doc_id in cards],
+            'total': total,
+            'fusion': {
+                'method': method,
+                'lists': len(sub_queries),
+                'cached_lists': cached_lists
+            }
+        }
+
+    # Lookups -----------------------------------------------------------------
+
+    def search(self, es, query_text, weights, multi_match_fields, method='minmax', rank_constant=60, size=20):
+        """Run (or reuse) the sub-retriever searches with a sync client and return the fused result"""
+        sub_queries, lists, pending = self.plan(query_text, weights, multi_match_fields)
+        cached_lists = len(lists)
+        if pending:
+            response = es.msearch(index=self.index, body=self.msearch_body(pending),
+                                  max_concurrent_searches=self.max_concurrent_searches)
+            self._store_lists(lists, pending, response)
+
+        total, top_ids, scores = self._fuse(sub_queries, lists, weights, method, rank_constant, size)
+
+        if self.card_store is not None:
+            cards = self.card_store.cards(es, top_ids)
+            return self._result(top_ids, scores, cards, total, method, sub_queries, cached_lists)
+        cards, missing = self._missing_cards(top_ids)
+        if missing:
+            response = es.search(index=self.index, body=self._cards_query(missing))
+            self._store_cards(cards, response['hits']['hits'])
+
+        return self._result(top_ids, scores, cards, total, method, sub_queries, cached_lists)
+
+    async def asearch(self, es, query_text, weights, multi_match_fields, method='minmax', rank_constant=60, size=20):
+        """Run (or reuse) the sub-retriever searches with an AsyncElasticsearch client and return the fused result"""
+        sub_queries, lists, pending = self.plan(query_text, weights, multi_match_fields)
+        cached_lists = len(lists)
+        if pending:
+            response = await es.msearch(index=self.index, body=self.msearch_body(pending),
+                                        max_concurrent_searches=self.max_concurrent_searches)
+            self._store_lists(lists, pending, response)
+
+        total, top_ids, scores = self._fuse(sub_queries, lists, weights, method, rank_constant, size)
+
+        if self.card_store is not None:
+            cards = await self.card_store.acards(es, top_ids)
+            return self._result(top_ids, scores, cards, total, method, sub_queries, cached_lists)
+        cards, missing = self._missing_cards(top_ids)
+        if missing:
+            response = await es.search(index=self.index, body=self._cards_query(missing))
+            self._store_cards(cards, response['hits']['hits'])
+
+        return self._result(top_ids, scores, cards, total, method, sub_queries, cached_lists)
+
+    def sub_queries_for_display(self, query_text, weights, multi_match_fields):
+        """The sub-retriever searches and their weights, for "Show Generated Query" """
+        return [
+            {'name': name, 'weight': weights[weight_key], 'query': query}
+            for name, weight_key, query in generate_sub_retriever_queries(query_text, weights, multi_match_fields)
+            if weights.get(weight_key)
+        ]
+
+    def info(self):
+        return {
+            'lists': self.lists.info(),
+            'cards': self.cards.info() if self.card_store is None else None
+        }
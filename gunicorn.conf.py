@@ -0,0 +1,53 @@
+"""
+gunicorn settings for serve.py, the production entry point for the search apps.
+
+    source variables.env && gunicorn
+
+Settings (environment):
+    SERVE_MODE          wsgi (threaded Flask workers, default) or asgi (async_app.py on uvicorn workers)
+    SERVE_HOST          address to bind (default 0.0.0.0)
+    HYBRID_PORT         Hybrid Search App port (default 8080)
+    SYNONYM_PORT        Synonym App port (default 8046)
+    RULES_PORT          Rules App port (default 8047)
+    WEB_CONCURRENCY     worker processes (default 2 x CPUs + 1)
+    GUNICORN_THREADS    threads per wsgi worker (default 8)
+    GUNICORN_TIMEOUT    seconds before a silent worker is restarted (default 60)
+"""
+
+import multiprocessing
+import os
+
+SERVE_MODE = os.getenv('SERVE_MODE', 'wsgi')
+SERVE_HOST = os.getenv('SERVE_HOST', '0.0.0.0')
+
+bind = [f"{SERVE_HOST}:{os.getenv(name, default)}"
+        for name, default in (('HYBRID_PORT', '8080'), ('SYNONYM_PORT', '8046'), ('RULES_PORT', '8047'))]
+workers = int(os.getenv('WEB_CONCURRENCY', str(multiprocessing.cpu_count() * 2 + 1)))
+
+if SERVE_MODE == 'asgi':
+    wsgi_app = 'serve:asgi_app'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'serve:wsgi_app'
+    # Elasticsearch calls block, so each worker serves several requests at once from threads
+    worker_class = 'gthread'
+    threads = int(os.getenv('GUNICORN_THREADS', '8'))
+
+# Import the apps once in the master; the workers share the loaded code copy-on-write
+preload_app = True
+reload = False
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+def when_ready(server):
+    import serve
+    serve.preload()
+
+def post_fork(server, worker):
+    import serve
+    serve.init_worker()
+
+def worker_exit(server, worker):
+    import serve
+    serve.shutdown_worker()
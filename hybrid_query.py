@@ -0,0 +1,436 @@
+"""
+Hybrid query builders for the Hybrid Search App.
+
+The generate_* functions build the Elasticsearch request body as a dict.
+compile_hybrid_query() runs those builders once per weights/fields/rerank
+combination with a placeholder in place of the query text, serializes the
+result and caches the JSON segments around the placeholder, so that
+render_hybrid_query() only has to splice the escaped query text in.
+
+Each query is also classified by query_plan() into a lean plan:
+
+- identifier: SKU / ID-shaped input (every token contains a digit, e.g.
+  "sw2211", "ABC-123") only queries model_number and product_id
+- prose: natural language (no ID-shaped token) only runs the semantic and
+  multi_match clauses, so no leading-wildcard queries
+- mixed: both, as before
+
+Set ADAPTIVE_QUERY_PLANS=false to always use the mixed plan.
+"""
+
+import json
+import os
+import re
+from functools import lru_cache
+
+from product_cards import ID_PROJECTION
+from result_mapper import PRODUCT_CARD_FIELDS
+
+# Placeholder substituted for query_text when compiling a template
+QUERY_TEXT_SLOT = '\x00query_text\x00'
+_QUERY_TEXT_SLOT_JSON = json.dumps(QUERY_TEXT_SLOT)[1:-1]
+
+QUERY_TEMPLATE_CACHE_SIZE = int(os.getenv('QUERY_TEMPLATE_CACHE_SIZE', '256'))
+
+# knn settings for semantic clauses built from precomputed dense query vectors
+QUERY_KNN_K = int(os.getenv('QUERY_KNN_K', '100'))
+QUERY_KNN_NUM_CANDIDATES = int(os.getenv('QUERY_KNN_NUM_CANDIDATES', '200'))
+
+QUERY_PLANS = ('identifier', 'prose', 'mixed')
+
+ADAPTIVE_QUERY_PLANS = os.getenv('ADAPTIVE_QUERY_PLANS', 'true').lower() == 'true'
+
+# Infix matching on model_number/product_id: "wildcard" (*text*), or "ngram" to match the
+# trigram subfields added in mappings/ (reindex first)
+ID_INFIX_MATCH = os.getenv('ID_INFIX_MATCH', 'wildcard')
+
+ID_FIELDS = ('model_number', 'product_id')
+
+# A token with at least one digit made of letters/digits, optionally joined by - _ . /
+_ID_TOKEN = re.compile(r'(?=[^\d]*\d)[A-Za-z0-9]+(?:[-_./][A-Za-z0-9]+)*')
+
+def classify_query(query_text):
+    """Return 'identifier', 'prose' or 'mixed' depending on how many tokens look like an ID"""
+    
+    tokens = query_text.split()
+    if not tokens:
+        return 'mixed'
+    
+    id_tokens = sum(1 for token in tokens if _ID_TOKEN.fullmatch(token))
+    if id_tokens == len(tokens):
+        return 'identifier'
+    if id_tokens == 0:
+        return 'prose'
+    return 'mixed'
+
+def query_plan(query_text):
+    """The plan to build query_text with; always 'mixed' when ADAPTIVE_QUERY_PLANS is off"""
+    return classify_query(query_text) if ADAPTIVE_QUERY_PLANS else 'mixed'
+
+def plan_weights(weights, plan):
+    """Keep only the weights of the clauses plan runs (all of them if the plan would leave none)"""
+    
+    if plan == 'identifier':
+        planned = {key: value for key, value in weights.items() if key in ID_FIELDS}
+    elif plan == 'prose':
+        planned = {key: value for key, value in weights.items() if key not in ID_FIELDS}
+    else:
+        return weights
+    return planned or weights
+
+def id_infix_query(field, query_text, boost=None, plan='mixed'):
+    """Infix match on an ID field, or None when the plan only runs term/prefix"""
+    
+    if ID_INFIX_MATCH == 'ngram':
+        query = {"query": query_text, "operator": "and"}
+        if boost is not None:
+            query["boost"] = boost
+        return {"match": {f"{field}.ngram": query}}
+    
+    if plan == 'identifier':
+        # Identifier plans skip the leading wildcard; term and prefix cover exact and partial SKUs
+        return None
+    
+    query = {"value": f"*{query_text}*"}
+    if boost is not None:
+        query = {"boost": boost, **query}
+    return {"wildcard": {field: query}}
+
+def _default_rerank_inference_id():
+    return os.getenv('RERANK_INFERENCE_ID', '.rerank-v1-elasticsearch')
+
+def semantic_clause(field, query_text, boost, query_vectors=None):
+    """Query a semantic_text field with match, or with sparse_vector/knn when a precomputed query vector is given"""
+    
+    vector = (query_vectors or {}).get(field)
+    if vector is None:
+        return {
+            "match": {
+                field: {
+                    "query": query_text,
+                    "boost": boost
+                }
+            }
+        }
+    
+    if vector['type'] == 'sparse':
+        return {
+            "sparse_vector": {
+                "field": field,
+                "query_vector": vector['vector'],
+                "boost": boost
+            }
+        }
+    
+    return {
+        "knn": {
+            "field": field,
+            "query_vector": vector['vector'],
+            "k": QUERY_KNN_K,
+            "num_candidates": QUERY_KNN_NUM_CANDIDATES,
+            "boost": boost
+        }
+    }
+
+def source_projection(id_only=False):
+    """The card fields, or only IDs and scores for hits hydrated from a ProductCardStore"""
+    return dict(ID_PROJECTION) if id_only else {"_source": PRODUCT_CARD_FIELDS}
+
+def generate_hybrid_query(query_text, weights, multi_match_fields, enable_reranking=False, rerank_field='description',
+                          rerank_inference_id=None, query_vectors=None, plan=None, id_only=False):
+    """Generate the hybrid query using bool/should structure or reranking structure"""
+    
+    if enable_reranking:
+        return generate_reranking_query(query_text, weights, multi_match_fields, rerank_field, rerank_inference_id,
+                                        query_vectors, plan, id_only)
+    else:
+        return generate_standard_query(query_text, weights, multi_match_fields, query_vectors, plan, id_only)
+
+def generate_standard_query(query_text, weights, multi_match_fields, query_vectors=None, plan=None, id_only=False):
+    """Generate the standard hybrid query using bool/should structure
+
+    query_vectors maps semantic field -> precomputed query vector (see query_embeddings.py).
+    plan defaults to query_plan(query_text). id_only returns only IDs and scores (see product_cards.py).
+    """
+    
+    if plan is None:
+        plan = query_plan(query_text)
+    weights = plan_weights(weights, plan)
+    
+    # Build should clauses for hybrid search
+    should_clauses = []
+    
+    # Add semantic search clauses
+    semantic_fields = [
+        'description_semantic_elser',
+        'description_semantic_google', 
+        'description_semantic_e5',
+        'product_name_semantic_elser',
+        'product_name_semantic_google',
+        'product_name_semantic_e5'
+    ]
+    
+    for field in semantic_fields:
+        if field in weights:
+            should_clauses.append(semantic_clause(field, query_text, weights[field], query_vectors))
+    
+    # Add multi_match clause
+    if 'multi_match' in weights and multi_match_fields:
+        should_clauses.append({
+            "multi_match": {
+                "query": query_text,
+                "fields": multi_match_fields,
+                "boost": weights['multi_match']
+            }
+        })
+    
+    # Add model_number and product_id clauses (term, prefix, infix)
+    for field in ID_FIELDS:
+        if field in weights:
+            should_clauses.append({
+                "term": {
+                    field: {
+                        "value": query_text,
+                        "boost": weights[field]
+                    }
+                }
+            })
+            should_clauses.append({
+                "prefix": {
+                    field: {
+                        "boost": weights[field],
+                        "value": query_text
+                    }
+                }
+            })
+            infix = id_infix_query(field, query_text, weights[field], plan)
+            if infix is not None:
+                should_clauses.append(infix)
+    
+    # Build the complete query
+    query = {
+        **source_projection(id_only),
+        "query": {
+            "bool": {
+                "should": should_clauses,
+                "minimum_should_match": 1
+            }
+        },
+        "highlight": {
+            "fields": {
+                "product_name": {
+                    "number_of_fragments": 1,
+                    "order": "score"
+                },
+                "description": {
+                    "number_of_fragments": 1,
+                    "order": "score"
+                }
+            }
+        },
+        "size": 20
+    }
+    
+    return query
+
+def generate_reranking_query(query_text, weights, multi_match_fields, rerank_field='description',
+                             rerank_inference_id=None, query_vectors=None, plan=None, id_only=False):
+    """Generate the reranking query using text_similarity_reranker structure"""
+    
+    if rerank_inference_id is None:
+        rerank_inference_id = _default_rerank_inference_id()
+    if plan is None:
+        plan = query_plan(query_text)
+    weights = plan_weights(weights, plan)
+    
+    # Build retrievers for the linear combination
+    retrievers = []
+    
+    # Add semantic search retrievers
+    semantic_fields = [
+        ('description_semantic_elser', 'description_semantic_elser', 2.0),
+        ('description_semantic_google', 'description_semantic_google', 2.0),
+        ('description_semantic_e5', 'description_semantic_e5', 2.0),
+        ('product_name_semantic_elser', 'product_name_semantic_elser', 2.0),
+        ('product_name_semantic_google', 'product_name_semantic_google', 2.0),
+        ('product_name_semantic_e5', 'product_name_semantic_e5', 2.0)
+    ]
+    
+    for field_name, field_path, default_weight in semantic_fields:
+        if field_name in weights:
+            retrievers.append({
+                "normalizer": "minmax",
+                "retriever": {
+                    "standard": {
+                        "query": semantic_clause(field_path, query_text, weights[field_name], query_vectors)
+                    }
+                },
+                "weight": weights[field_name]
+            })
+    
+    # Add multi_match retriever
+    if 'multi_match' in weights and multi_match_fields:
+        retrievers.append({
+            "normalizer": "minmax",
+            "retriever": {
+                "standard": {
+                    "query": {
+                        "multi_match": {
+                            "query": query_text,
+                            "fields": multi_match_fields,
+                            "boost": weights['multi_match']
+                        }
+                    }
+                }
+            },
+            "weight": weights['multi_match']
+        })
+    
+    # Add model_number and product_id retrievers (term, prefix, infix)
+    for field in ID_FIELDS:
+        if field in weights:
+            id_queries = [
+                {
+                    "term": {
+                        field: {
+                            "value": query_text,
+                            "boost": weights[field]
+                        }
+                    }
+                },
+                {
+                    "prefix": {
+                        field: {
+                            "boost": weights[field],
+                            "value": query_text
+                        }
+                    }
+                },
+                id_infix_query(field, query_text, weights[field], plan)
+            ]
+            for id_query in id_queries:
+                if id_query is None:
+                    continue
+                retrievers.append({
+                    "normalizer": "minmax",
+                    "retriever": {
+                        "standard": {
+                            "query": id_query
+                        }
+                    },
+                    "weight": weights[field]
+                })
+    
+    # Build the reranking query
+    query = {
+        **source_projection(id_only),
+        "highlight": {
+            "fields": {
+                "product_name": {
+                    "number_of_fragments": 1,
+                    "order": "score"
+                },
+                "description": {
+                    "number_of_fragments": 1,
+                    "order": "score"
+                }
+            }
+        },
+        "retriever": {
+            "text_similarity_reranker": {
+                "field": rerank_field,  # Field to rerank on
+                "inference_id": rerank_inference_id,
+                "inference_text": query_text,
+                "rank_window_size": 20,
+                "retriever": {
+                    "linear": {
+                        "rank_window_size": 100,
+                        "retrievers": retrievers
+                    }
+                }
+            }
+        },
+        "size": 20
+    }
+    
+    return query
+
+def generate_sub_retriever_queries(query_text, weights, multi_match_fields, plan=None):
+    """Return (name, weight_key, query) for each sub-retriever of the linear retriever, without boosts
+
+    Used by client-side fusion: each query runs as its own search and weights are
+    only applied when the result lists are fused.
+    """
+    
+    if plan is None:
+        plan = query_plan(query_text)
+    weights = plan_weights(weights, plan)
+    sub_queries = []
+    
+    semantic_fields = [
+        'description_semantic_elser',
+        'description_semantic_google',
+        'description_semantic_e5',
+        'product_name_semantic_elser',
+        'product_name_semantic_google',
+        'product_name_semantic_e5'
+    ]
+    
+    for field in semantic_fields:
+        if field in weights:
+            sub_queries.append((field, field, {"match": {field: {"query": query_text}}}))
+    
+    if 'multi_match' in weights and multi_match_fields:
+        sub_queries.append(('multi_match', 'multi_match', {
+            "multi_match": {
+                "query": query_text,
+                "fields": multi_match_fields
+            }
+        }))
+    
+    # model_number and product_id each contribute a term, prefix and (unless the plan skips it) infix retriever
+    for field in ID_FIELDS:
+        if field in weights:
+            sub_queries.append((f'{field}_term', field, {"term": {field: {"value": query_text}}}))
+            sub_queries.append((f'{field}_prefix', field, {"prefix": {field: {"value": query_text}}}))
+            infix = id_infix_query(field, query_text, plan=plan)
+            if infix is not None:
+                sub_queries.append((f'{field}_infix', field, infix))
+    
+    return sub_queries
+
+@lru_cache(maxsize=QUERY_TEMPLATE_CACHE_SIZE)
+def _compile_template(weights_key, fields_key, enable_reranking, rerank_field, rerank_inference_id, plan, id_only):
+    skeleton = generate_hybrid_query(QUERY_TEXT_SLOT, dict(weights_key), list(fields_key),
+                                     enable_reranking, rerank_field, rerank_inference_id, plan=plan, id_only=id_only)
+    serialized = json.dumps(skeleton, ensure_ascii=False, separators=(',', ':'))
+    return tuple(serialized.split(_QUERY_TEXT_SLOT_JSON))
+
+def compile_hybrid_query(weights, multi_match_fields, enable_reranking=False, rerank_field='description',
+                         rerank_inference_id=None, plan='mixed', id_only=False):
+    """Return the serialized query split around its query_text slots, memoized per combination and plan"""
+    
+    if rerank_inference_id is None:
+        rerank_inference_id = _default_rerank_inference_id()
+    
+    try:
+        return _compile_template(tuple(sorted(weights.items())), tuple(multi_match_fields or ()),
+                                 bool(enable_reranking), rerank_field, rerank_inference_id, plan, bool(id_only))
+    except TypeError:
+        # Unhashable weights or fields (e.g. nested lists from the client) cannot be cached
+        return _compile_template.__wrapped__(tuple(weights.items()), tuple(multi_match_fields or ()),
+                                             bool(enable_reranking), rerank_field, rerank_inference_id, plan,
+                                             bool(id_only))
+
+def render_hybrid_query(query_text, weights, multi_match_fields, enable_reranking=False, rerank_field='description',
+                        rerank_inference_id=None, id_only=False):
+    """Fill the compiled template for query_text's plan with query_text and return the request body as a JSON string"""
+    
+    segments = compile_hybrid_query(weights, multi_match_fields, enable_reranking, rerank_field, rerank_inference_id,
+                                     query_plan(query_text), id_only)
+    escaped = json.dumps(query_text, ensure_ascii=False)[1:-1]
+    return escaped.join(segments)
+
+def query_template_cache_info():
+    """Return hit/miss statistics for the compiled template cache"""
+    return _compile_template.cache_info()
@@ -0,0 +1,440 @@
+#!/usr/bin/env python3
+"""
+Bulk loader for the marketplace product indices.
+
+Creates an index from its mapping in mappings/ (with ${ELSER_INFERENCE_ID}-style
+placeholders filled in from the environment) and loads a CSV or NDJSON dump
+into it:
+
+1. The dump is streamed in chunks (pandas for CSV), so memory use does not
+   depend on the file size
+2. Documents are sent with helpers.parallel_bulk using --workers threads and
+   bulk requests capped at --chunk-docs documents / --chunk-bytes bytes
+3. Documents Elasticsearch rejects with 429 (a full write queue, common while
+   semantic_text fields run inference) are retried with exponential backoff
+4. After every batch the number of records done is written to a checkpoint
+   file, so a restarted run skips straight to where the last one stopped
+
+With --fast-load the index is switched to refresh_interval -1 and 0 replicas
+for the load, force-merged once it is complete, and its original refresh and
+replica settings are restored afterwards, also when the load fails or is
+interrupted.
+
+Progress lines report docs/sec for the last batch and overall, plus the 429
+rejections and the time spent backing off; --stats-file also writes them as
+NDJSON.
+
+Usage:
+    python ingest.py --index ecommerce_shein_products --file shein.csv
+    python ingest.py --index ecommerce_amazon_products --file amazon.ndjson --workers 8 --recreate
+
+--recreate only applies to a concrete index; names served through an alias are
+rebuilt with reindex.py rebuild.
+    python ingest.py --index ecommerce_walmart_products --file walmart.csv --fast-load
+"""
+
+import argparse
+import json
+import math
+import os
+import re
+import string
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Dict, Iterator, List, Optional
+
+from dotenv import load_dotenv
+from elasticsearch import Elasticsearch, helpers
+
+MAPPINGS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'mappings')
+INDEX_NAMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.names')
+
+# Index settings for a bulk load: no periodic refreshes, no replica writes
+FAST_LOAD_SETTINGS = {'refresh_interval': '-1', 'number_of_replicas': 0}
+
+# ecommerce_<marketplace>_products -> mappings/<marketplace>_mapping.json
+INDEX_NAME_PATTERN = re.compile(r'^ecommerce_(\w+?)_products')
+
+def load_environment():
+    """Load variables.env (if present) and return (ES_URL, ES_API_KEY)."""
+    env_file = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'variables.env')
+    if os.path.exists(env_file):
+        load_dotenv(env_file)
+
+    es_url = os.getenv('ES_URL')
+    if not es_url:
+        print("Error: ES_URL environment variable not found.")
+        sys.exit(1)
+    return es_url, os.getenv('ES_API_KEY')
+
+def load_index_names(path: str = INDEX_NAMES_FILE) -> List[str]:
+    with open(path) as f:
+        return [line.strip() for line in f if line.strip()]
+
+def mapping_path_for(index: str) -> str:
+    """Return the mapping file for an index named like the ones in index.names."""
+    match = INDEX_NAME_PATTERN.match(index)
+    if not match:
+        raise ValueError(f"Cannot derive a mapping for '{index}'; pass --mapping")
+    return os.path.join(MAPPINGS_DIR, f'{match.group(1)}_mapping.json')
+
+def render_mapping(path: str, env: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    """
+    Read a mapping file and substitute its ${VAR} placeholders.
+
+    Args:
+        path: Mapping JSON file
+        env: Values for the placeholders (defaults to the environment)
+
+    Returns:
+        The index creation body (settings and mappings)
+    """
+    with open(path) as f:
+        template = string.Template(f.read())
+    try:
+        return json.loads(template.substitute(os.environ if env is None else env))
+    except KeyError as e:
+        raise ValueError(f"{os.path.basename(path)} needs {e.args[0]} to be set (see variables.env.template)")
+
+def create_index(es: Elasticsearch, index: str, body: Dict[str, Any], recreate: bool = False) -> bool:
+    """
+    Create index from body; returns False if it already existed and was kept.
+
+    Raises:
+        ValueError: recreate was asked for a name served through an alias (reindex.py manages those)
+    """
+    if es.indices.exists(index=index):
+        if not recreate:
+            return False
+        if es.indices.exists_alias(name=index):
+            targets = ', '.join(sorted(es.indices.get_alias(name=index)))
+            raise ValueError(f"{index} is an alias for {targets}, not an index to recreate; load a new version "
+                             f"with: python reindex.py rebuild --index {index} --file <dump>")
+        es.indices.delete(index=index)
+    es.indices.create(index=index, **body)
+    return True
+
+def index_settings(es: Elasticsearch, index: str, names) -> Dict[str, Any]:
+    """Return the explicitly set index.<name> values of index (None for settings left at their default)."""
+    response = es.indices.get_settings(index=index)
+    # Keyed by the concrete index, also when index is an alias
+    settings = next(iter(response.values()))['settings']['index']
+    return {name: settings.get(name) for name in names}
+
+@contextmanager
+def fast_load(es: Elasticsearch, index: str, max_num_segments: int = 1, merge_timeout: float = 3600.0):
+    """
+    Disable refreshes and replicas while the block runs, then force-merge and restore the settings.
+
+    The force merge only runs when the block succeeds; the original settings are
+    restored in every case (null for settings that were at their default).
+
+    Args:
+        es: Elasticsearch client
+        index: Index being loaded
+        max_num_segments: Segments per shard to force-merge down to
+        merge_timeout: Request timeout for the force merge in seconds
+    """
+    original = index_settings(es, index, FAST_LOAD_SETTINGS)
+    es.indices.put_settings(index=index, settings={'index': FAST_LOAD_SETTINGS})
+    print(f"Fast load: {index} set to {FAST_LOAD_SETTINGS} (was {original})")
+    try:
+        yield
+        started = time.perf_counter()
+        es.indices.refresh(index=index)
+        es.options(request_timeout=merge_timeout).indices.forcemerge(index=index, max_num_segments=max_num_segments)
+        print(f"Fast load: force-merged {index} to {max_num_segments} segment(s) per shard "
+              f"in {time.perf_counter() - started:.1f}s")
+    finally:
+        try:
+            es.indices.put_settings(index=index, settings={'index': original})
+            print(f"Fast load: restored {index} settings {original}")
+        except Exception:
+            print(f"Error: could not restore {index} settings; set them back by hand: {original}")
+            raise
+
+def field_types(body: Dict[str, Any]) -> Dict[str, str]:
+    """Top-level field -> mapping type ('object' for object fields without an explicit type)."""
+    properties = body.get('mappings', {}).get('properties', {})
+    return {field: spec.get('type', 'object') for field, spec in properties.items()}
+
+def coerce_document(record: Dict[str, Any], types: Dict[str, str]) -> Dict[str, Any]:
+    """Drop empty values and convert CSV strings to the types the mapping expects."""
+    doc = {}
+    for field, value in record.items():
+        if value is None or (isinstance(value, float) and math.isnan(value)) or value == '':
+            continue
+        kind = types.get(field)
+        if isinstance(value, str):
+            if kind in ('object', 'nested') and value[:1] in '[{':
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            elif kind in ('integer', 'long'):
+                try:
+                    value = int(float(value))
+                except ValueError:
+                    pass
+            elif kind in ('float', 'double', 'scaled_float'):
+                try:
+                    value = float(value)
+                except ValueError:
+                    pass
+            elif kind == 'boolean':
+                value = value.strip().lower() in ('true', '1', 'yes')
+        doc[field] = value
+    return doc
+
+def iter_record_chunks(path: str, fmt: str, chunk_rows: int) -> Iterator[List[Dict[str, Any]]]:
+    """Yield the records of a CSV or NDJSON dump, chunk_rows at a time."""
+    if fmt == 'csv':
+        import pandas as pd
+
+        # Read everything as strings; coerce_document converts by mapping type
+        for frame in pd.read_csv(path, chunksize=chunk_rows, dtype=str, keep_default_na=False):
+            yield frame.to_dict('records')
+        return
+
+    chunk = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            chunk.append(json.loads(line))
+            if len(chunk) == chunk_rows:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+class Checkpoint:
+    """Number of leading records of a dump already indexed, kept in a small JSON file"""
+
+    def __init__(self, path: str, source: str, index: str):
+        self.path = path
+        self.source = source
+        self.index = index
+
+    def load(self) -> int:
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path) as f:
+            state = json.load(f)
+        if state.get('source') != self.source or state.get('index') != self.index:
+            raise ValueError(f"Checkpoint {self.path} belongs to {state.get('source')} -> {state.get('index')}")
+        return int(state.get('records_done', 0))
+
+    def save(self, records_done: int):
+        # Write then rename, so a crash never leaves a truncated checkpoint
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'source': self.source, 'index': self.index, 'records_done': records_done,
+                       'updated_at': time.time()}, f)
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+class BulkStats:
+    """Counters for throughput and backpressure"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.indexed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retries = 0
+        self.backoff_seconds = 0.0
+
+    def rate(self) -> float:
+        elapsed = time.perf_counter() - self.started
+        return self.indexed / elapsed if elapsed > 0 else 0.0
+
+def _item_status(info: Dict[str, Any]) -> int:
+    item = next(iter(info.values()))
+    return item.get('status', 0)
+
+def bulk_index(es: Elasticsearch, actions: List[Dict[str, Any]], stats: BulkStats, workers: int = 4,
+               chunk_docs: int = 500, chunk_bytes: int = 10 * 1024 * 1024, max_retries: int = 8,
+               initial_backoff: float = 1.0, max_backoff: float = 60.0, errors: Optional[List] = None):
+    """
+    Index actions with parallel_bulk, retrying documents rejected with 429.
+
+    Args:
+        es: Elasticsearch client
+        actions: Bulk actions (dicts with _index, _source and optionally _id)
+        stats: Counters to update
+        workers: parallel_bulk threads
+        chunk_docs: Documents per bulk request
+        chunk_bytes: Maximum bytes per bulk request
+        max_retries: Retries for rejected documents before they count as failed
+        initial_backoff: Seconds to wait before the first retry, doubled per retry
+        max_backoff: Upper bound for the wait between retries
+        errors: List to append the first failed items to
+    """
+    pending = actions
+    for attempt in range(max_retries + 1):
+        rejected = []
+        # parallel_bulk yields results in action order, so they can be zipped back to the actions
+        results = helpers.parallel_bulk(es, pending, thread_count=workers, chunk_size=chunk_docs,
+                                        max_chunk_bytes=chunk_bytes, raise_on_error=False,
+                                        raise_on_exception=False)
+        for action, (ok, info) in zip(pending, results):
+            if ok:
+                stats.indexed += 1
+            elif _item_status(info) == 429:
+                rejected.append(action)
+            else:
+                stats.failed += 1
+                if errors is not None and len(errors) < 10:
+                    errors.append(info)
+
+        if not rejected:
+            return
+        stats.rejected += len(rejected)
+        if attempt == max_retries:
+            stats.failed += len(rejected)
+            if errors is not None and len(errors) < 10:
+                errors.append({'rejected': len(rejected), 'error': f'still rejected after {max_retries} retries'})
+            return
+
+        backoff = min(max_backoff, initial_backoff * 2 ** attempt)
+        time.sleep(backoff)
+        stats.retries += 1
+        stats.backoff_seconds += backoff
+        pending = rejected
+
+def ingest(es: Elasticsearch, index: str, path: str, fmt: str, types: Dict[str, str], id_field: Optional[str],
+           checkpoint: Checkpoint, batch_docs: int = 5000, stats_file=None, **bulk_options) -> BulkStats:
+    """
+    Load a dump into index, resuming from and updating checkpoint.
+
+    Records are grouped into batches of batch_docs; a batch is checkpointed once
+    every document in it has been indexed, retried to exhaustion or failed.
+
+    Returns:
+        The run's BulkStats
+    """
+    stats = BulkStats()
+    errors = []
+    done = checkpoint.load()
+    if done:
+        print(f"Resuming after {done:,} records (checkpoint {checkpoint.path})")
+
+    seen = 0
+    batch = []
+
+    def flush():
+        batch_started = time.perf_counter()
+        indexed_before = stats.indexed
+        bulk_index(es, batch, stats, errors=errors, **bulk_options)
+        elapsed = time.perf_counter() - batch_started
+        checkpoint.save(seen)
+        progress = {
+            'records_done': seen,
+            'batch_docs_per_sec': round((stats.indexed - indexed_before) / elapsed, 1) if elapsed > 0 else 0.0,
+            'docs_per_sec': round(stats.rate(), 1),
+            'indexed': stats.indexed,
+            'failed': stats.failed,
+            'rejected_429': stats.rejected,
+            'backoff_seconds': round(stats.backoff_seconds, 2)
+        }
+        print(f"{seen:>12,} records  {progress['batch_docs_per_sec']:>9,.0f} docs/s (batch)  "
+              f"{progress['docs_per_sec']:>9,.0f} docs/s  429s {stats.rejected:,}  "
+              f"backoff {stats.backoff_seconds:.1f}s  failed {stats.failed:,}")
+        if stats_file is not None:
+            stats_file.write(json.dumps(progress) + '\n')
+            stats_file.flush()
+        batch.clear()
+
+    for records in iter_record_chunks(path, fmt, batch_docs):
+        for record in records:
+            seen += 1
+            if seen <= done:
+                continue
+            doc = coerce_document(record, types)
+            action = {'_index': index, '_source': doc}
+            if id_field and doc.get(id_field) is not None:
+                # Stable IDs make re-sending a partly indexed batch after a crash idempotent
+                action['_id'] = str(doc[id_field])
+            batch.append(action)
+            if len(batch) >= batch_docs:
+                flush()
+    if batch:
+        flush()
+
+    for error in errors:
+        print(f"Failed: {json.dumps(error, default=str)[:500]}")
+    return stats
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index', required=True, help="target index (see index.names)")
+    parser.add_argument('--file', required=True, help='CSV or NDJSON dump to load')
+    parser.add_argument('--format', choices=['csv', 'ndjson'], help='dump format (default: from the extension)')
+    parser.add_argument('--mapping', help='mapping file (default: mappings/<marketplace>_mapping.json)')
+    parser.add_argument('--recreate', action='store_true', help='delete and recreate the index (and restart); not for aliases, see reindex.py')
+    parser.add_argument('--id-field', default='product_id',
+                        help="field used as the document _id ('' for generated IDs)")
+    parser.add_argument('--workers', type=int, default=4, help='parallel bulk threads')
+    parser.add_argument('--chunk-docs', type=int, default=500, help='documents per bulk request')
+    parser.add_argument('--chunk-bytes', type=int, default=10 * 1024 * 1024, help='maximum bytes per bulk request')
+    parser.add_argument('--batch-docs', type=int, default=5000, help='documents per checkpoint')
+    parser.add_argument('--max-retries', type=int, default=8, help='retries for documents rejected with 429')
+    parser.add_argument('--initial-backoff', type=float, default=1.0, help='seconds before the first 429 retry')
+    parser.add_argument('--max-backoff', type=float, default=60.0, help='maximum seconds between 429 retries')
+    parser.add_argument('--request-timeout', type=float, default=120.0,
+                        help='bulk request timeout; semantic_text inference makes bulk requests slow')
+    parser.add_argument('--fast-load', action='store_true',
+                        help='load with refresh_interval -1 and 0 replicas, then force-merge and restore them')
+    parser.add_argument('--max-num-segments', type=int, default=1, help='force-merge target with --fast-load')
+    parser.add_argument('--checkpoint', help='checkpoint file (default: <file>.<index>.checkpoint)')
+    parser.add_argument('--stats-file', help='append per-batch progress as NDJSON to this file')
+    args = parser.parse_args()
+
+    fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+    if args.index not in load_index_names():
+        print(f"Warning: {args.index} is not listed in index.names")
+
+    es_url, api_key = load_environment()
+    es = Elasticsearch(es_url, api_key=api_key, verify_certs=False, request_timeout=args.request_timeout,
+                       retry_on_timeout=True, max_retries=3)
+
+    body = render_mapping(args.mapping or mapping_path_for(args.index))
+    checkpoint = Checkpoint(args.checkpoint or f'{args.file}.{args.index}.checkpoint',
+                            os.path.abspath(args.file), args.index)
+    try:
+        created = create_index(es, args.index, body, recreate=args.recreate)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if created:
+        print(f"Created index {args.index}")
+        checkpoint.clear()
+
+    types = field_types(body)
+    id_field = args.id_field if args.id_field in types else None
+    stats_file = open(args.stats_file, 'a') if args.stats_file else None
+    load_profile = fast_load(es, args.index, args.max_num_segments) if args.fast_load else nullcontext()
+    try:
+        with load_profile:
+            stats = ingest(es, args.index, args.file, fmt, types, id_field, checkpoint,
+                           batch_docs=args.batch_docs, stats_file=stats_file, workers=args.workers,
+                           chunk_docs=args.chunk_docs, chunk_bytes=args.chunk_bytes, max_retries=args.max_retries,
+                           initial_backoff=args.initial_backoff, max_backoff=args.max_backoff)
+    finally:
+        if stats_file is not None:
+            stats_file.close()
+
+    print(f"\nIndexed {stats.indexed:,} documents into {args.index} at {stats.rate():,.0f} docs/s "
+          f"({stats.failed:,} failed, {stats.rejected:,} rejected with 429, "
+          f"{stats.backoff_seconds:.1f}s backing off)")
+    if stats.failed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
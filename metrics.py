@@ -0,0 +1,234 @@
+"""
+Per-stage latency metrics for the search apps and the MCP server.
+
+Each instrumented request gets a RequestTimer that records how long its stages
+took:
+
+- parse: reading the request body and parameters
+- embed: looking up (or computing) precomputed query vectors
+- build: generating or rendering the query body
+- cache: result cache lookups
+- es: the Elasticsearch round trip as seen by the client
+- es_took: the `took` Elasticsearch reports for the search itself
+- map: converting hits into product cards (including hydrating them from the
+  product-card store)
+- serialize: encoding the response (for NDJSON streams, mapping and encoding
+  of the streamed products)
+
+finish() adds them to process-wide histograms labelled by route, search_type
+and rerank, which /metrics exposes in the Prometheus text format, and writes
+the generated query body to the slow-query log when the whole request took
+longer than SLOW_QUERY_THRESHOLD_MS.
+"""
+
+import bisect
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+PROMETHEUS_MIMETYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+STAGES = ('parse', 'embed', 'build', 'cache', 'es', 'es_took', 'map', 'serialize')
+
+# Seconds; the ES round trip of a reranked hybrid query can take a few seconds
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+SLOW_QUERY_THRESHOLD_MS = float(os.getenv('SLOW_QUERY_THRESHOLD_MS', '1000'))
+
+slow_query_log = logging.getLogger('search.slow_queries')
+if not slow_query_log.handlers:
+    # stderr by default: stdout carries the MCP protocol when running the MCP server
+    _handler = (logging.FileHandler(os.environ['SLOW_QUERY_LOG_FILE'])
+                if os.getenv('SLOW_QUERY_LOG_FILE') else logging.StreamHandler(sys.stderr))
+    _handler.setFormatter(logging.Formatter('%(asctime)s SLOW %(message)s'))
+    slow_query_log.addHandler(_handler)
+    slow_query_log.setLevel(logging.INFO)
+    slow_query_log.propagate = False
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_labels(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra is not None:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _format_bound(bound):
+    return '+Inf' if bound == float('inf') else repr(float(bound))
+
+class Histogram:
+    """Cumulative histogram per label combination, rendered in the Prometheus text format"""
+
+    def __init__(self, name, documentation, labelnames, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets) + (float('inf'),)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        """Record value for the label values tuple labels"""
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # [per-bucket counts..., sum]
+                series = self._series[labels] = [0] * len(self.buckets) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        for labels, values in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                lines.append(f'{self.name}_bucket'
+                             f'{_format_labels(self.labelnames, labels, ("le", _format_bound(bound)))} {cumulative}')
+            label_text = _format_labels(self.labelnames, labels)
+            lines.append(f'{self.name}_sum{label_text} {values[-1]}')
+            lines.append(f'{self.name}_count{label_text} {cumulative}')
+        return lines
+
+class Counter:
+    def __init__(self, name, documentation, labelnames):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} counter']
+        with self._lock:
+            values = sorted(self._values.items())
+        for labels, value in values:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labels)} {value}')
+        return lines
+
+class MetricsRegistry:
+    """The metrics one process exports on /metrics"""
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        labelnames = ('route', 'search_type', 'rerank')
+        self.request_seconds = Histogram(
+            'search_request_seconds', 'Total time spent handling a search request.', labelnames, buckets)
+        self.stage_seconds = Histogram(
+            'search_stage_seconds', 'Time spent in each stage of a search request.', labelnames + ('stage',), buckets)
+        self.slow_queries = Counter(
+            'search_slow_queries_total', 'Search requests slower than the slow-query threshold.', labelnames)
+
+    def render(self):
+        lines = []
+        for metric in (self.request_seconds, self.stage_seconds, self.slow_queries):
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = MetricsRegistry()
+
+def render_metrics(registry=REGISTRY):
+    """Return the Prometheus text exposition of registry"""
+    return registry.render()
+
+class RequestTimer:
+    """Stage timings for one request; search_type and rerank may be set once the request is parsed"""
+
+    def __init__(self, route, search_type='', rerank=False, registry=REGISTRY,
+                 slow_threshold_ms=SLOW_QUERY_THRESHOLD_MS):
+        self.route = route
+        self.search_type = search_type
+        self.rerank = rerank
+        self.registry = registry
+        self.slow_threshold_ms = slow_threshold_ms
+        self.stages = {}
+        self.started = time.perf_counter()
+        self.finished = False
+
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - start
+
+    def took(self, response):
+        """Record the server-side time Elasticsearch reports in response['took'] (milliseconds)"""
+        took = response.get('took')
+        if took is not None:
+            self.stages['es_took'] = self.stages.get('es_took', 0.0) + took / 1000
+
+    def finish(self, query_body=None):
+        """Record the request in the registry and log query_body if the request was slow"""
+        if self.finished:
+            return
+        self.finished = True
+
+        elapsed = time.perf_counter() - self.started
+        labels = (self.route, self.search_type or '', 'true' if self.rerank else 'false')
+        self.registry.request_seconds.observe(labels, elapsed)
+        for name, seconds in self.stages.items():
+            self.registry.stage_seconds.observe(labels + (name,), seconds)
+
+        if elapsed * 1000 >= self.slow_threshold_ms:
+            self.registry.slow_queries.inc(labels)
+            stages = ' '.join(f'{name}={seconds * 1000:.1f}ms' for name, seconds in self.stages.items())
+            body = query_body if isinstance(query_body, str) or query_body is None else _to_json(query_body)
+            slow_query_log.info('%s search_type=%s rerank=%s total=%.1fms %s body=%s',
+                                self.route, labels[1], labels[2], elapsed * 1000, stages, body)
+
+    def timed_stream(self, chunks, query_body=None):
+        """Yield chunks, timing their production as 'serialize' and finishing when the stream ends"""
+        try:
+            iterator = iter(chunks)
+            while True:
+                with self.stage('serialize'):
+                    try:
+                        chunk = next(iterator)
+                    except StopIteration:
+                        break
+                yield chunk
+        finally:
+            self.finish(query_body)
+
+def _to_json(obj):
+    try:
+        return json.dumps(obj, separators=(',', ':'), default=str)
+    except (TypeError, ValueError):
+        return repr(obj)
+
+def start_metrics_server(port, host='0.0.0.0', registry=REGISTRY):
+    """Serve GET /metrics from a background thread, for processes without a web app (the MCP server)"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = registry.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', PROMETHEUS_MIMETYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    httpd = ThreadingHTTPServer((host, port), MetricsHandler)
+    thread = threading.Thread(target=httpd.serve_forever, name='metrics-server', daemon=True)
+    thread.start()
+    return httpd
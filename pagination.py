@@ -0,0 +1,85 @@
+"""
+Deep pagination with a point in time (PIT) and search_after.
+
+Pages are read from a PIT so they stay consistent while the index changes, and
+each page starts after the sort values of the previous page's last hit, so
+page N costs the same as page 1 (unlike from/size, which has to collect and
+discard every earlier hit and is capped at index.max_result_window).
+
+A page cursor is the PIT ID plus the last hit's sort values, base64-encoded so
+clients can treat it as an opaque token.
+"""
+
+import base64
+import json
+
+# _shard_doc is the cheap, unique tiebreaker available when searching a PIT
+PIT_SORT = [
+    {"_score": {"order": "desc"}},
+    {"_shard_doc": {"order": "asc"}}
+]
+
+def encode_cursor(pit_id, search_after):
+    payload = json.dumps({'pit_id': pit_id, 'search_after': search_after}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return (pit_id, search_after) from a cursor, raising ValueError if it is malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return payload['pit_id'], payload['search_after']
+    except (ValueError, KeyError, TypeError, AttributeError) as e:
+        raise ValueError(f'Invalid cursor: {e}')
+
+def page_body(body, pit_id, keep_alive, page_size, search_after=None, track_total_hits=True,
+              source_fields=None, highlight=True):
+    """Turn a search body into a PIT page request (the PIT replaces the index in the URL)"""
+    page = {key: value for key, value in body.items() if key != 'size'}
+    page['pit'] = {'id': pit_id, 'keep_alive': keep_alive}
+    page['sort'] = PIT_SORT
+    page['size'] = page_size
+    page['track_total_hits'] = track_total_hits
+    if search_after is not None:
+        page['search_after'] = search_after
+    if source_fields is not None:
+        page['_source'] = source_fields
+    if not highlight:
+        page.pop('highlight', None)
+    return page
+
+def close_pit(es, pit_id):
+    try:
+        es.close_point_in_time(id=pit_id)
+    except Exception as e:
+        # An expired PIT is already gone; nothing else to clean up
+        print(f"Warning: could not close point in time: {e}")
+
+def iter_pages(es, index, body, page_size=1000, keep_alive='1m', max_results=None, source_fields=None):
+    """Yield lists of hits for every document matching body, one page at a time
+
+    Only one page is held in memory; the PIT is closed when iteration ends,
+    fails or is abandoned.
+    """
+    pit_id = es.open_point_in_time(index=index, keep_alive=keep_alive)['id']
+    returned = 0
+    search_after = None
+    try:
+        while max_results is None or returned < max_results:
+            size = page_size if max_results is None else min(page_size, max_results - returned)
+            response = es.search(body=page_body(
+                body, pit_id, keep_alive, size, search_after,
+                track_total_hits=False, source_fields=source_fields, highlight=False
+            ))
+            hits = response['hits']['hits']
+            pit_id = response.get('pit_id', pit_id)
+            if not hits:
+                break
+
+            yield hits
+            returned += len(hits)
+
+            if len(hits) < size:
+                break
+            search_after = hits[-1]['sort']
+    finally:
+        close_pit(es, pit_id)
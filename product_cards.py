@@ -0,0 +1,324 @@
+"""
+Shared product-card store for the search apps and the MCP server.
+
+Searches that only need to know which products matched ask Elasticsearch for
+IDs and scores (ID_PROJECTION: no _source, only the product_id doc value) and
+hydrate the cards from this store. Only cards it does not hold are fetched,
+with one terms query on product_id, so a product's description and the other
+card fields cross the wire once instead of with every search, recommendation
+and MCP tool call that returns it.
+
+Cards are kept in two tiers:
+
+- an in-process LRU of max_entries cards
+- optionally an SQLite file in cache_dir, read through a memory map
+  (PRAGMA mmap_size) and shared by every process using the same directory,
+  index and fields, so a card one worker fetched is a local read for the others
+
+Changed products are found by polling a watermark date field (the mappings'
+timestamp by default): each poll asks for the product_id of every document
+whose field is newer than the newest value seen so far and drops their cards
+from both tiers; when more than max_changes documents changed, the whole store
+is cleared. Entries also expire after ttl seconds.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from result_mapper import PRODUCT_CARD_FIELDS, card_from_source
+
+# Search body keys for a search that returns only IDs and scores
+ID_PROJECTION = {"_source": False, "docvalue_fields": ["product_id"]}
+
+# Rows per SELECT ... IN (...) against the disk tier, below SQLite's variable limit
+_DISK_BATCH = 500
+
+def hit_product_id(hit):
+    """product_id of a search hit, from its doc value or _source, falling back to _id"""
+    values = hit.get('fields', {}).get('product_id')
+    if values:
+        return values[0]
+    return (hit.get('_source') or {}).get('product_id') or hit['_id']
+
+class ProductCardStore:
+    """Cards by product_id in an LRU backed by an optional memory-mapped SQLite tier"""
+
+    def __init__(self, index, fields=PRODUCT_CARD_FIELDS, max_entries=50000, ttl=3600, cache_dir=None,
+                 watermark_field='timestamp', max_changes=10000, mmap_size=256 * 1024 * 1024):
+        self.index = index
+        self.fields = list(fields)
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.watermark_field = watermark_field
+        self.max_changes = max_changes
+        self.watermark = None
+        self.polled_at = None
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0,
+            'full_invalidations': 0
+        }
+
+        self._disk = None
+        self._disk_path = None
+        self._mmap_size = int(mmap_size)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            # Stores with other fields (e.g. the MCP server's) get their own file
+            digest = hashlib.sha1(json.dumps(self.fields).encode('utf-8')).hexdigest()[:8]
+            self._disk_path = os.path.join(cache_dir, f'product_cards_{index}_{digest}.sqlite3')
+            self._disk = self._connect()
+            self._disk.execute('DELETE FROM cards WHERE stored_at < ?', (time.time() - ttl,))
+            self._disk.commit()
+
+    def _connect(self):
+        disk = sqlite3.connect(self._disk_path, check_same_thread=False, timeout=10)
+        disk.execute('PRAGMA journal_mode=WAL')
+        disk.execute(f'PRAGMA mmap_size={self._mmap_size}')
+        disk.execute(
+            'CREATE TABLE IF NOT EXISTS cards '
+            '(product_id TEXT PRIMARY KEY, doc_id TEXT, source TEXT, stored_at REAL)'
+        )
+        return disk
+
+    def reopen(self):
+        """Give a forked process its own lock and SQLite connection (connections must not cross fork())"""
+        self._lock = threading.Lock()
+        if self._disk is not None:
+            self._disk = self._connect()
+
+    # Lookups -----------------------------------------------------------------
+
+    def get_many(self, product_ids):
+        """Return ({product_id: (doc_id, source)} for the cards held, [product_ids missing])"""
+        found = {}
+        now = time.time()
+        with self._lock:
+            for product_id in product_ids:
+                entry = self._memory.get(product_id)
+                if entry is None:
+                    continue
+                doc_id, source, stored_at = entry
+                if now - stored_at <= self.ttl:
+                    self._memory.move_to_end(product_id)
+                    found[product_id] = (doc_id, source)
+                    self.stats['memory_hits'] += 1
+                else:
+                    del self._memory[product_id]
+                    self.stats['expirations'] += 1
+
+            if self._disk is not None:
+                wanted = [product_id for product_id in dict.fromkeys(product_ids) if product_id not in found]
+                for start in range(0, len(wanted), _DISK_BATCH):
+                    batch = wanted[start:start + _DISK_BATCH]
+                    rows = self._disk.execute(
+                        f"SELECT product_id, doc_id, source, stored_at FROM cards "
+                        f"WHERE product_id IN ({','.join('?' * len(batch))}) AND stored_at >= ?",
+                        (*batch, now - self.ttl)
+                    ).fetchall()
+                    for product_id, doc_id, source_json, stored_at in rows:
+                        source = json.loads(source_json)
+                        self._store_memory(product_id, doc_id, source, stored_at)
+                        found[product_id] = (doc_id, source)
+                        self.stats['disk_hits'] += 1
+
+        missing = [product_id for product_id in dict.fromkeys(product_ids) if product_id not in found]
+        self.stats['misses'] += len(missing)
+        return found, missing
+
+    def put_hits(self, hits):
+        """Store the cards of hits fetched with cards_query(); returns {product_id: (doc_id, source)}"""
+        stored = {}
+        stored_at = time.time()
+        with self._lock:
+            for hit in hits:
+                product_id = hit_product_id(hit)
+                stored[product_id] = (hit['_id'], hit['_source'])
+                self._store_memory(product_id, hit['_id'], hit['_source'], stored_at)
+            if self._disk is not None and stored:
+                self._disk.executemany(
+                    'INSERT OR REPLACE INTO cards (product_id, doc_id, source, stored_at) VALUES (?, ?, ?, ?)',
+                    [(product_id, doc_id, json.dumps(source, separators=(',', ':')), stored_at)
+                     for product_id, (doc_id, source) in stored.items()]
+                )
+                self._disk.commit()
+        return stored
+
+    def _store_memory(self, product_id, doc_id, source, stored_at):
+        self._memory[product_id] = (doc_id, source, stored_at)
+        self._memory.move_to_end(product_id)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def cards_query(self, product_ids):
+        return {
+            "query": {"terms": {"product_id": product_ids}},
+            "_source": self.fields,
+            "size": len(product_ids)
+        }
+
+    def sources(self, es, product_ids):
+        """Return {product_id: (doc_id, source)}, fetching missing cards with a sync client"""
+        found, missing = self.get_many(product_ids)
+        if missing:
+            response = es.search(index=self.index, body=self.cards_query(missing))
+            found.update(self.put_hits(response['hits']['hits']))
+        return found
+
+    async def asources(self, es, product_ids):
+        """Return {product_id: (doc_id, source)}, fetching missing cards with an AsyncElasticsearch client"""
+        found, missing = self.get_many(product_ids)
+        if missing:
+            response = await es.search(index=self.index, body=self.cards_query(missing))
+            found.update(self.put_hits(response['hits']['hits']))
+        return found
+
+    # Cards -------------------------------------------------------------------
+
+    def cards_for(self, found, product_ids):
+        """ProductCard records (without score) by product_id for the found sources"""
+        return {product_id: card_from_source(found[product_id][0], found[product_id][1])
+                for product_id in product_ids if product_id in found}
+
+    def cards_for_hits(self, found, hits):
+        """ProductCard records for ID-only hits, in hit order; products deleted in between are skipped"""
+        cards = []
+        for hit in hits:
+            entry = found.get(hit_product_id(hit))
+            if entry is not None:
+                cards.append(card_from_source(hit['_id'], entry[1], hit.get('_score'), hit.get('highlight')))
+        return cards
+
+    def hydrate(self, es, hits):
+        return self.cards_for_hits(self.sources(es, [hit_product_id(hit) for hit in hits]), hits)
+
+    async def ahydrate(self, es, hits):
+        return self.cards_for_hits(await self.asources(es, [hit_product_id(hit) for hit in hits]), hits)
+
+    def cards(self, es, product_ids):
+        return self.cards_for(self.sources(es, product_ids), product_ids)
+
+    async def acards(self, es, product_ids):
+        return self.cards_for(await self.asources(es, product_ids), product_ids)
+
+    # Invalidation ------------------------------------------------------------
+
+    def invalidate(self, product_ids):
+        with self._lock:
+            for product_id in product_ids:
+                if self._memory.pop(product_id, None) is not None:
+                    self.stats['invalidations'] += 1
+            if self._disk is not None and product_ids:
+                for start in range(0, len(product_ids), _DISK_BATCH):
+                    batch = product_ids[start:start + _DISK_BATCH]
+                    self._disk.execute(f"DELETE FROM cards WHERE product_id IN ({','.join('?' * len(batch))})",
+                                       batch)
+                self._disk.commit()
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            if self._disk is not None:
+                self._disk.execute('DELETE FROM cards')
+                self._disk.commit()
+
+    def poll_body(self):
+        """Search body for the next poll: the current watermark at first, then the documents changed since"""
+        if self.watermark is None:
+            return {
+                "size": 0,
+                "aggs": {"watermark": {"max": {"field": self.watermark_field}}}
+            }
+        return {
+            "size": self.max_changes,
+            "track_total_hits": True,
+            "query": {"range": {self.watermark_field: {"gt": self.watermark, "format": "epoch_millis"}}},
+            # Newest first, so the first hit carries the new watermark even when not every change fits
+            "sort": [{self.watermark_field: "desc"}],
+            "_source": False,
+            "docvalue_fields": ["product_id", {"field": self.watermark_field, "format": "epoch_millis"}]
+        }
+
+    def apply_poll(self, response):
+        """Invalidate the cards of the documents in a poll_body() response; returns how many changed"""
+        if self.watermark is None:
+            value = response.get('aggregations', {}).get('watermark', {}).get('value')
+            # An empty index has no watermark yet; everything indexed later counts as changed
+            self.watermark = int(value) if value is not None else 0
+            self.polled_at = time.time()
+            return 0
+
+        hits = response['hits']['hits']
+        total = response['hits']['total']['value']
+        watermark = self.watermark
+        for hit in hits:
+            values = hit.get('fields', {}).get(self.watermark_field)
+            if values:
+                watermark = max(watermark, int(float(values[0])))
+        if total > len(hits):
+            self.clear()
+            self.stats['full_invalidations'] += 1
+        else:
+            self.invalidate([hit_product_id(hit) for hit in hits])
+        self.watermark = watermark
+        self.polled_at = time.time()
+        return total
+
+    def poll(self, es):
+        return self.apply_poll(es.search(index=self.index, body=self.poll_body()))
+
+    async def apoll(self, es):
+        return self.apply_poll(await es.search(index=self.index, body=self.poll_body()))
+
+    def _run(self, es, poll_interval):
+        while not self._stopped.wait(poll_interval if self.watermark is not None else 0):
+            try:
+                self.poll(es)
+            except Exception as e:
+                print(f"Warning: could not poll product card changes: {e}")
+
+    def start(self, es, poll_interval=30):
+        """Poll for changed products from a daemon thread"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(es, poll_interval),
+                                        name='product-card-poll', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stopped.set()
+
+    def info(self):
+        with self._lock:
+            memory_entries = len(self._memory)
+            disk_entries = None
+            if self._disk is not None:
+                disk_entries = self._disk.execute('SELECT COUNT(*) FROM cards').fetchone()[0]
+
+        lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        return {
+            **self.stats,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'memory_entries': memory_entries,
+            'max_entries': self.max_entries,
+            'disk_entries': disk_entries,
+            'ttl': self.ttl,
+            'watermark': self.watermark,
+            'polled_at': self.polled_at
+        }
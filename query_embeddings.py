@@ -0,0 +1,119 @@
+"""
+Query embedding cache for the hybrid search.
+
+A match query on a semantic_text field embeds the query text on the cluster,
+so a hybrid search pays for up to six inference calls (ELSER, Google and E5,
+each for the description and product_name fields). With QUERY_EMBEDDINGS
+enabled the app asks the inference API once per model instead, keeps the
+result in a bounded LRU keyed on (inference_id, normalized text), and the query
+builders send sparse_vector / knn clauses with the precomputed vectors. Repeat
+and head queries then cost no inference at all.
+"""
+
+import asyncio
+
+from search_cache import SearchResultCache, normalize_query_text
+
+# semantic_text field suffix -> the inference endpoint setting its mapping uses
+SEMANTIC_FIELD_SUFFIXES = {
+    '_semantic_elser': 'ELSER_INFERENCE_ID',
+    '_semantic_google': 'EMBEDDING_INFERENCE_ID',
+    '_semantic_e5': 'E5_INFERENCE_ID'
+}
+
+SEMANTIC_FIELDS = [
+    'description_semantic_elser',
+    'description_semantic_google',
+    'description_semantic_e5',
+    'product_name_semantic_elser',
+    'product_name_semantic_google',
+    'product_name_semantic_e5'
+]
+
+def semantic_field_inference_ids(inference_ids):
+    """Map every semantic field to its inference endpoint, given {'ELSER_INFERENCE_ID': ..., ...}"""
+    field_ids = {}
+    for field in SEMANTIC_FIELDS:
+        for suffix, setting in SEMANTIC_FIELD_SUFFIXES.items():
+            if field.endswith(suffix) and inference_ids.get(setting):
+                field_ids[field] = inference_ids[setting]
+    return field_ids
+
+# semantic_text match embeds query text with the SEARCH input type. Asymmetric models put queries and
+# documents in different spaces (Google Vertex AI uses a retrieval-query task type, E5 a "query: "
+# prefix; likewise Cohere, Jina and Voyage AI), so precomputed vectors must ask for the same type
+# (the input_type field needs Elasticsearch 8.19 / 9.1 or later)
+QUERY_INPUT_TYPE = 'SEARCH'
+
+def inference_body(query_text):
+    """Inference API request body embedding query_text as a search query"""
+    return {'input': query_text, 'input_type': QUERY_INPUT_TYPE}
+
+def embedding_from_response(response):
+    """Return {'type': 'sparse'|'dense', 'vector': ...} from an inference API response"""
+    if 'sparse_embedding' in response:
+        return {'type': 'sparse', 'vector': response['sparse_embedding'][0]['embedding']}
+    if 'text_embedding' in response:
+        return {'type': 'dense', 'vector': response['text_embedding'][0]['embedding']}
+    raise ValueError(f"Unsupported inference response: {', '.join(response.keys())}")
+
+class QueryEmbeddingCache:
+    """Bounded (inference_id, normalized text) -> query vector cache"""
+
+    def __init__(self, field_inference_ids, max_entries=4096, ttl=86400):
+        self.field_inference_ids = dict(field_inference_ids)
+        self.cache = SearchResultCache(max_entries=max_entries, ttl=ttl)
+        self.inference_calls = 0
+
+    def key(self, inference_id, text):
+        return f'{inference_id}\x00{text}'
+
+    def _plan(self, query_text, weights):
+        """Return (cache key text, vectors by inference_id found in the cache, inference_ids still to compute)
+
+        Only the cache key is normalized; the inference API always embeds query_text as sent.
+        """
+        key_text = normalize_query_text(query_text)
+        wanted = list(dict.fromkeys(
+            inference_id for field, inference_id in self.field_inference_ids.items() if field in weights
+        ))
+        found = {}
+        for inference_id in wanted:
+            cached = self.cache.get(self.key(inference_id, key_text))
+            if cached is not None:
+                found[inference_id] = cached
+        return key_text, found, [inference_id for inference_id in wanted if inference_id not in found]
+
+    def _store(self, found, key_text, inference_id, response):
+        found[inference_id] = embedding_from_response(response)
+        self.cache.set(self.key(inference_id, key_text), found[inference_id])
+        self.inference_calls += 1
+
+    def _by_field(self, found):
+        return {field: found[inference_id] for field, inference_id in self.field_inference_ids.items()
+                if inference_id in found}
+
+    def vectors_for(self, es, query_text, weights):
+        """Return {semantic field: query vector} for the fields in weights, using a sync client"""
+        key_text, found, missing = self._plan(query_text, weights)
+        for inference_id in missing:
+            self._store(found, key_text, inference_id,
+                        es.inference.inference(inference_id=inference_id, body=inference_body(query_text)))
+        return self._by_field(found)
+
+    async def avectors_for(self, es, query_text, weights):
+        """Return {semantic field: query vector} using an AsyncElasticsearch client, one model per request in parallel"""
+        key_text, found, missing = self._plan(query_text, weights)
+        responses = await asyncio.gather(*(
+            es.inference.inference(inference_id=inference_id, body=inference_body(query_text))
+            for inference_id in missing
+        ))
+        for inference_id, response in zip(missing, responses):
+            self._store(found, key_text, inference_id, response)
+        return self._by_field(found)
+
+    def info(self):
+        return {
+            **self.cache.info(),
+            'inference_calls': self.inference_calls
+        }
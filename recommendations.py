@@ -0,0 +1,148 @@
+"""
+Recommendation lookups for the Hybrid Search App.
+
+The recommendations index stores one doc per product with a rank_features field
+of recommended product_id -> score. RecommendationEngine keeps two caches:
+
+- recommendation lists: product_id -> top-N recommended IDs, sorted once when
+  the doc is loaded (optionally for the whole index at startup)
+- product cards: product_id -> the card shown in the UI (or the shared
+  ProductCardStore when one is passed in, see product_cards.py)
+
+Lookups for several products are resolved together: all missing recommendation
+docs in one search and all missing cards in one search, so a request costs at
+most two Elasticsearch round trips and none once both caches are warm.
+"""
+
+import heapq
+
+from search_cache import SearchResultCache
+
+class RecommendationEngine:
+    """Cached product -> recommended product cards lookup"""
+
+    def __init__(self, recommendation_index, product_index, card_fn, card_fields, top_n=5,
+                 max_lists=10000, max_cards=50000, ttl=3600, card_store=None):
+        self.recommendation_index = recommendation_index
+        self.product_index = product_index
+        self.card_fn = card_fn
+        self.card_fields = list(card_fields)
+        self.top_n = top_n
+        self.lists = SearchResultCache(max_entries=max_lists, ttl=ttl)
+        self.cards = SearchResultCache(max_entries=max_cards, ttl=ttl)
+        self.card_store = card_store
+
+    def top_ids(self, recommendation_doc):
+        """Return the top_n product IDs of a recommendation doc, highest score first"""
+        recommendation_field = recommendation_doc.get('recommendation') or {}
+        return [product_id for product_id, score in
+                heapq.nlargest(self.top_n, recommendation_field.items(), key=lambda x: x[1])]
+
+    # Query builders ---------------------------------------------------------
+
+    def _lists_query(self, product_ids):
+        return {
+            "query": {"terms": {"product_id": product_ids}},
+            "_source": ["product_id", "recommendation"],
+            "size": len(product_ids)
+        }
+
+    def _cards_query(self, product_ids):
+        return {
+            "query": {"terms": {"product_id": product_ids}},
+            "_source": self.card_fields,
+            "size": len(product_ids)
+        }
+
+    # Cache bookkeeping -------------------------------------------------------
+
+    def _missing_lists(self, product_ids):
+        found = {}
+        for product_id in product_ids:
+            cached = self.lists.get(product_id)
+            if cached is not None:
+                found[product_id] = cached
+        return found, [product_id for product_id in product_ids if product_id not in found]
+
+    def _store_lists(self, found, requested, hits):
+        for hit in hits:
+            source = hit['_source']
+            found[source['product_id']] = self.top_ids(source)
+        for product_id in requested:
+            # Remember products without recommendations too, so they don't hit ES again
+            found.setdefault(product_id, [])
+            self.lists.set(product_id, found[product_id])
+
+    def _missing_cards(self, product_ids):
+        found = {}
+        for product_id in product_ids:
+            cached = self.cards.get(product_id)
+            if cached is not None:
+                found[product_id] = cached
+        return found, [product_id for product_id in product_ids if product_id not in found]
+
+    def _store_cards(self, found, hits):
+        for hit in hits:
+            product_id = hit['_source']['product_id']
+            found[product_id] = self.card_fn(hit)
+            self.cards.set(product_id, found[product_id])
+
+    def _assemble(self, product_ids, lists, cards):
+        return {
+            product_id: [cards[rec_id] for rec_id in lists.get(product_id, []) if rec_id in cards]
+            for product_id in product_ids
+        }
+
+    # Lookups -----------------------------------------------------------------
+
+    def recommend_many(self, es, product_ids):
+        """Return {product_id: [card, ...]} using a sync Elasticsearch client"""
+        lists, missing = self._missing_lists(product_ids)
+        if missing:
+            response = es.search(index=self.recommendation_index, body=self._lists_query(missing))
+            self._store_lists(lists, missing, response['hits']['hits'])
+
+        wanted = list(dict.fromkeys(rec_id for ids in lists.values() for rec_id in ids))
+        if self.card_store is not None:
+            return self._assemble(product_ids, lists, self.card_store.cards(es, wanted))
+        cards, missing = self._missing_cards(wanted)
+        if missing:
+            response = es.search(index=self.product_index, body=self._cards_query(missing))
+            self._store_cards(cards, response['hits']['hits'])
+
+        return self._assemble(product_ids, lists, cards)
+
+    async def arecommend_many(self, es, product_ids):
+        """Return {product_id: [card, ...]} using an AsyncElasticsearch client"""
+        lists, missing = self._missing_lists(product_ids)
+        if missing:
+            response = await es.search(index=self.recommendation_index, body=self._lists_query(missing))
+            self._store_lists(lists, missing, response['hits']['hits'])
+
+        wanted = list(dict.fromkeys(rec_id for ids in lists.values() for rec_id in ids))
+        if self.card_store is not None:
+            return self._assemble(product_ids, lists, await self.card_store.acards(es, wanted))
+        cards, missing = self._missing_cards(wanted)
+        if missing:
+            response = await es.search(index=self.product_index, body=self._cards_query(missing))
+            self._store_cards(cards, response['hits']['hits'])
+
+        return self._assemble(product_ids, lists, cards)
+
+    def preload(self, es, batch_size=1000):
+        """Load and pre-sort every recommendation list in the index; returns the number loaded"""
+        from elasticsearch.helpers import scan
+
+        loaded = 0
+        for hit in scan(es, index=self.recommendation_index, size=batch_size,
+                        query={"_source": ["product_id", "recommendation"]}):
+            source = hit['_source']
+            self.lists.set(source['product_id'], self.top_ids(source))
+            loaded += 1
+        return loaded
+
+    def info(self):
+        return {
+            'lists': self.lists.info(),
+            'cards': self.cards.info() if self.card_store is None else None
+        }
@@ -0,0 +1,349 @@
+#!/usr/bin/env python3
+"""
+Zero-downtime rebuilds of the marketplace product indices.
+
+Every name in index.names is served through a read alias pointing at a
+versioned physical index (ecommerce_shein_products -> ecommerce_shein_products_v3),
+so the apps, the MCP server and ingest.py keep using the names they always
+have. `rebuild` creates the next version next to the live one and:
+
+1. Loads it with the bulk loader from a dump (--file, resumable through the
+   loader's checkpoint) or copies the live version with _reindex, which re-runs
+   semantic_text inference with the mapping's current inference endpoints;
+   either way with the fast-load profile, as nothing reads the index yet
+2. Refuses to go on if the new version holds fewer than --min-doc-ratio of
+   the live version's documents
+3. Warms it by running the most requested /search queries against it, read
+   from the running apps' GET /cache/top_queries (--warm-from URL) or from an
+   NDJSON file of entries shaped like its queries (full /search request bodies)
+4. Moves the alias in a single _aliases request, so every search sees either
+   the old or the new version, and deletes versions beyond --keep
+
+An alias name that is still a concrete index (the pre-alias layout) is copied
+into the first version; it is only replaced by the alias with
+--replace-index, since that deletes it.
+
+`rollback` points the alias back at the previous version (the newer one is
+kept until the next rebuild replaces it), `swap` at any kept version, and
+`status` lists the versions of each index.
+
+Usage:
+    python reindex.py status
+    python reindex.py rebuild --index ecommerce_shein_products --file shein.csv --warm-from http://localhost:8080
+    python reindex.py rebuild --warm-from http://localhost:8080 --replace-index
+    python reindex.py rollback --index ecommerce_shein_products
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from elasticsearch import Elasticsearch
+
+from hybrid_query import render_hybrid_query
+from ingest import (Checkpoint, create_index, fast_load, field_types, ingest, load_environment, load_index_names,
+                    mapping_path_for, render_mapping)
+
+VERSION_SUFFIX = re.compile(r'_v(\d+)$')
+
+def versioned_name(alias: str, version: int) -> str:
+    return f'{alias}_v{version}'
+
+def list_versions(es: Elasticsearch, alias: str) -> List[Tuple[int, str]]:
+    """Return the (version, index) pairs of alias's physical indices, oldest first."""
+    versions = []
+    for index in es.indices.get(index=f'{alias}_v*'):
+        match = VERSION_SUFFIX.search(index)
+        if match and index == versioned_name(alias, int(match.group(1))):
+            versions.append((int(match.group(1)), index))
+    return sorted(versions)
+
+def alias_targets(es: Elasticsearch, alias: str) -> List[str]:
+    """Return the indices alias points at ([] if it is not an alias)."""
+    if not es.indices.exists_alias(name=alias):
+        return []
+    return sorted(es.indices.get_alias(name=alias))
+
+def is_concrete_index(es: Elasticsearch, name: str) -> bool:
+    return es.indices.exists(index=name) and not es.indices.exists_alias(name=name)
+
+def doc_count(es: Elasticsearch, index: str) -> int:
+    return es.count(index=index)['count']
+
+def swap_alias(es: Elasticsearch, alias: str, index: str, replace_index: bool = False):
+    """
+    Point alias at index in one atomic _aliases request.
+
+    Args:
+        es: Elasticsearch client
+        alias: Alias (a name from index.names)
+        index: Physical index to serve
+        replace_index: Delete a concrete index named like the alias in the same request
+    """
+    actions = [{'remove': {'index': target, 'alias': alias}} for target in alias_targets(es, alias) if target != index]
+    if is_concrete_index(es, alias):
+        if not replace_index:
+            raise ValueError(f"{alias} is a concrete index; pass --replace-index to delete it and serve {index} "
+                             f"under its name")
+        actions.append({'remove_index': {'index': alias}})
+    actions.append({'add': {'index': index, 'alias': alias}})
+    es.indices.update_aliases(actions=actions)
+
+def reindex_from(es: Elasticsearch, source: str, dest: str, poll_interval: float = 5.0) -> Dict[str, Any]:
+    """Copy source into dest with a background _reindex task, printing its progress; returns the task response."""
+    task_id = es.reindex(source={'index': source}, dest={'index': dest}, wait_for_completion=False,
+                         slices='auto')['task']
+    print(f"Reindexing {source} -> {dest} (task {task_id})")
+    while True:
+        task = es.tasks.get(task_id=task_id)
+        status = task.get('task', {}).get('status', {})
+        if task.get('completed'):
+            response = task.get('response', {})
+            if task.get('error') or response.get('failures'):
+                raise RuntimeError(f"Reindex {task_id} failed: "
+                                   f"{json.dumps(task.get('error') or response['failures'], default=str)[:500]}")
+            return response
+        print(f"{status.get('created', 0) + status.get('updated', 0):>12,} / {status.get('total', 0):,} documents")
+        time.sleep(poll_interval)
+
+def load_warm_queries(sources: List[str], alias: str, limit: int = 100) -> List[Dict[str, Any]]:
+    """
+    Collect the /search request bodies to warm alias's new version with.
+
+    Args:
+        sources: App base URLs (their /cache/top_queries only counts for the index they serve)
+            or NDJSON files of entries shaped like theirs
+        alias: Index being rebuilt
+        limit: Queries to take from each source
+
+    Returns:
+        The request bodies, most requested first
+    """
+    queries = []
+    for source in sources:
+        if source.startswith(('http://', 'https://')):
+            try:
+                response = requests.get(f"{source.rstrip('/')}/cache/top_queries", params={'limit': limit},
+                                        timeout=10)
+                response.raise_for_status()
+                payload = response.json()
+            except (requests.RequestException, ValueError) as e:
+                print(f"Warning: could not read top queries from {source}: {e}")
+                continue
+            if payload.get('index') == alias:
+                queries.extend(payload['queries'][:limit])
+        else:
+            with open(source) as f:
+                queries.extend([json.loads(line) for line in f if line.strip()][:limit])
+    return queries
+
+def warm_up(es: Elasticsearch, index: str, queries: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Run each /search body's hybrid query against index; returns the count, failures and latencies in ms."""
+    latencies = []
+    failures = 0
+    for params in queries:
+        body = render_hybrid_query(params['query'], params['weights'], params['multi_match_fields'],
+                                   params.get('enable_reranking', False), params.get('rerank_field', 'description'))
+        started = time.perf_counter()
+        try:
+            es.search(index=index, body=body.encode('utf-8'))
+        except Exception as e:
+            failures += 1
+            print(f"Warning: warm-up query {params.get('query')!r} failed: {e}")
+            continue
+        latencies.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    return {
+        'queries': len(queries),
+        'failures': failures,
+        'p50_ms': round(latencies[len(latencies) // 2], 1) if latencies else None,
+        'max_ms': round(latencies[-1], 1) if latencies else None
+    }
+
+def prune_versions(es: Elasticsearch, alias: str, keep: int) -> List[str]:
+    """Delete alias's versions older than the live one beyond the keep most recent; returns the deleted names."""
+    live = set(alias_targets(es, alias))
+    versions = list_versions(es, alias)
+    live_versions = [version for version, index in versions if index in live]
+    if not live_versions:
+        return []
+    older = [index for version, index in versions if version < min(live_versions)]
+    deleted = older[:max(0, len(older) - keep)]
+    for index in deleted:
+        es.indices.delete(index=index)
+    return deleted
+
+def rebuild(es: Elasticsearch, alias: str, args) -> Optional[str]:
+    """Build, check, warm and (unless --no-swap) serve the next version of alias; returns the new index."""
+    live = alias_targets(es, alias)
+    legacy = not live and is_concrete_index(es, alias)
+    source = live[0] if live else (alias if legacy else None)
+    versions = list_versions(es, alias)
+
+    # A version newer than the live one is a build that did not finish (or was rolled back from): reuse its
+    # name, resuming the load when it comes from a dump
+    live_version = max((version for version, index in versions if index in live), default=0)
+    unfinished = [(version, index) for version, index in versions if version > live_version]
+    if unfinished:
+        version, index = unfinished[-1]
+    else:
+        version = versions[-1][0] + 1 if versions else 1
+        index = versioned_name(alias, version)
+    resume = bool(unfinished and args.file and not args.fresh)
+
+    body = render_mapping(args.mapping or mapping_path_for(alias))
+    checkpoint = None
+    if args.file:
+        checkpoint = Checkpoint(f'{args.file}.{index}.checkpoint', os.path.abspath(args.file), index)
+    if create_index(es, index, body, recreate=not resume):
+        print(f"Created index {index}")
+        if checkpoint is not None:
+            checkpoint.clear()
+    else:
+        print(f"Resuming the unfinished build {index}")
+
+    with fast_load(es, index, args.max_num_segments):
+        if args.file:
+            fmt = args.format or ('csv' if args.file.lower().endswith('.csv') else 'ndjson')
+            types = field_types(body)
+            stats = ingest(es, index, args.file, fmt, types, args.id_field if args.id_field in types else None,
+                           checkpoint, batch_docs=args.batch_docs, workers=args.workers, chunk_docs=args.chunk_docs,
+                           max_retries=args.max_retries)
+            if stats.failed:
+                raise RuntimeError(f"{stats.failed:,} documents failed to load into {index}; not swapping")
+        elif source is not None:
+            reindex_from(es, source, index)
+        else:
+            raise ValueError(f"{alias} has no live version to copy; pass --file")
+
+    documents = doc_count(es, index)
+    if source is not None:
+        expected = doc_count(es, source)
+        print(f"{index}: {documents:,} documents ({source}: {expected:,})")
+        if documents < args.min_doc_ratio * expected:
+            raise RuntimeError(f"{index} has {documents:,} documents, fewer than {args.min_doc_ratio:.0%} of "
+                               f"{source}'s {expected:,}; not swapping")
+
+    queries = load_warm_queries(args.warm_from, alias, args.warm_limit)
+    if queries:
+        print(f"Warmed {index}: {json.dumps(warm_up(es, index, queries))}")
+
+    if args.no_swap:
+        print(f"Built {index}; serve it with: python reindex.py swap --index {alias} --version {version}")
+        return index
+    if legacy and not args.replace_index:
+        print(f"Built {index}, but {alias} is a concrete index; rerun with --replace-index to replace it")
+        return index
+
+    swap_alias(es, alias, index, replace_index=args.replace_index)
+    print(f"{alias} -> {index}")
+    for deleted in prune_versions(es, alias, args.keep):
+        print(f"Deleted old version {deleted}")
+    return index
+
+def previous_version(es: Elasticsearch, alias: str) -> str:
+    """Return the newest version older than the live one."""
+    live = alias_targets(es, alias)
+    versions = list_versions(es, alias)
+    live_version = min((version for version, index in versions if index in live), default=0)
+    older = [index for version, index in versions if version < live_version]
+    if not older:
+        raise ValueError(f"{alias} has no older version to roll back to")
+    return older[-1]
+
+def print_status(es: Elasticsearch, alias: str):
+    live = alias_targets(es, alias)
+    if not live and is_concrete_index(es, alias):
+        print(f"{alias}: concrete index ({doc_count(es, alias):,} documents), not yet served through an alias")
+    elif not live:
+        print(f"{alias}: missing")
+    else:
+        print(f"{alias} -> {', '.join(live)}")
+    for version, index in list_versions(es, alias):
+        print(f"  v{version:<4}{doc_count(es, index):>12,} documents{'  (live)' if index in live else ''}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--request-timeout', type=float, default=120.0, help='Elasticsearch request timeout')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    status_parser = commands.add_parser('status', help='show the live and kept versions of each index')
+    status_parser.add_argument('--index', action='append', help='alias to show (default: every name in index.names)')
+
+    rebuild_parser = commands.add_parser('rebuild', help='build, warm and serve a new version')
+    rebuild_parser.add_argument('--index', action='append',
+                                help='alias to rebuild, repeatable (default: every name in index.names)')
+    rebuild_parser.add_argument('--file', help='CSV or NDJSON dump to load (default: copy the live version)')
+    rebuild_parser.add_argument('--format', choices=['csv', 'ndjson'], help='dump format (default: from the extension)')
+    rebuild_parser.add_argument('--mapping', help='mapping file (default: mappings/<marketplace>_mapping.json)')
+    rebuild_parser.add_argument('--fresh', action='store_true', help='start over instead of resuming an unfinished build')
+    rebuild_parser.add_argument('--id-field', default='product_id', help="field used as the document _id")
+    rebuild_parser.add_argument('--workers', type=int, default=4, help='parallel bulk threads')
+    rebuild_parser.add_argument('--chunk-docs', type=int, default=500, help='documents per bulk request')
+    rebuild_parser.add_argument('--batch-docs', type=int, default=5000, help='documents per checkpoint')
+    rebuild_parser.add_argument('--max-retries', type=int, default=8, help='retries for documents rejected with 429')
+    rebuild_parser.add_argument('--max-num-segments', type=int, default=1, help='force-merge target')
+    rebuild_parser.add_argument('--min-doc-ratio', type=float, default=0.95,
+                                help='minimum documents in the new version relative to the live one')
+    rebuild_parser.add_argument('--warm-from', action='append', default=[],
+                                help='app URL serving /cache/top_queries or NDJSON file of /search bodies, repeatable')
+    rebuild_parser.add_argument('--warm-limit', type=int, default=100, help='queries to warm with per source')
+    rebuild_parser.add_argument('--no-swap', action='store_true', help='build and warm, but leave the alias alone')
+    rebuild_parser.add_argument('--replace-index', action='store_true',
+                                help='delete a concrete index named like the alias when swapping')
+    rebuild_parser.add_argument('--keep', type=int, default=1, help='older versions to keep for rollback')
+
+    swap_parser = commands.add_parser('swap', help='serve a given version')
+    swap_parser.add_argument('--index', required=True, help='alias to move')
+    swap_parser.add_argument('--version', type=int, required=True, help='version to serve')
+    swap_parser.add_argument('--replace-index', action='store_true',
+                             help='delete a concrete index named like the alias')
+
+    rollback_parser = commands.add_parser('rollback', help='serve the previous version again')
+    rollback_parser.add_argument('--index', required=True, help='alias to roll back')
+    args = parser.parse_args()
+
+    es_url, api_key = load_environment()
+    es = Elasticsearch(es_url, api_key=api_key, verify_certs=False, request_timeout=args.request_timeout,
+                       retry_on_timeout=True, max_retries=3)
+
+    if args.command == 'status':
+        for alias in args.index or load_index_names():
+            print_status(es, alias)
+    elif args.command == 'rebuild':
+        aliases = args.index or load_index_names()
+        if args.file and len(aliases) != 1:
+            parser.error('--file needs exactly one --index')
+        for alias in aliases:
+            try:
+                rebuild(es, alias, args)
+            except (RuntimeError, ValueError) as e:
+                print(f"Error: {alias}: {e}")
+                sys.exit(1)
+    elif args.command == 'swap':
+        index = versioned_name(args.index, args.version)
+        try:
+            if not es.indices.exists(index=index):
+                raise ValueError(f"{index} does not exist")
+            swap_alias(es, args.index, index, replace_index=args.replace_index)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"{args.index} -> {index}")
+    elif args.command == 'rollback':
+        try:
+            index = previous_version(es, args.index)
+            swap_alias(es, args.index, index)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        print(f"{args.index} -> {index}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+"""
+Shared hit -> product card mapping for the search apps.
+
+- PRODUCT_CARD_FIELDS is the projection every product query asks for
+  (`"_source": PRODUCT_CARD_FIELDS`), so Elasticsearch ships only what the
+  cards show.
+- map_hits() converts a whole hits array in one pass into ProductCard records
+  (slotted dataclasses, no per-hit dict); card_from_source() builds one from
+  a cached _source (see product_cards.py).
+- dumps() serializes with orjson when it is installed and falls back to the
+  standard json module. Either way cards go through ProductCard.to_dict(),
+  which leaves out score and highlights when they are not set, as the
+  per-app card dicts did.
+"""
+
+import json
+from dataclasses import dataclass
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+# (field, default when missing from the hit)
+CARD_FIELD_DEFAULTS = (
+    ('product_id', ''),
+    ('product_name', ''),
+    ('description', ''),
+    ('main_image', ''),
+    ('final_price', 0),
+    ('currency', ''),
+    ('rating', 0),
+    ('reviews_count', 0),
+    ('in_stock', False),
+    ('model_number', '')
+)
+
+PRODUCT_CARD_FIELDS = [field for field, default in CARD_FIELD_DEFAULTS]
+
+# Card keys only present in a response when they have a value
+OPTIONAL_CARD_FIELDS = ('score', 'highlights')
+
+@dataclass
+class ProductCard:
+    """Compact product card returned to the UI"""
+    __slots__ = ('id', 'score', *PRODUCT_CARD_FIELDS, 'highlights')
+
+    id: str
+    score: float
+    product_id: str
+    product_name: str
+    description: str
+    main_image: str
+    final_price: float
+    currency: str
+    rating: float
+    reviews_count: int
+    in_stock: bool
+    model_number: str
+    highlights: dict
+
+    def to_dict(self):
+        card = {name: getattr(self, name) for name in self.__slots__}
+        for name in OPTIONAL_CARD_FIELDS:
+            if card[name] is None:
+                del card[name]
+        return card
+
+def _fields_to_source(fields):
+    # Responses using the `fields` option return every value as a list
+    return {name: values[0] if isinstance(values, list) and values else values
+            for name, values in fields.items()}
+
+def map_hits(hits, include_score=True, include_highlights=True):
+    """Convert a hits array into a list of ProductCard records"""
+    cards = []
+    append = cards.append
+    for hit in hits:
+        source = hit.get('_source')
+        if source is None:
+            source = _fields_to_source(hit.get('fields', {}))
+        get = source.get
+        append(ProductCard(
+            hit['_id'],
+            hit.get('_score') if include_score else None,
+            get('product_id', ''),
+            get('product_name', ''),
+            get('description', ''),
+            get('main_image', ''),
+            get('final_price', 0),
+            get('currency', ''),
+            get('rating', 0),
+            get('reviews_count', 0),
+            get('in_stock', False),
+            get('model_number', ''),
+            hit.get('highlight') if include_highlights else None
+        ))
+    return cards
+
+def card_from_source(doc_id, source, score=None, highlights=None):
+    get = source.get
+    return ProductCard(
+        doc_id,
+        score,
+        get('product_id', ''),
+        get('product_name', ''),
+        get('description', ''),
+        get('main_image', ''),
+        get('final_price', 0),
+        get('currency', ''),
+        get('rating', 0),
+        get('reviews_count', 0),
+        get('in_stock', False),
+        get('model_number', ''),
+        highlights
+    )
+
+def map_hit(hit, include_score=True, include_highlights=True):
+    return map_hits((hit,), include_score, include_highlights)[0]
+
+def _default(obj):
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+if orjson is not None:
+    # Dataclasses are passed to _default so that ProductCard.to_dict() drops unset optional fields
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_PASSTHROUGH_DATACLASS
+
+    def dumps_bytes(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS)
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode('utf-8')
+
+    loads = orjson.loads
+else:
+    def dumps(obj):
+        return json.dumps(obj, default=_default, ensure_ascii=False, separators=(',', ':'))
+
+    def dumps_bytes(obj):
+        return dumps(obj).encode('utf-8')
+
+    loads = json.loads
+
+class FastJSONMixin:
+    """Mix into a Flask/Quart JSON provider to serialize responses with dumps()"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj)
+
+    def loads(self, s, **kwargs):
+        return loads(s)
@@ -3,8 +3,12 @@ import json
 import signal
 import sys
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import DefaultJSONProvider
 from elasticsearch import Elasticsearch
 from dotenv import load_dotenv
+from metrics import PROMETHEUS_MIMETYPE, RequestTimer, render_metrics
+from result_mapper import PRODUCT_CARD_FIELDS, FastJSONMixin, map_hit, map_hits
+from streaming import NDJSON_MIMETYPE, ndjson_stream, wants_ndjson, wants_query_echo
 
 # Load environment variables from variables.env
 # Handle both export format and key=value format
@@ -45,7 +49,11 @@ def load_env_variables():
 # Load environment variables
 load_env_variables()
 
+class JSONProvider(FastJSONMixin, DefaultJSONProvider):
+    pass
+
 app = Flask(__name__)
+app.json = JSONProvider(app)
 
 # Elasticsearch configuration
 ES_URL = os.getenv('ES_URL')
@@ -53,12 +61,16 @@ ES_API_KEY = os.getenv('ES_API_KEY')
 INDEX_NAME = os.getenv('INDEX_NAME', 'ecommerce_shein_products')
 KIBANA_QUERY_RULES = os.getenv('KIBANA_QUERY_RULES')
 
+def create_es_client():
+    """Elasticsearch client for this process (serve.py creates one per worker after fork)"""
+    return Elasticsearch(
+        ES_URL,
+        api_key=ES_API_KEY,
+        verify_certs=False
+    )
+
 # Initialize Elasticsearch client
-es = Elasticsearch(
-    ES_URL,
-    api_key=ES_API_KEY,
-    verify_certs=False
-)
+es = create_es_client()
 
 @app.route('/')
 def index():
@@ -66,10 +78,13 @@ def index():
 
 @app.route('/search', methods=['POST'])
 def search():
+    timer = RequestTimer('/search')
     try:
-        data = request.get_json()
-        query_text = data.get('query', '')
-        search_type = data.get('search_type', 'text')  # 'text' or 'rules'
+        with timer.stage('parse'):
+            data = request.get_json()
+            query_text = data.get('query', '')
+            search_type = data.get('search_type', 'text')  # 'text' or 'rules'
+        timer.search_type = search_type
         
         if not query_text.strip():
             return jsonify({
@@ -78,76 +93,40 @@ def search():
             }), 400
         
         # Generate query based on search type
-        if search_type == 'text':
-            search_query = {
-                "query": {
-                    "match": {
-                        "product_name": query_text
-                    }
-                }
-            }
-        else:  # rules
-            search_query = {
-                "retriever": {
-                    "rule": {
-                        "match_criteria": {
-                            "product_name": query_text
-                        },
-                        "ruleset_ids": [
-                            "labubu"
-                        ],
-                        "retriever": {
-                            "standard": {
-                                "query": {
-                                    "match": {
-                                        "product_name": query_text
-                                    }
-                                }
-                            }
-                        }
-                    }
-                }
-            }
+        with timer.stage('build'):
+            search_query = generate_search_query(query_text, search_type)
         
         # Execute the search
-        response = es.search(
-            index=INDEX_NAME,
-            body=search_query
-        )
+        with timer.stage('es'):
+            response = es.search(
+                index=INDEX_NAME,
+                body=search_query
+            )
+        timer.took(response)
+        
+        # Stream one product per line if the client asked for NDJSON
+        if wants_ndjson(request):
+            header = {'success': True, 'total': response['hits']['total']['value'], 'search_type': search_type}
+            if wants_query_echo(request, data):
+                header['query'] = search_query
+            products = (map_hit(hit) for hit in response['hits']['hits'])
+            return app.response_class(timer.timed_stream(ndjson_stream(app.json.dumps, header, products), search_query),
+                                      mimetype=NDJSON_MIMETYPE)
         
         # Process results
-        products = []
-        for hit in response['hits']['hits']:
-            source = hit['_source']
-            
-            product = {
-                'id': hit['_id'],
-                'score': hit['_score'],
-                'product_id': source.get('product_id', ''),
-                'product_name': source.get('product_name', ''),
-                'description': source.get('description', ''),
-                'main_image': source.get('main_image', ''),
-                'final_price': source.get('final_price', 0),
-                'currency': source.get('currency', ''),
-                'rating': source.get('rating', 0),
-                'reviews_count': source.get('reviews_count', 0),
-                'in_stock': source.get('in_stock', False),
-                'model_number': source.get('model_number', '')
-            }
-            
-            # Add highlights if available
-            if 'highlight' in hit:
-                product['highlights'] = hit['highlight']
-            
-            products.append(product)
+        with timer.stage('map'):
+            products = map_hits(response['hits']['hits'])
         
-        return jsonify({
-            'success': True,
-            'products': products,
-            'total': response['hits']['total']['value'],
-            'query': search_query,
-            'search_type': search_type
-        })
+        with timer.stage('serialize'):
+            search_response = jsonify({
+                'success': True,
+                'products': products,
+                'total': response['hits']['total']['value'],
+                'query': search_query,
+                'search_type': search_type
+            })
+        timer.finish(search_query)
+        return search_response
         
     except Exception as e:
         return jsonify({
@@ -176,6 +155,49 @@ def get_kibana_query_rules_url():
             'error': str(e)
         }), 500
 
+def generate_search_query(query_text, search_type):
+    """Build the text or query rules search query"""
+    
+    if search_type == 'text':
+        search_query = {
+            "_source": PRODUCT_CARD_FIELDS,
+            "query": {
+                "match": {
+                    "product_name": query_text
+                }
+            }
+        }
+    else:  # rules
+        search_query = {
+            "_source": PRODUCT_CARD_FIELDS,
+            "retriever": {
+                "rule": {
+                    "match_criteria": {
+                        "product_name": query_text
+                    },
+                    "ruleset_ids": [
+                        "labubu"
+                    ],
+                    "retriever": {
+                        "standard": {
+                            "query": {
+                                "match": {
+                                    "product_name": query_text
+                                }
+                            }
+                        }
+                    }
+                }
+            }
+        }
+    
+    return search_query
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Per-stage latency histograms in the Prometheus text format"""
+    return app.response_class(render_metrics(), content_type=PROMETHEUS_MIMETYPE)
+
 def signal_handler(sig, frame):
     print('\nShutting down gracefully...')
     sys.exit(0)
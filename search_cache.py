@@ -0,0 +1,249 @@
+"""
+Tiered result cache for the Hybrid Search App's /search endpoint.
+
+Entries live in a size-bounded in-process LRU and, when a cache directory is
+configured, in an SQLite file that survives restarts. Every entry carries a TTL
+and the index version it was computed against; when the version reported by
+version_fn changes (documents were indexed, deleted or refreshed) older entries
+are treated as stale.
+
+Entries stored with a label (the request that produced them) are also counted
+per request, so top() can list the most requested queries, e.g. for warming a
+rebuilt index before it goes live (see reindex.py).
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+def _to_json(obj):
+    # Records such as result_mapper.ProductCard are stored as plain dicts
+    if hasattr(obj, 'to_dict'):
+        return obj.to_dict()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def normalize_query_text(query_text):
+    """Collapse whitespace so trivially different queries share an entry
+
+    Case is kept: the term, prefix and wildcard clauses on the keyword ID fields
+    are case-sensitive, so "SW2211" and "sw2211" can return different hits.
+    """
+    return ' '.join(str(query_text).split())
+
+def make_cache_key(query_text, weights, multi_match_fields, enable_reranking, rerank_field):
+    """Build a stable key from everything that influences the /search response"""
+    key_material = json.dumps([
+        normalize_query_text(query_text),
+        sorted(weights.items()),
+        list(multi_match_fields or []),
+        bool(enable_reranking),
+        rerank_field if enable_reranking else None
+    ], separators=(',', ':'), default=str)
+    return hashlib.sha1(key_material.encode('utf-8')).hexdigest()
+
+class SearchResultCache:
+    """In-process LRU tier backed by an optional on-disk tier"""
+
+    def __init__(self, max_entries=1024, ttl=300, cache_dir=None, version_fn=None, version_check_interval=5):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.version_fn = version_fn
+        self.version_check_interval = version_check_interval
+
+        self._memory = OrderedDict()
+        # key -> [requests, label]; bounded like the memory tier but kept across invalidations
+        self._popularity = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked_at = 0.0
+        self.stats = {
+            'memory_hits': 0,
+            'disk_hits': 0,
+            'misses': 0,
+            'evictions': 0,
+            'expirations': 0,
+            'invalidations': 0
+        }
+
+        self._disk = None
+        self._disk_path = None
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._disk_path = os.path.join(cache_dir, 'search_cache.sqlite3')
+            self._disk = self._connect()
+            self._disk.execute('DELETE FROM results WHERE stored_at < ?', (time.time() - ttl,))
+            self._disk.commit()
+
+    def _connect(self):
+        disk = sqlite3.connect(self._disk_path, check_same_thread=False)
+        disk.execute(
+            'CREATE TABLE IF NOT EXISTS results '
+            '(key TEXT PRIMARY KEY, value TEXT, version TEXT, stored_at REAL)'
+        )
+        return disk
+
+    def reopen(self):
+        """Give a forked process its own lock and SQLite connection (connections must not cross fork())"""
+        self._lock = threading.Lock()
+        if self._disk is not None:
+            self._disk = self._connect()
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def current_version(self):
+        """Return the index version marker, re-checking it at most every version_check_interval seconds"""
+        if self.version_fn is None:
+            return None
+
+        now = time.monotonic()
+        if now - self._version_checked_at < self.version_check_interval:
+            return self._version
+
+        self._version_checked_at = now
+        try:
+            version = self.version_fn()
+        except Exception as e:
+            print(f"Warning: could not read index version, bypassing result cache: {e}")
+            # An unknown version never matches a stored entry
+            self._version = None
+            return None
+        if version is None:
+            # Not known yet (e.g. before the first poll): bypass the cache like a failed read
+            self._version = None
+            return None
+        version = str(version)
+
+        if version != self._version:
+            with self._lock:
+                if self._version is not None:
+                    self.stats['invalidations'] += 1
+                self._memory.clear()
+                if self._disk is not None:
+                    self._disk.execute('DELETE FROM results WHERE version != ?', (version,))
+                    self._disk.commit()
+            self._version = version
+        return version
+
+    def get(self, key):
+        """Return the cached value for key or None"""
+        if not self.enabled:
+            return None
+
+        version = self.current_version()
+        if self.version_fn is not None and version is None:
+            self.stats['misses'] += 1
+            return None
+
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                value, entry_version, stored_at = entry
+                if now - stored_at <= self.ttl and entry_version == version:
+                    self._memory.move_to_end(key)
+                    self._count_request(key)
+                    self.stats['memory_hits'] += 1
+                    return value
+                del self._memory[key]
+                self.stats['expirations'] += 1
+
+            if self._disk is not None:
+                row = self._disk.execute(
+                    'SELECT value, version, stored_at FROM results WHERE key = ?', (key,)
+                ).fetchone()
+                if row is not None:
+                    value_json, entry_version, stored_at = row
+                    if now - stored_at <= self.ttl and entry_version == (version or ''):
+                        value = json.loads(value_json)
+                        self._store_memory(key, value, version, stored_at)
+                        self._count_request(key)
+                        self.stats['disk_hits'] += 1
+                        return value
+                    self._disk.execute('DELETE FROM results WHERE key = ?', (key,))
+                    self._disk.commit()
+                    self.stats['expirations'] += 1
+
+            self.stats['misses'] += 1
+            return None
+
+    def set(self, key, value, label=None):
+        """Store value (a JSON-serializable object) under key in every tier
+
+        label (e.g. the request parameters) is what top() reports for key.
+        """
+        if not self.enabled:
+            return
+
+        version = self.current_version()
+        if self.version_fn is not None and version is None:
+            return
+
+        stored_at = time.time()
+        with self._lock:
+            self._store_memory(key, value, version, stored_at)
+            if label is not None:
+                self._count_request(key, label)
+            if self._disk is not None:
+                self._disk.execute(
+                    'INSERT OR REPLACE INTO results (key, value, version, stored_at) VALUES (?, ?, ?, ?)',
+                    (key, json.dumps(value, separators=(',', ':'), default=_to_json), version or '', stored_at)
+                )
+                self._disk.commit()
+
+    def _store_memory(self, key, value, version, stored_at):
+        self._memory[key] = (value, version, stored_at)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self.stats['evictions'] += 1
+
+    def _count_request(self, key, label=None):
+        entry = self._popularity.get(key)
+        if entry is None:
+            if label is None:
+                return
+            entry = self._popularity[key] = [0, label]
+        entry[0] += 1
+        self._popularity.move_to_end(key)
+        while len(self._popularity) > self.max_entries:
+            self._popularity.popitem(last=False)
+
+    def top(self, n=100):
+        """Return the labels of the n most requested keys, most requested first, each with its request count"""
+        with self._lock:
+            entries = sorted(self._popularity.values(), key=lambda entry: entry[0], reverse=True)[:n]
+        return [{'requests': requests, **label} for requests, label in entries]
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._popularity.clear()
+            if self._disk is not None:
+                self._disk.execute('DELETE FROM results')
+                self._disk.commit()
+
+    def info(self):
+        """Return counters and sizes for sizing the cache"""
+        with self._lock:
+            memory_entries = len(self._memory)
+            disk_entries = None
+            if self._disk is not None:
+                disk_entries = self._disk.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+        lookups = self.stats['memory_hits'] + self.stats['disk_hits'] + self.stats['misses']
+        hits = self.stats['memory_hits'] + self.stats['disk_hits']
+        return {
+            **self.stats,
+            'hit_ratio': round(hits / lookups, 4) if lookups else 0.0,
+            'memory_entries': memory_entries,
+            'max_entries': self.max_entries,
+            'disk_entries': disk_entries,
+            'ttl': self.ttl,
+            'index_version': self._version
+        }
@@ -0,0 +1,131 @@
+"""
+Production entry point for the search applications.
+
+Serves the Hybrid Search, Synonym and Rules apps from one gunicorn server with
+a pool of worker processes, configured by gunicorn.conf.py:
+
+    gunicorn                      # app.py, simple_app.py, rules_app.py on threaded workers
+    SERVE_MODE=asgi gunicorn      # the async_app.py apps on uvicorn workers
+
+The three apps define the same routes (/, /search, /metrics) and their
+frontends call them by absolute path, so each app keeps its own port and a
+port dispatcher hands every request to the app bound to the port it arrived
+on (HYBRID_PORT, SYNONYM_PORT and RULES_PORT, default 8080, 8046 and 8047).
+
+The master imports the apps once before forking (preload_app), so the workers
+share the imported code and the suggestion index it builds. Everything that
+must not cross fork() is created in each worker by init_worker(): the
+Elasticsearch clients, the SQLite connections of the cache disk tiers and the
+background pollers. SIGHUP replaces the workers gracefully; the new ones
+re-read the Elasticsearch URL and API key from variables.env.
+"""
+
+import asyncio
+import os
+
+# Threads do not survive fork(); init_worker() starts them in every worker
+os.environ['START_BACKGROUND_TASKS'] = 'false'
+
+import app as hybrid
+import rules_app as rules
+import simple_app as synonyms
+
+SERVE_MODE = os.getenv('SERVE_MODE', 'wsgi')
+HYBRID_PORT = int(os.getenv('HYBRID_PORT', '8080'))
+SYNONYM_PORT = int(os.getenv('SYNONYM_PORT', '8046'))
+RULES_PORT = int(os.getenv('RULES_PORT', '8047'))
+
+APP_MODULES = (hybrid, synonyms, rules)
+
+class PortDispatcher:
+    """WSGI app passing each request to the app bound to the port it arrived on"""
+
+    def __init__(self, apps, default):
+        self.apps = {str(port): app for port, app in apps.items()}
+        self.default = default
+
+    def __call__(self, environ, start_response):
+        return self.apps.get(environ.get('SERVER_PORT'), self.default)(environ, start_response)
+
+class ASGIPortDispatcher:
+    """ASGI app passing each request to the app bound to the port it arrived on"""
+
+    def __init__(self, apps, default):
+        self.apps = apps
+        self.default = default
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(scope, receive, send)
+            return
+        port = scope['server'][1] if scope.get('server') else None
+        await self.apps.get(port, self.default)(scope, receive, send)
+
+    async def _lifespan(self, scope, receive, send):
+        """Forward startup and shutdown to every app and report back once all of them have answered"""
+        apps = list(dict.fromkeys([*self.apps.values(), self.default]))
+        inboxes = [asyncio.Queue() for _ in apps]
+        replies = asyncio.Queue()
+        tasks = [asyncio.create_task(app(scope, inbox.get, replies.put)) for app, inbox in zip(apps, inboxes)]
+        try:
+            while True:
+                message = await receive()
+                for inbox in inboxes:
+                    inbox.put_nowait(message)
+                phase = message['type'].split('.', 1)[1]
+                answers = [await replies.get() for _ in apps]
+                failed = [answer for answer in answers if answer['type'].endswith('.failed')]
+                await send(failed[0] if failed else {'type': f'lifespan.{phase}.complete'})
+                if failed or phase == 'shutdown':
+                    return
+        finally:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+wsgi_app = PortDispatcher(
+    {HYBRID_PORT: hybrid.app, SYNONYM_PORT: synonyms.app, RULES_PORT: rules.app},
+    default=hybrid.app
+)
+
+async_app = None
+asgi_app = None
+if SERVE_MODE == 'asgi':
+    import async_app
+    asgi_app = ASGIPortDispatcher(
+        {HYBRID_PORT: async_app.hybrid_app, SYNONYM_PORT: async_app.synonym_app, RULES_PORT: async_app.rules_app},
+        default=async_app.hybrid_app
+    )
+
+def preload():
+    """Work done once in the master, before the workers are forked"""
+    if hybrid.SUGGEST_SOURCE == 'memory':
+        try:
+            print(f"Built suggestions for {hybrid.suggestion_index.rebuild(hybrid.es)} products")
+        except Exception as e:
+            print(f"Warning: could not build suggestions: {e}")
+    # Connections opened so far must not be shared by the workers
+    for module in APP_MODULES:
+        module.es.close()
+
+def init_worker():
+    """Per-worker setup after fork: Elasticsearch clients, SQLite connections and background pollers"""
+    if os.path.exists('variables.env'):
+        hybrid.load_env_variables()
+    for module in APP_MODULES:
+        module.ES_URL = os.getenv('ES_URL')
+        module.ES_API_KEY = os.getenv('ES_API_KEY')
+        module.es = module.create_es_client()
+
+    hybrid.search_cache.reopen()
+    if hybrid.card_store is not None:
+        hybrid.card_store.reopen()
+    if async_app is not None:
+        # The AsyncElasticsearch client itself is created lazily on the worker's event loop
+        async_app.ES_URL = os.getenv('ES_URL')
+        async_app.ES_API_KEY = os.getenv('ES_API_KEY')
+        async_app.search_cache.reopen()
+    hybrid.start_background_tasks()
+
+def shutdown_worker():
+    hybrid.stop_background_tasks()
+    for module in APP_MODULES:
+        module.es.close()
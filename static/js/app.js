@@ -27,7 +27,10 @@ class EcommerceSearch {
         this.multiMatchFields = ['description', 'product_name'];
         this.enableReranking = false;
         this.rerankField = 'description';
+        this.fusionMethod = '';
         this.queryUpdateTimeout = null;
+        this.fusionSearchTimeout = null;
+        this.suggestTimeout = null;
         this.currentQuery = '';
         
         this.initializeEventListeners();
@@ -47,6 +50,14 @@ class EcommerceSearch {
             }
         });
         
+        // Typeahead suggestions, served from the app's in-memory prefix index
+        document.getElementById('searchQuery').addEventListener('input', (e) => {
+            clearTimeout(this.suggestTimeout);
+            this.suggestTimeout = setTimeout(() => {
+                this.updateSuggestions(e.target.value);
+            }, 50);
+        });
+        
         // Weight slider changes with debouncing
         document.querySelectorAll('.weight-slider').forEach(slider => {
             slider.addEventListener('input', (e) => {
@@ -82,6 +93,12 @@ class EcommerceSearch {
             this.scheduleQueryUpdate();
         });
         
+        // Client-side fusion dropdown
+        document.getElementById('fusionMethod').addEventListener('change', (e) => {
+            this.fusionMethod = e.target.value;
+            this.performSearch();
+        });
+        
         // Show query button
         document.getElementById('showQueryBtn').addEventListener('click', () => {
             this.showGeneratedQuery();
@@ -272,7 +289,41 @@ class EcommerceSearch {
         this.scheduleQueryUpdate();
     }
     
+    async updateSuggestions(prefix) {
+        const datalist = document.getElementById('searchSuggestions');
+        if (!prefix.trim()) {
+            datalist.innerHTML = '';
+            return;
+        }
+        
+        try {
+            const response = await fetch(`/suggest?q=${encodeURIComponent(prefix)}&size=8`);
+            const data = await response.json();
+            if (!data.success) {
+                return;
+            }
+            
+            datalist.innerHTML = '';
+            data.suggestions.forEach(suggestion => {
+                const option = document.createElement('option');
+                option.value = suggestion.text;
+                datalist.appendChild(option);
+            });
+        } catch (error) {
+            console.error('Suggestion error:', error);
+        }
+    }
+    
     scheduleQueryUpdate() {
+        // Fused results are re-ranked from cached retriever lists, so refresh them right away
+        if (this.fusionMethod) {
+            clearTimeout(this.fusionSearchTimeout);
+            this.fusionSearchTimeout = setTimeout(() => {
+                this.performSearch();
+            }, 250);
+            return;
+        }
+        
         // Clear existing timeout
         if (this.queryUpdateTimeout) {
             clearTimeout(this.queryUpdateTimeout);
@@ -322,7 +373,7 @@ class EcommerceSearch {
         this.showLoading();
         
         try {
-            const response = await fetch('/search', {
+            const response = await fetch(this.fusionMethod ? '/search/fusion' : '/search', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
@@ -332,7 +383,8 @@ class EcommerceSearch {
                     weights: this.getEnabledWeights(),
                     multi_match_fields: this.multiMatchFields,
                     enable_reranking: this.enableReranking,
-                    rerank_field: this.rerankField
+                    rerank_field: this.rerankField,
+                    fusion: this.fusionMethod || undefined
                 })
             });
             
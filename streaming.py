@@ -0,0 +1,35 @@
+"""
+NDJSON streaming helpers shared by the search apps.
+
+A client opts into streaming with `Accept: application/x-ndjson` or `?stream=1`.
+The stream starts with one header line ({"success": true, "total": ...}, plus
+the generated query when asked for with `?include_query=1` or
+"include_query": true in the body) followed by one product card per line, each
+written as soon as it is converted from its hit.
+"""
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+
+_TRUTHY = ('1', 'true', 'yes')
+
+def wants_ndjson(request):
+    """True if the client asked for a streamed NDJSON response"""
+    if request.args.get('stream', '').lower() in _TRUTHY:
+        return True
+    return any(mimetype == NDJSON_MIMETYPE for mimetype, quality in request.accept_mimetypes)
+
+def wants_query_echo(request, data):
+    """True if the streamed response should include the generated query"""
+    return request.args.get('include_query', '').lower() in _TRUTHY or bool(data.get('include_query'))
+
+def ndjson_stream(dumps, header, products, raw_query=None):
+    """Yield the header line, then one line per product
+
+    raw_query is an already-serialized query spliced into the header as-is.
+    """
+    header_json = dumps(header)
+    if raw_query is not None:
+        header_json = f'{header_json[:-1]},"query":{raw_query}}}'
+    yield header_json + '\n'
+    for product in products:
+        yield dumps(product) + '\n'
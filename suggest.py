@@ -0,0 +1,239 @@
+"""
+Search-as-you-type suggestions for the Hybrid Search App.
+
+SuggestionIndex keeps the product_name, model_number and product_id values of
+the product index in a sorted array and answers prefix lookups with bisect, so
+/suggest never calls Elasticsearch on the request path. The array is built
+from a point-in-time snapshot of the index at startup and kept up to date by a
+background thread:
+
+- refresh() only pages through documents whose watermark field (a date, e.g.
+  timestamp) is at or after the newest value seen so far, and merges their
+  entries into the array
+- rebuild() re-reads the whole index; it runs every full_rebuild_interval
+  seconds so deleted products drop out
+
+product_name is indexed from every word start ("dress" finds "Floral Summer
+Dress"); IDs only from their first character. Matches are ranked by
+reviews_count.
+
+suggest_query() is the Elasticsearch alternative: a bool_prefix multi_match
+on the search_as_you_type subfield the mappings add to the product name.
+"""
+
+import bisect
+import threading
+import time
+from operator import itemgetter
+
+from pagination import iter_pages
+
+SUGGEST_FIELDS = ('product_name', 'model_number', 'product_id')
+
+# Fields whose values are also indexed from every word start, not only from the first character
+WORD_PREFIX_FIELDS = ('product_name',)
+
+def normalize_prefix(text):
+    """Lowercase and collapse whitespace, the form keys are stored in"""
+    return ' '.join(text.lower().split())
+
+def _prefix_upper_bound(prefix):
+    """The smallest string greater than every string starting with prefix"""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+def suggest_query(prefix, size=10, field='product_name.suggest'):
+    """Search request for a search_as_you_type subfield (see mappings/)"""
+    return {
+        "_source": list(SUGGEST_FIELDS),
+        "query": {
+            "multi_match": {
+                "query": prefix,
+                "type": "bool_prefix",
+                "fields": [field, f"{field}._2gram", f"{field}._3gram"]
+            }
+        },
+        "size": size
+    }
+
+def suggestions_from_hits(hits):
+    return [
+        {
+            'text': hit['_source'].get('product_name', ''),
+            'field': 'product_name',
+            'product_id': hit['_source'].get('product_id', hit['_id'])
+        }
+        for hit in hits
+    ]
+
+class PrefixIndex:
+    """Immutable sorted array of (key, weight, doc_id, suggestion) entries"""
+
+    def __init__(self, entries):
+        # entries must already be sorted by key
+        self.entries = entries
+        self.keys = [entry[0] for entry in entries]
+
+    def lookup(self, prefix, size=10, max_scan=1000):
+        """Return up to size suggestions whose key starts with prefix, best first
+
+        At most max_scan matching entries are ranked, which bounds the cost of
+        one- and two-letter prefixes.
+        """
+        if not prefix:
+            return []
+        start = bisect.bisect_left(self.keys, prefix)
+        stop = min(bisect.bisect_left(self.keys, _prefix_upper_bound(prefix), lo=start), start + max_scan)
+        if start == stop:
+            return []
+
+        suggestions = []
+        seen = set()
+        for key, weight, doc_id, suggestion in sorted(self.entries[start:stop], key=itemgetter(1), reverse=True):
+            text_key = (suggestion['field'], suggestion['text'])
+            if text_key in seen:
+                continue
+            seen.add(text_key)
+            suggestions.append(suggestion)
+            if len(suggestions) == size:
+                break
+        return suggestions
+
+    def __len__(self):
+        return len(self.entries)
+
+class SuggestionIndex:
+    """In-process prefix index over a product index, refreshed from a watermark field"""
+
+    def __init__(self, index, fields=SUGGEST_FIELDS, watermark_field='timestamp', weight_field='reviews_count',
+                 page_size=1000, keep_alive='1m', max_scan=1000):
+        self.index = index
+        self.fields = tuple(fields)
+        self.watermark_field = watermark_field
+        self.weight_field = weight_field
+        self.page_size = page_size
+        self.keep_alive = keep_alive
+        self.max_scan = max_scan
+        self.snapshot = PrefixIndex([])
+        self.watermark = None
+        self.built_at = None
+        self.refreshed_at = None
+        self.documents = 0
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def _entries(self, hit):
+        """The (key, weight, doc_id, suggestion) entries of one document"""
+        source = hit['_source']
+        weight = source.get(self.weight_field) or 0
+        entries = []
+        for field in self.fields:
+            value = source.get(field)
+            if not value or not isinstance(value, str):
+                continue
+            suggestion = {'text': value, 'field': field, 'product_id': source.get('product_id', hit['_id'])}
+            key = normalize_prefix(value)
+            keys = [key]
+            if field in WORD_PREFIX_FIELDS:
+                words = key.split(' ')
+                keys.extend(' '.join(words[i:]) for i in range(1, len(words)))
+            entries.extend((word_key, weight, hit['_id'], suggestion) for word_key in dict.fromkeys(keys))
+        return entries
+
+    def _body(self, since=None):
+        body = {
+            "query": {"match_all": {}},
+            "docvalue_fields": [{"field": self.watermark_field, "format": "epoch_millis"}]
+        }
+        if since is not None:
+            body["query"] = {"range": {self.watermark_field: {"gte": since, "format": "epoch_millis"}}}
+        return body
+
+    def _scan(self, es, since=None):
+        """Return (entries by doc id, newest watermark) of the documents changed since the watermark"""
+        entries = {}
+        watermark = since
+        source_fields = list(dict.fromkeys(self.fields + ('product_id', self.weight_field)))
+        for hits in iter_pages(es, self.index, self._body(since), page_size=self.page_size,
+                               keep_alive=self.keep_alive, source_fields=source_fields):
+            for hit in hits:
+                entries[hit['_id']] = self._entries(hit)
+                values = hit.get('fields', {}).get(self.watermark_field)
+                if values:
+                    stamp = int(float(values[0]))
+                    watermark = stamp if watermark is None else max(watermark, stamp)
+        return entries, watermark
+
+    def rebuild(self, es):
+        """Replace the index with a fresh snapshot of every document; returns the number of documents"""
+        documents, watermark = self._scan(es)
+        entries = [entry for doc_entries in documents.values() for entry in doc_entries]
+        entries.sort(key=itemgetter(0))
+        with self._lock:
+            self.snapshot = PrefixIndex(entries)
+            self.documents = len(documents)
+            self.watermark = watermark
+            self.built_at = self.refreshed_at = time.time()
+        return len(documents)
+
+    def refresh(self, es):
+        """Merge documents changed since the watermark into the index; returns the number merged"""
+        if self.built_at is None or self.watermark is None:
+            return self.rebuild(es)
+
+        documents, watermark = self._scan(es, since=self.watermark)
+        with self._lock:
+            if documents:
+                # The kept entries are sorted already, so the sort is a linear merge of two runs
+                entries = [entry for entry in self.snapshot.entries if entry[2] not in documents]
+                kept_ids = len({entry[2] for entry in entries})
+                entries.extend(sorted((entry for doc_entries in documents.values() for entry in doc_entries),
+                                      key=itemgetter(0)))
+                entries.sort(key=itemgetter(0))
+                self.snapshot = PrefixIndex(entries)
+                self.documents = kept_ids + len(documents)
+            self.watermark = watermark
+            self.refreshed_at = time.time()
+        return len(documents)
+
+    def suggest(self, prefix, size=10):
+        return self.snapshot.lookup(normalize_prefix(prefix), size, self.max_scan)
+
+    def _run(self, es, refresh_interval, full_rebuild_interval):
+        next_rebuild = 0.0
+        if self.built_at is not None:
+            # Built before start() (e.g. by serve.py before forking its workers): only refresh it for now
+            next_rebuild = time.monotonic() + full_rebuild_interval - (time.time() - self.built_at)
+            if self._stopped.wait(refresh_interval):
+                return
+        while True:
+            try:
+                if time.monotonic() >= next_rebuild:
+                    self.rebuild(es)
+                    next_rebuild = time.monotonic() + full_rebuild_interval
+                else:
+                    self.refresh(es)
+            except Exception as e:
+                print(f"Warning: could not refresh suggestions: {e}")
+            if self._stopped.wait(refresh_interval):
+                return
+
+    def start(self, es, refresh_interval=60, full_rebuild_interval=3600):
+        """Build the index (unless it has been built already) and keep it refreshed from a daemon thread"""
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, args=(es, refresh_interval, full_rebuild_interval),
+                                        name='suggestion-index', daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stopped.set()
+
+    def info(self):
+        return {
+            'documents': self.documents,
+            'entries': len(self.snapshot),
+            'watermark': self.watermark,
+            'built_at': self.built_at,
+            'refreshed_at': self.refreshed_at
+        }
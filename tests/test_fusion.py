@@ -0,0 +1,39 @@
+import pytest
+
+from fusion import fuse
+
+# (weight, ids, scores) lists as the sub-retrievers return them, best first
+LISTS = [
+    (1.0, ['a', 'b', 'c'], [3.0, 2.0, 1.0]),
+    (0.6, ['b', 'd'], [4.0, 2.0])
+]
+
+def test_minmax_normalizes_each_list_and_weights_it():
+    ids, scores = fuse(LISTS, 'minmax')
+    # a: 1.0; b: 0.5 + 0.6 * 1.0; c: 0.0; d: 0.6 * 0.0
+    assert ids == ['b', 'a', 'c', 'd']
+    assert list(scores) == pytest.approx([1.1, 1.0, 0.0, 0.0])
+
+def test_minmax_gives_lists_of_equal_scores_full_credit():
+    ids, scores = fuse([(2.0, ['a', 'b'], [5.0, 5.0]), (1.0, ['b'], [0.1])], 'minmax')
+    assert ids == ['b', 'a']
+    assert list(scores) == pytest.approx([3.0, 2.0])
+
+def test_rrf_uses_ranks_not_scores():
+    ids, scores = fuse(LISTS, 'rrf', rank_constant=60)
+    assert ids == ['b', 'a', 'c', 'd']
+    assert list(scores) == pytest.approx([1 / 62 + 0.6 / 61, 1 / 61, 1 / 63, 0.6 / 62])
+
+def test_rrf_rank_constant():
+    ids, scores = fuse([(1.0, ['a', 'b'], [9.0, 1.0])], 'rrf', rank_constant=1)
+    assert ids == ['a', 'b']
+    assert list(scores) == pytest.approx([1 / 2, 1 / 3])
+
+def test_empty_lists():
+    ids, scores = fuse([(1.0, [], [])], 'minmax')
+    assert ids == []
+    assert len(scores) == 0
+
+def test_unknown_method():
+    with pytest.raises(ValueError):
+        fuse(LISTS, 'borda')
@@ -0,0 +1,58 @@
+import logging
+
+from metrics import Histogram, MetricsRegistry, RequestTimer
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = Histogram('latency_seconds', 'Latency.', ('route',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(('/search',), value)
+    assert histogram.render() == [
+        '# HELP latency_seconds Latency.',
+        '# TYPE latency_seconds histogram',
+        'latency_seconds_bucket{route="/search",le="0.1"} 2',
+        'latency_seconds_bucket{route="/search",le="1.0"} 3',
+        'latency_seconds_bucket{route="/search",le="+Inf"} 4',
+        'latency_seconds_sum{route="/search"} 2.65',
+        'latency_seconds_count{route="/search"} 4'
+    ]
+
+def test_label_values_are_escaped():
+    histogram = Histogram('h', 'H.', ('route',), buckets=())
+    histogram.observe(('say "hi"\n',), 1.0)
+    assert 'h_count{route="say \\"hi\\"\\n"} 1' in histogram.render()
+
+def test_timer_records_request_and_stages_once():
+    registry = MetricsRegistry(buckets=(1.0,))
+    timer = RequestTimer('/search', 'hybrid', registry=registry, slow_threshold_ms=float('inf'))
+    timer.rerank = True
+    with timer.stage('build'):
+        pass
+    timer.took({'took': 12})
+    timer.finish()
+    timer.finish()
+
+    text = registry.render()
+    assert 'search_request_seconds_count{route="/search",search_type="hybrid",rerank="true"} 1' in text
+    assert 'search_stage_seconds_count{route="/search",search_type="hybrid",rerank="true",stage="build"} 1' in text
+    assert 'search_stage_seconds_sum{route="/search",search_type="hybrid",rerank="true",stage="es_took"} 0.012' in text
+    assert not any(line.startswith('search_slow_queries_total{') for line in text.splitlines())
+
+def test_slow_requests_are_counted_and_logged(caplog):
+    registry = MetricsRegistry()
+    timer = RequestTimer('/search', 'hybrid', registry=registry, slow_threshold_ms=0)
+    logger = logging.getLogger('search.slow_queries')
+    logger.addHandler(caplog.handler)
+    try:
+        timer.finish({'query': {'match_all': {}}})
+    finally:
+        logger.removeHandler(caplog.handler)
+
+    assert 'search_slow_queries_total{route="/search",search_type="hybrid",rerank="false"} 1' in registry.render()
+    assert 'body={"query":{"match_all":{}}}' in caplog.text
+
+def test_timed_stream_finishes_when_the_stream_ends():
+    registry = MetricsRegistry()
+    timer = RequestTimer('/search', 'hybrid', registry=registry, slow_threshold_ms=float('inf'))
+    assert list(timer.timed_stream(iter(['a', 'b']))) == ['a', 'b']
+    assert timer.finished
+    assert 'stage="serialize"} 1' in registry.render()
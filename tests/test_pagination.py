@@ -0,0 +1,27 @@
+import base64
+
+import pytest
+
+from pagination import decode_cursor, encode_cursor
+
+def test_cursor_round_trip():
+    search_after = [12.5, 4294967297]
+    cursor = encode_cursor('46ToAwMDaWR5BXV1aWQy', search_after)
+    assert decode_cursor(cursor) == ('46ToAwMDaWR5BXV1aWQy', search_after)
+
+def test_cursor_is_url_safe():
+    cursor = encode_cursor('a+b/c==' * 20, ['~?&', 1.0])
+    assert set(cursor) <= set('ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789-_=')
+
+@pytest.mark.parametrize('cursor', [
+    '',
+    'not base64!',
+    base64.urlsafe_b64encode(b'not json').decode('ascii'),
+    base64.urlsafe_b64encode(b'{"pit_id": "x"}').decode('ascii'),
+    base64.urlsafe_b64encode(b'[1, 2]').decode('ascii'),
+    'é',
+    None
+])
+def test_malformed_cursors_raise_value_error(cursor):
+    with pytest.raises(ValueError):
+        decode_cursor(cursor)
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from query_embeddings import QueryEmbeddingCache, embedding_from_response, semantic_field_inference_ids
+
+FIELD_IDS = semantic_field_inference_ids({
+    'ELSER_INFERENCE_ID': 'elser',
+    'EMBEDDING_INFERENCE_ID': 'google',
+    'E5_INFERENCE_ID': 'e5'
+})
+
+WEIGHTS = {'description_semantic_elser': 1.0, 'product_name_semantic_elser': 1.0, 'description_semantic_e5': 1.0}
+
+class StubInference:
+    """Records inference requests and answers like the ELSER / dense endpoints"""
+
+    def __init__(self):
+        self.requests = []
+
+    def inference(self, inference_id, body):
+        self.requests.append((inference_id, body))
+        if inference_id == 'elser':
+            return {'sparse_embedding': [{'embedding': {'dog': 1.5}}]}
+        return {'text_embedding': [{'embedding': [0.1, 0.2]}]}
+
+class StubClient:
+    def __init__(self):
+        self.inference = StubInference()
+
+class AsyncStubInference(StubInference):
+    async def inference(self, inference_id, body):
+        return StubInference.inference(self, inference_id, body)
+
+class AsyncStubClient:
+    def __init__(self):
+        self.inference = AsyncStubInference()
+
+def test_semantic_field_inference_ids():
+    assert FIELD_IDS['description_semantic_elser'] == 'elser'
+    assert FIELD_IDS['product_name_semantic_google'] == 'google'
+    assert FIELD_IDS['product_name_semantic_e5'] == 'e5'
+    assert semantic_field_inference_ids({'ELSER_INFERENCE_ID': 'elser'}) == {
+        'description_semantic_elser': 'elser',
+        'product_name_semantic_elser': 'elser'
+    }
+
+def test_embedding_from_response():
+    assert embedding_from_response({'sparse_embedding': [{'embedding': {'a': 1.0}}]}) == {
+        'type': 'sparse', 'vector': {'a': 1.0}
+    }
+    assert embedding_from_response({'text_embedding': [{'embedding': [1.0]}]}) == {'type': 'dense', 'vector': [1.0]}
+    with pytest.raises(ValueError):
+        embedding_from_response({'completion': []})
+
+def test_one_call_per_model_for_the_weighted_fields():
+    es = StubClient()
+    vectors = QueryEmbeddingCache(FIELD_IDS).vectors_for(es, 'dog bed', WEIGHTS)
+    # Every field of an embedded model gets its vector; no Google field is weighted, so none is embedded
+    assert set(vectors) == set(WEIGHTS) | {'product_name_semantic_e5'}
+    assert vectors['description_semantic_e5'] == {'type': 'dense', 'vector': [0.1, 0.2]}
+    assert sorted(inference_id for inference_id, body in es.inference.requests) == ['e5', 'elser']
+
+def test_query_text_is_embedded_as_sent_with_the_search_input_type():
+    es = StubClient()
+    QueryEmbeddingCache(FIELD_IDS).vectors_for(es, '  Dog  Bed ', {'description_semantic_e5': 1.0})
+    assert es.inference.requests == [('e5', {'input': '  Dog  Bed ', 'input_type': 'SEARCH'})]
+
+def test_repeated_queries_are_served_from_the_cache():
+    es = StubClient()
+    cache = QueryEmbeddingCache(FIELD_IDS)
+    first = cache.vectors_for(es, 'dog bed', WEIGHTS)
+    assert cache.vectors_for(es, ' dog   bed', WEIGHTS) == first
+    assert cache.inference_calls == 2
+    assert len(es.inference.requests) == 2
+
+    # Case is part of the key, like the result cache's
+    cache.vectors_for(es, 'Dog bed', {'description_semantic_e5': 1.0})
+    assert cache.inference_calls == 3
+
+def test_async_client_embeds_missing_models_only():
+    es = AsyncStubClient()
+    cache = QueryEmbeddingCache(FIELD_IDS)
+    cache.vectors_for(StubClient(), 'dog bed', {'description_semantic_elser': 1.0})
+    vectors = asyncio.run(cache.avectors_for(es, 'dog bed', WEIGHTS))
+    assert set(WEIGHTS) <= set(vectors)
+    assert es.inference.requests == [('e5', {'input': 'dog bed', 'input_type': 'SEARCH'})]
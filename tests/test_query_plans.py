@@ -0,0 +1,62 @@
+import pytest
+
+import hybrid_query
+from hybrid_query import classify_query, id_infix_query, plan_weights, query_plan
+
+WEIGHTS = {
+    'product_name': 1.0,
+    'description': 1.0,
+    'description_semantic_elser': 1.0,
+    'model_number': 2.0,
+    'product_id': 2.0
+}
+
+@pytest.mark.parametrize('query_text, plan', [
+    ('SW2211', 'identifier'),
+    ('sw-2211-blk', 'identifier'),
+    ('P000123 A1B2', 'identifier'),
+    ('dog bed', 'prose'),
+    ('red-dress', 'prose'),
+    ('dog bed SW2211', 'mixed'),
+    ('iphone 15', 'mixed'),
+    ('', 'mixed'),
+    ('   ', 'mixed')
+])
+def test_classify_query(query_text, plan):
+    assert classify_query(query_text) == plan
+
+def test_query_plan_is_mixed_when_adaptive_plans_are_off(monkeypatch):
+    monkeypatch.setattr(hybrid_query, 'ADAPTIVE_QUERY_PLANS', False)
+    assert query_plan('SW2211') == 'mixed'
+    monkeypatch.setattr(hybrid_query, 'ADAPTIVE_QUERY_PLANS', True)
+    assert query_plan('SW2211') == 'identifier'
+
+def test_identifier_plan_keeps_id_fields():
+    assert plan_weights(WEIGHTS, 'identifier') == {'model_number': 2.0, 'product_id': 2.0}
+
+def test_prose_plan_drops_id_fields():
+    assert plan_weights(WEIGHTS, 'prose') == {
+        'product_name': 1.0,
+        'description': 1.0,
+        'description_semantic_elser': 1.0
+    }
+
+def test_mixed_plan_keeps_every_weight():
+    assert plan_weights(WEIGHTS, 'mixed') is WEIGHTS
+
+def test_plan_leaving_no_clause_keeps_every_weight():
+    assert plan_weights({'description': 1.0}, 'identifier') == {'description': 1.0}
+    assert plan_weights({'model_number': 2.0}, 'prose') == {'model_number': 2.0}
+
+def test_id_infix_query_skips_wildcard_for_identifiers(monkeypatch):
+    monkeypatch.setattr(hybrid_query, 'ID_INFIX_MATCH', 'wildcard')
+    assert id_infix_query('model_number', 'SW22', plan='identifier') is None
+    assert id_infix_query('model_number', 'SW22', boost=2.0) == {
+        'wildcard': {'model_number': {'boost': 2.0, 'value': '*SW22*'}}
+    }
+
+def test_id_infix_query_uses_ngram_subfield(monkeypatch):
+    monkeypatch.setattr(hybrid_query, 'ID_INFIX_MATCH', 'ngram')
+    assert id_infix_query('product_id', 'SW22', plan='identifier') == {
+        'match': {'product_id.ngram': {'query': 'SW22', 'operator': 'and'}}
+    }
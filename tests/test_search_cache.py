@@ -0,0 +1,161 @@
+from search_cache import SearchResultCache, make_cache_key, normalize_query_text
+
+WEIGHTS = {'description': 1.0, 'model_number': 2.0}
+
+def key(query_text, weights=WEIGHTS, fields=('description', 'product_name'), rerank=False, rerank_field='description'):
+    return make_cache_key(query_text, weights, list(fields), rerank, rerank_field)
+
+class Version:
+    """Index version marker the tests can change"""
+
+    def __init__(self, value='1'):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+def test_normalize_query_text_collapses_whitespace():
+    assert normalize_query_text('  dog \t bed\n') == 'dog bed'
+
+def test_normalize_query_text_keeps_case():
+    assert normalize_query_text('SW2211') == 'SW2211'
+    assert normalize_query_text('SW2211') != normalize_query_text('sw2211')
+
+def test_make_cache_key_ignores_whitespace_and_weight_order():
+    assert key(' dog  bed ') == key('dog bed')
+    assert key('dog bed', {'model_number': 2.0, 'description': 1.0}) == key('dog bed')
+
+def test_make_cache_key_depends_on_every_parameter():
+    keys = {
+        key('dog bed'),
+        key('Dog bed'),
+        key('dog bed', {'description': 1.0}),
+        key('dog bed', fields=('description',)),
+        key('dog bed', rerank=True),
+        key('dog bed', rerank=True, rerank_field='product_name')
+    }
+    assert len(keys) == 6
+
+def test_make_cache_key_ignores_rerank_field_without_reranking():
+    assert key('dog bed', rerank_field='product_name') == key('dog bed')
+
+def test_get_returns_stored_value():
+    cache = SearchResultCache(max_entries=10)
+    cache.set('k', {'total': 1})
+    assert cache.get('k') == {'total': 1}
+    assert cache.get('other') is None
+    assert cache.info()['memory_hits'] == 1
+    assert cache.info()['misses'] == 1
+
+def test_lru_evicts_least_recently_used():
+    cache = SearchResultCache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert cache.get('a') == 1
+    assert cache.get('c') == 3
+    assert cache.info()['evictions'] == 1
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr('search_cache.time.time', lambda: now[0])
+    cache = SearchResultCache(max_entries=10, ttl=300)
+    cache.set('k', 1)
+    now[0] += 300
+    assert cache.get('k') == 1
+    now[0] += 1
+    assert cache.get('k') is None
+    assert cache.info()['expirations'] == 1
+
+def test_version_change_invalidates_entries():
+    version = Version()
+    cache = SearchResultCache(max_entries=10, version_fn=version, version_check_interval=0)
+    cache.set('k', 1)
+    assert cache.get('k') == 1
+
+    version.value = '2'
+    assert cache.get('k') is None
+    assert cache.info()['invalidations'] == 1
+    assert cache.info()['index_version'] == '2'
+
+    cache.set('k', 2)
+    assert cache.get('k') == 2
+
+def test_version_is_checked_at_most_every_interval(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr('search_cache.time.monotonic', lambda: now[0])
+    version = Version()
+    cache = SearchResultCache(max_entries=10, version_fn=version, version_check_interval=5)
+    cache.set('k', 1)
+    version.value = '2'
+    assert cache.get('k') == 1
+    now[0] += 5
+    assert cache.get('k') is None
+    assert version.calls == 2
+
+def test_disk_tier_survives_a_new_cache(tmp_path):
+    cache = SearchResultCache(max_entries=10, cache_dir=str(tmp_path))
+    cache.set('k', {'products': [{'id': '1'}], 'total': 1})
+
+    reopened = SearchResultCache(max_entries=10, cache_dir=str(tmp_path))
+    assert reopened.get('k') == {'products': [{'id': '1'}], 'total': 1}
+    assert reopened.info()['disk_hits'] == 1
+    assert reopened.get('k') is not None
+    assert reopened.info()['memory_hits'] == 1
+
+def test_disk_tier_drops_entries_of_other_versions(tmp_path):
+    version = Version()
+    cache = SearchResultCache(max_entries=10, cache_dir=str(tmp_path), version_fn=version, version_check_interval=0)
+    cache.set('k', 1)
+
+    version.value = '2'
+    reopened = SearchResultCache(max_entries=10, cache_dir=str(tmp_path), version_fn=version,
+                                 version_check_interval=0)
+    assert reopened.get('k') is None
+    assert reopened.info()['disk_entries'] == 0
+
+def test_top_counts_labelled_requests():
+    cache = SearchResultCache(max_entries=10)
+    cache.set('a', 1, label={'query': 'dog bed'})
+    cache.set('b', 2, label={'query': 'cat tree'})
+    cache.set('c', 3)
+    cache.get('b')
+    cache.get('b')
+    cache.get('c')
+    assert cache.top() == [{'requests': 3, 'query': 'cat tree'}, {'requests': 1, 'query': 'dog bed'}]
+
+def test_disabled_cache_stores_nothing():
+    cache = SearchResultCache(max_entries=0)
+    cache.set('k', 1)
+    assert cache.get('k') is None
+    assert cache.info()['memory_entries'] == 0
+
+def test_unknown_version_bypasses_the_cache():
+    version = Version(None)
+    cache = SearchResultCache(max_entries=10, version_fn=version, version_check_interval=0)
+    cache.set('k', 1)
+    assert cache.get('k') is None
+    assert cache.info()['memory_entries'] == 0
+    assert cache.info()['index_version'] is None
+
+    version.value = '1'
+    cache.set('k', 1)
+    assert cache.get('k') == 1
+
+def test_version_read_errors_bypass_the_cache():
+    version = Version()
+    cache = SearchResultCache(max_entries=10, version_fn=version, version_check_interval=0)
+    cache.set('k', 1)
+
+    def failing():
+        raise ConnectionError('cluster unavailable')
+
+    cache.version_fn = failing
+    assert cache.get('k') is None
+    cache.version_fn = version
+    cache.set('k', 2)
+    assert cache.get('k') == 2
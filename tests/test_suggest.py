@@ -0,0 +1,87 @@
+from operator import itemgetter
+
+from suggest import PrefixIndex, SuggestionIndex, normalize_prefix
+
+PRODUCTS = [
+    {'product_id': 'P1', 'product_name': 'Memory Foam Dog Bed', 'model_number': 'DB-100', 'reviews_count': 50},
+    {'product_id': 'P2', 'product_name': 'Dog Bowl', 'model_number': 'BW-7', 'reviews_count': 500},
+    {'product_id': 'P3', 'product_name': 'Cat Tree', 'model_number': 'CT-1', 'reviews_count': 5},
+    {'product_id': 'P4', 'product_name': 'Dog Bowl', 'model_number': 'BW-8', 'reviews_count': 10}
+]
+
+class StubElasticsearch:
+    """Serves PIT pages over in-memory documents with a `timestamp` watermark"""
+
+    def __init__(self, products):
+        self.docs = {f'doc{i}': (dict(product), i) for i, product in enumerate(products)}
+
+    def update(self, doc_id, product, timestamp):
+        self.docs[doc_id] = (product, timestamp)
+
+    def open_point_in_time(self, index, keep_alive):
+        return {'id': 'pit'}
+
+    def close_point_in_time(self, id):
+        pass
+
+    def search(self, body):
+        since = body['query'].get('range', {}).get('timestamp', {}).get('gte')
+        docs = sorted(self.docs.items(), key=lambda item: item[0])
+        hits = [
+            {'_id': doc_id, '_source': source, 'fields': {'timestamp': [str(stamp)]}, 'sort': [doc_id]}
+            for doc_id, (source, stamp) in docs if since is None or stamp >= since
+        ]
+        if 'search_after' in body:
+            hits = [hit for hit in hits if hit['sort'] > body['search_after']]
+        return {'hits': {'hits': hits[:body['size']]}}
+
+def build_index(products=PRODUCTS):
+    suggestions = SuggestionIndex('products', page_size=2)
+    entries = [entry for i, product in enumerate(products)
+               for entry in suggestions._entries({'_id': f'doc{i}', '_source': product})]
+    return PrefixIndex(sorted(entries, key=itemgetter(0)))
+
+def texts(suggestions):
+    return [suggestion['text'] for suggestion in suggestions]
+
+def test_normalize_prefix():
+    assert normalize_prefix('  Dog   BED ') == 'dog bed'
+
+def test_lookup_ranks_by_weight_and_dedupes_texts():
+    # "Dog Bowl" appears twice (P2 and P4) and outranks the dog bed by reviews
+    assert texts(build_index().lookup('dog')) == ['Dog Bowl', 'Memory Foam Dog Bed']
+
+def test_lookup_matches_word_starts_of_product_names():
+    assert texts(build_index().lookup('foam')) == ['Memory Foam Dog Bed']
+    assert texts(build_index().lookup('bed')) == ['Memory Foam Dog Bed']
+    assert build_index().lookup('oam') == []
+
+def test_lookup_matches_id_prefixes_from_the_start_only():
+    suggestions = build_index().lookup('bw-')
+    assert [(s['field'], s['text']) for s in suggestions] == [('model_number', 'BW-7'), ('model_number', 'BW-8')]
+    assert build_index().lookup('100') == []
+
+def test_lookup_respects_size_and_max_scan():
+    index = build_index()
+    assert len(index.lookup('', size=10)) == 0
+    assert len(index.lookup('d', size=1)) == 1
+    # Only the first matching entry in key order ("dog bed", a word start of the dog bed) is ranked
+    assert texts(index.lookup('dog', max_scan=1)) == ['Memory Foam Dog Bed']
+
+def test_lookup_of_unknown_prefix():
+    assert build_index().lookup('zebra') == []
+
+def test_rebuild_and_refresh_from_the_watermark():
+    es = StubElasticsearch(PRODUCTS)
+    suggestions = SuggestionIndex('products', page_size=2)
+    assert suggestions.rebuild(es) == 4
+    assert suggestions.watermark == 3
+    assert texts(suggestions.suggest('Cat')) == ['Cat Tree']
+
+    es.update('doc2', {'product_id': 'P3', 'product_name': 'Cat Scratcher', 'reviews_count': 5}, 7)
+    # The range is inclusive, so the document at the old watermark is merged again too
+    assert suggestions.refresh(es) == 2
+    assert suggestions.watermark == 7
+    assert suggestions.documents == 4
+    assert texts(suggestions.suggest('cat')) == ['Cat Scratcher']
+    assert texts(suggestions.suggest('dog')) == ['Dog Bowl', 'Memory Foam Dog Bed']